@@ -0,0 +1,456 @@
+"""
+Transaction-aware delivery of WebSocket events
+Buffers inventory events per transaction, collapses them to one message
+per station and hands them, once the transaction commits, to a background
+sender so requests never wait on the channel layer
+
+Events are encoded to JSON once, before they reach the channel layer, and
+consumers forward the text to every socket as is.
+"""
+
+import asyncio
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+from collections import Counter
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.db import connection, transaction
+
+from battery import geohash
+
+try:
+    import ujson as json_encoder
+except ImportError:  # pragma: no cover
+    import json as json_encoder
+
+
+logger = logging.getLogger(__name__)
+
+
+# Legacy group of map clients that haven't subscribed to a viewport
+STATIONS_ALL_GROUP = 'stations_all'
+
+# When several events for a station are collapsed, the message keeps the
+# type (and battery/user details) of the most significant one
+EVENT_PRIORITY = {
+    'inventory_update': 0,
+    'battery_added': 1,
+    'battery_collected': 2,
+    'battery_booked': 3,
+}
+
+# Keys that always come from the newest event
+INVENTORY_KEYS = (
+    'station_name',
+    'available_batteries',
+    'booked_batteries',
+    'total_batteries',
+    'seq',
+    'timestamp',
+)
+
+# Delta keys and the absolute counts they are the change of
+DELTA_KEYS = {
+    'available_delta': 'available_batteries',
+    'booked_delta': 'booked_batteries',
+}
+
+# Sequence and delta fields of inventory events
+DELTA_FIELDS = {'seq': None, 'prev_seq': None, 'available_delta': 0, 'booked_delta': 0}
+
+# Fields sent to clients for each event type, with their defaults. Events
+# carry everything needed to collapse them; only these fields are encoded.
+CLIENT_FIELDS = {
+    'inventory_update': {
+        'station_id': None, 'station_name': None, 'available_batteries': None,
+        'booked_batteries': None, 'total_batteries': None, 'timestamp': None,
+        'action': 'update', **DELTA_FIELDS,
+    },
+    'battery_booked': {
+        'station_id': None, 'station_name': None, 'battery_id': None,
+        'available_batteries': None, 'booked_batteries': None, 'user': None,
+        'timestamp': None, **DELTA_FIELDS,
+    },
+    'battery_collected': {
+        'station_id': None, 'station_name': None, 'battery_id': None,
+        'available_batteries': None, 'booked_batteries': None, 'timestamp': None,
+        **DELTA_FIELDS,
+    },
+    'battery_added': {
+        'station_id': None, 'station_name': None, 'battery_id': None,
+        'available_batteries': None, 'total_batteries': None, 'timestamp': None,
+        **DELTA_FIELDS,
+    },
+    'station_status': {
+        'station_id': None, 'station_name': None, 'status': None,
+        'message': None, 'timestamp': None,
+    },
+    'booking_confirmed': {
+        'booking_id': None, 'station_name': None, 'battery_info': None,
+        'message': None, 'timestamp': None,
+    },
+    'booking_ready': {
+        'booking_id': None, 'station_name': None, 'message': None, 'timestamp': None,
+    },
+    'notification': {
+        'title': None, 'message': None, 'level': 'info', 'timestamp': None,
+    },
+}
+
+
+def encode_event(event):
+    """
+    Encode an event's client payload once, so the consumers of every group
+    member can forward it without serializing it again.
+
+    Args:
+        event: Channel layer event (must include 'type')
+
+    Returns:
+        dict: Channel layer message {'type': ..., 'text': <JSON payload>}
+    """
+    if 'text' in event:
+        return event
+    event_type = event['type']
+    payload = {'type': event_type}
+    for key, default in CLIENT_FIELDS[event_type].items():
+        payload[key] = event.get(key, default)
+    return {'type': event_type, 'text': json_encoder.dumps(payload)}
+
+
+class BroadcastOutbox:
+    """
+    Bounded in-process queue of channel layer sends, drained by a daemon
+    thread with its own event loop. When the queue is full new events are
+    dropped (and counted) rather than blocking the request.
+
+    Settings:
+        WEBSOCKET_OUTBOX_ENABLED: False sends inline on the calling thread
+        WEBSOCKET_OUTBOX_SIZE: Maximum queued events (default 10000)
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queue = None
+        self.pid = None
+        self.stats = Counter()
+
+    def get_queue(self):
+        with self.lock:
+            # Start (or restart after a fork) the sender thread lazily
+            if self.queue is None or self.pid != os.getpid():
+                self.queue = queue.Queue(
+                    maxsize=getattr(settings, 'WEBSOCKET_OUTBOX_SIZE', 10000)
+                )
+                self.pid = os.getpid()
+                threading.Thread(
+                    target=self.run,
+                    args=[self.queue],
+                    name='broadcast-outbox',
+                    daemon=True,
+                ).start()
+            return self.queue
+
+    def count(self, stat):
+        with self.lock:
+            self.stats[stat] += 1
+
+    def put(self, group, event):
+        """
+        Queue one group send.
+
+        Returns:
+            bool: False if the event was dropped because the queue is full
+        """
+        try:
+            self.get_queue().put_nowait((group, event))
+        except queue.Full:
+            self.count('dropped')
+            logger.warning('Broadcast outbox full, dropped %s event for %s', event.get('type'), group)
+            return False
+        self.count('enqueued')
+        return True
+
+    def run(self, events):
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        while True:
+            group, event = events.get()
+            try:
+                loop.run_until_complete(get_channel_layer().group_send(group, event))
+                self.count('sent')
+            except Exception:
+                self.count('failed')
+                logger.exception('Failed to send %s event to %s', event.get('type'), group)
+            finally:
+                events.task_done()
+
+    def join(self, timeout=None):
+        """
+        Wait until every queued event has been sent.
+
+        Returns:
+            bool: True if the queue drained before the timeout
+        """
+        events = self.queue
+        if events is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with events.all_tasks_done:
+            while events.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                events.all_tasks_done.wait(remaining)
+        return True
+
+    def get_stats(self):
+        """Queue depth and lifetime counters for this process"""
+        with self.lock:
+            stats = {
+                'queue_depth': self.queue.qsize() if self.queue else 0,
+                'queue_size': getattr(settings, 'WEBSOCKET_OUTBOX_SIZE', 10000),
+            }
+            for stat in ('enqueued', 'sent', 'dropped', 'failed'):
+                stats[stat] = self.stats[stat]
+        return stats
+
+
+outbox = BroadcastOutbox()
+
+# Give queued events a chance to go out when the process exits
+atexit.register(outbox.join, timeout=5)
+
+
+def send_to_group(group, event):
+    """Send one event to a channel layer group without blocking on it"""
+    message = encode_event(event)
+    if getattr(settings, 'WEBSOCKET_OUTBOX_ENABLED', True):
+        outbox.put(group, message)
+    else:
+        async_to_sync(get_channel_layer().group_send)(group, message)
+
+
+def merge_station_events(older, newer):
+    """
+    Collapse two inventory events for the same station into one.
+
+    Args:
+        older: Event queued first
+        newer: Event queued later
+
+    Returns:
+        dict: Event with the most significant type, the newest counts and
+        the deltas from the earliest state either event was applied on
+    """
+    if EVENT_PRIORITY.get(older['type'], 0) > EVENT_PRIORITY.get(newer['type'], 0):
+        merged = dict(older)
+        merged.update({key: newer[key] for key in INVENTORY_KEYS if key in newer})
+    else:
+        merged = dict(newer)
+
+    # Events built from the same change repeat it, so deltas are taken
+    # against the earliest base state rather than summed
+    base = min(older, newer, key=lambda event: event.get('prev_seq', 0))
+    if 'prev_seq' in base:
+        merged['prev_seq'] = base['prev_seq']
+        for delta_key, count_key in DELTA_KEYS.items():
+            merged[delta_key] = merged[count_key] - (base[count_key] - base[delta_key])
+    return merged
+
+
+def get_tile_group(tile):
+    """Channel layer group of the map clients watching a geohash tile"""
+    return f'stations_tile_{tile}'
+
+
+def get_station_tile(station):
+    """Geohash tile containing a station"""
+    return geohash.encode(
+        station.latitude,
+        station.longitude,
+        getattr(settings, 'WEBSOCKET_TILE_PRECISION', 4),
+    )
+
+
+def get_map_groups(station):
+    """
+    Get the map groups a station's events go to: the viewport tile holding
+    the station, plus 'stations_all' while legacy clients are supported.
+    """
+    groups = [get_tile_group(get_station_tile(station))]
+    if getattr(settings, 'WEBSOCKET_LEGACY_STATIONS_ALL', True):
+        groups.append(STATIONS_ALL_GROUP)
+    return groups
+
+
+class BroadcastBuffer:
+    """
+    Events queued during one transaction. Flushed by transaction.on_commit
+    and dropped with the on_commit callbacks when the transaction rolls back.
+    """
+
+    def __init__(self):
+        self.station_events = {}
+        self.map_groups = {}
+        self.group_events = []
+
+    def add_station_event(self, station, event):
+        if station.pk in self.station_events:
+            event = merge_station_events(self.station_events[station.pk], event)
+        self.station_events[station.pk] = event
+        self.map_groups[station.pk] = get_map_groups(station)
+
+    def flush(self):
+        for group, event in self.group_events:
+            send_to_group(group, event)
+        for station_id, event in self.station_events.items():
+            # Encoded once for the station group and all map groups
+            message = encode_event(event)
+            send_to_group(f'station_{station_id}', message)
+            for group in self.map_groups[station_id]:
+                map_throttle.send(group, station_id, event, message)
+
+
+_local = threading.local()
+
+
+def get_buffer():
+    """
+    Get the buffer for the current transaction, registering its flush with
+    on_commit the first time. Returns None outside a transaction.
+    """
+    if not connection.in_atomic_block:
+        return None
+
+    buffer = getattr(_local, 'buffer', None)
+    # A buffer whose callback is no longer pending belongs to a transaction
+    # that already committed or rolled back
+    if buffer is None or not any(
+        func is buffer.flush_callback for _, func, _ in connection.run_on_commit
+    ):
+        buffer = BroadcastBuffer()
+        buffer.flush_callback = buffer.flush
+        transaction.on_commit(buffer.flush_callback, robust=True)
+        _local.buffer = buffer
+    return buffer
+
+
+def queue_station_event(station, event):
+    """
+    Queue an inventory event for a station. It goes to the station's own
+    group and to its map groups (viewport tile, legacy 'stations_all').
+
+    Inside a transaction, events for the same station are collapsed and sent
+    as one message on commit; outside one the event is sent immediately.
+
+    Args:
+        station: Station model instance
+        event: Channel layer event (must include 'type')
+    """
+    buffer = get_buffer()
+    if buffer is None:
+        buffer = BroadcastBuffer()
+        buffer.add_station_event(station, event)
+        buffer.flush()
+    else:
+        buffer.add_station_event(station, event)
+
+
+def queue_group_event(group, event):
+    """
+    Queue a non-inventory event (user notifications, station status).
+    Sent on commit inside a transaction, immediately otherwise. The event
+    may already be encoded with encode_event when it goes to several groups.
+    """
+    event = encode_event(event)
+    buffer = get_buffer()
+    if buffer is None:
+        send_to_group(group, event)
+    else:
+        buffer.group_events.append((group, event))
+
+
+class MapThrottle:
+    """
+    Optional per-station rate limit for the map groups ('stations_all' and
+    viewport tiles).
+
+    With WEBSOCKET_MAP_MAX_RATE = N (messages per second per station and
+    group), bursts are collapsed so at most N messages per station go out
+    each second; the latest state is always delivered at the end of the
+    window. 0 or unset sends every message.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.last_sent = {}
+        self.pending = {}
+        self.pruned_at = float('-inf')
+
+    def get_interval(self):
+        rate = getattr(settings, 'WEBSOCKET_MAP_MAX_RATE', 0)
+        return 1 / rate if rate else 0
+
+    def send(self, group, station_id, event, message=None):
+        """
+        Args:
+            group: Map group
+            station_id: Station the event is about
+            event: Unencoded event, kept for collapsing delayed sends
+            message: The event already encoded with encode_event (optional)
+        """
+        message = message or encode_event(event)
+        interval = self.get_interval()
+        if not interval:
+            send_to_group(group, message)
+            return
+
+        key = (group, station_id)
+        with self.lock:
+            now = time.monotonic()
+            self.prune(now, interval)
+            if key in self.pending:
+                # A trailing send is already scheduled; just update it
+                self.pending[key] = merge_station_events(self.pending[key], event)
+                return
+
+            wait = self.last_sent.get(key, float('-inf')) + interval - now
+            if wait > 0:
+                self.pending[key] = event
+                timer = threading.Timer(wait, self.send_pending, args=[group, station_id])
+                timer.daemon = True
+                timer.start()
+                return
+            self.last_sent[key] = now
+
+        send_to_group(group, message)
+
+    def prune(self, now, interval):
+        """
+        Forget sends older than the interval (they no longer delay
+        anything), at most once per interval. Call with the lock held.
+        """
+        if now - self.pruned_at < interval:
+            return
+        self.pruned_at = now
+        self.last_sent = {
+            key: sent for key, sent in self.last_sent.items() if now - sent < interval
+        }
+
+    def send_pending(self, group, station_id):
+        key = (group, station_id)
+        with self.lock:
+            event = self.pending.pop(key, None)
+            self.last_sent[key] = time.monotonic()
+        if event is not None:
+            send_to_group(group, event)
+
+
+map_throttle = MapThrottle()
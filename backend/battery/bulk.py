@@ -0,0 +1,200 @@
+"""
+Bulk station inventory loading
+Reads (station, battery) pairs from a JSON body or a CSV/NDJSON stream and
+adds them to station inventories with one bulk insert and one broadcast
+per station.
+"""
+
+import codecs
+import csv
+import json
+from collections import defaultdict
+
+from battery.inventory import update_compatible_stations, update_station_counters
+from battery.models import Station
+from battery.websocket_utils import broadcast_inventory_update
+
+
+# Most (station, battery) pairs accepted in one request
+MAX_BULK_ITEMS = 10000
+
+CSV_CONTENT_TYPES = ('text/csv',)
+NDJSON_CONTENT_TYPES = ('application/x-ndjson', 'application/ndjson')
+
+
+class BulkInventoryError(ValueError):
+    """Malformed or oversized bulk inventory request"""
+
+
+def _parse_item(station, battery, where):
+    try:
+        return int(station), int(battery)
+    except (TypeError, ValueError):
+        raise BulkInventoryError(f'{where}: station and battery must be integers')
+
+
+class _ItemReader:
+    """Collects items, enforcing MAX_BULK_ITEMS as they are read"""
+
+    def __init__(self, default_station):
+        self.default_station = default_station
+        self.items = []
+
+    def add(self, station, battery, where):
+        if len(self.items) >= MAX_BULK_ITEMS:
+            raise BulkInventoryError(f'At most {MAX_BULK_ITEMS} batteries per request')
+        if station in (None, ''):
+            station = self.default_station
+        self.items.append(_parse_item(station, battery, where))
+
+
+def _iter_lines(stream):
+    """Decoded lines of a request body, read incrementally"""
+    return codecs.iterdecode(iter(stream.readline, b''), 'utf-8-sig')
+
+
+def read_csv_items(stream, default_station=None):
+    """
+    Read a CSV body with a header row naming 'battery' and, unless a
+    default station is given, 'station' columns.
+
+    Returns:
+        list: (station_id, battery_id) tuples
+    """
+    reader = _ItemReader(default_station)
+    try:
+        rows = csv.DictReader(_iter_lines(stream))
+        if 'battery' not in (rows.fieldnames or []):
+            raise BulkInventoryError('CSV needs a header row with a battery column')
+        for row in rows:
+            reader.add(row.get('station'), row['battery'], f'Line {rows.line_num}')
+    except (csv.Error, UnicodeDecodeError) as e:
+        raise BulkInventoryError(f'Invalid CSV: {e}')
+    return reader.items
+
+
+def read_ndjson_items(stream, default_station=None):
+    """
+    Read an NDJSON body, one {"station": ..., "battery": ...} object per line.
+
+    Returns:
+        list: (station_id, battery_id) tuples
+    """
+    reader = _ItemReader(default_station)
+    try:
+        for number, line in enumerate(_iter_lines(stream), start=1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not isinstance(item, dict):
+                raise BulkInventoryError(f'Line {number}: expected a JSON object')
+            reader.add(item.get('station'), item.get('battery'), f'Line {number}')
+    except BulkInventoryError:
+        raise
+    except (ValueError, UnicodeDecodeError) as e:
+        raise BulkInventoryError(f'Invalid NDJSON: {e}')
+    return reader.items
+
+
+def read_json_items(data, default_station=None):
+    """
+    Read a parsed JSON body, either
+    {"batteries": [...]} for the default station (or with "station"), or
+    {"items": [{"station": ..., "battery": ...}, ...]}.
+
+    Returns:
+        list: (station_id, battery_id) tuples
+    """
+    if not isinstance(data, dict):
+        raise BulkInventoryError('Expected a JSON object')
+    reader = _ItemReader(data.get('station', default_station))
+    if isinstance(data.get('items'), list):
+        for number, item in enumerate(data['items'], start=1):
+            if not isinstance(item, dict):
+                raise BulkInventoryError(f'Item {number}: expected an object')
+            reader.add(item.get('station'), item.get('battery'), f'Item {number}')
+    elif isinstance(data.get('batteries'), list):
+        for number, battery in enumerate(data['batteries'], start=1):
+            reader.add(None, battery, f'Battery {number}')
+    else:
+        raise BulkInventoryError('Expected a batteries or items list')
+    return reader.items
+
+
+def read_inventory_items(request, default_station=None):
+    """
+    Read the (station, battery) pairs of a bulk request, by content type.
+    CSV and NDJSON bodies are streamed rather than loaded whole.
+
+    Args:
+        request: DRF request
+        default_station: Station pk for items that don't name one
+
+    Returns:
+        list: (station_id, battery_id) tuples
+
+    Raises:
+        BulkInventoryError: For malformed or oversized input
+    """
+    content_type = (request.content_type or '').split(';')[0].strip()
+    if content_type in CSV_CONTENT_TYPES:
+        return read_csv_items(request.stream, default_station)
+    if content_type in NDJSON_CONTENT_TYPES:
+        return read_ndjson_items(request.stream, default_station)
+    return read_json_items(request.data, default_station)
+
+
+def add_station_batteries(batteries_by_station):
+    """
+    Add batteries to station inventories with one bulk insert.
+
+    Must run inside a transaction. Batteries already at a station are
+    skipped.
+
+    Args:
+        batteries_by_station: {Station instance: iterable of battery pks}
+
+    Returns:
+        dict: {station pk: list of battery pks added}
+    """
+    through = Station.batteries.through
+    requested = {
+        (station.pk, battery_id)
+        for station, battery_ids in batteries_by_station.items()
+        for battery_id in battery_ids
+    }
+    station_ids = {station_id for station_id, _ in requested}
+    # Lock the stations first: other inventory changes update their rows,
+    # so none can add a pair between this read and the insert (an insert
+    # skipped by ON CONFLICT would still be counted)
+    list(
+        Station.objects.select_for_update().filter(pk__in=station_ids)
+        .order_by('pk').values_list('pk', flat=True)
+    )
+    existing = set(
+        through.objects.filter(
+            station_id__in=station_ids,
+            battery_id__in={battery_id for _, battery_id in requested},
+        ).values_list('station_id', 'battery_id')
+    )
+    new_pairs = sorted(requested - existing)
+    through.objects.bulk_create(
+        [through(station_id=station_id, battery_id=battery_id) for station_id, battery_id in new_pairs],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+    added = defaultdict(list)
+    for station_id, battery_id in new_pairs:
+        added[station_id].append(battery_id)
+
+    # bulk_create skips m2m_changed, so keep the counters, index and
+    # broadcast in step as the Station.batteries handler would
+    for station in batteries_by_station:
+        if added.get(station.pk):
+            pairs = [(station.pk, battery_id) for battery_id in added[station.pk]]
+            update_station_counters(through, pairs, 1, station=station)
+            broadcast_inventory_update(station, action='add')
+    update_compatible_stations(new_pairs, 1)
+
+    return dict(added)
@@ -4,23 +4,77 @@ Handles real-time updates for station inventory
 """
 
 import json
+from urllib.parse import parse_qs
+
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
+from django.conf import settings
 from django.contrib.auth import get_user_model
 
+from battery import geohash
+from battery.broadcast import STATIONS_ALL_GROUP, get_tile_group
+from battery.models import Station
+from battery.utils import get_viewport_filter
+from battery.websocket_utils import get_inventory_snapshot
+
 User = get_user_model()
 
 
+def get_viewport_tiles(south, west, north, east):
+    """
+    Get the map tiles covering a viewport.
+
+    Raises:
+        ValueError: If the viewport is invalid or covers too many tiles
+    """
+    return geohash.tiles_for_viewport(
+        south,
+        west,
+        north,
+        east,
+        precision=getattr(settings, 'WEBSOCKET_TILE_PRECISION', 4),
+        max_tiles=getattr(settings, 'WEBSOCKET_MAX_VIEWPORT_TILES', 64),
+    )
+
+
+def parse_station_ids(value):
+    """
+    Parse a list of station IDs from a query string value or message.
+
+    Raises:
+        ValueError: If an ID is not an integer
+    """
+    if isinstance(value, str):
+        value = [item for item in value.split(',') if item]
+    if not isinstance(value, list):
+        raise ValueError('station_ids must be a list')
+    return [int(item) for item in value]
+
+
 class StationInventoryConsumer(AsyncWebsocketConsumer):
     """
     WebSocket consumer for real-time station inventory updates.
     
-    Clients can subscribe to updates for specific stations or all stations.
+    Clients can subscribe to updates for a specific station, for the map
+    tiles covering their viewport, or (legacy) for all stations.
     Updates are sent when:
     - Battery is added to a station
     - Battery is booked from a station
     - Battery is collected from a station
     - Station inventory changes
+    
+    Map clients pick their viewport with ``?viewport=south,west,north,east``
+    on connect, or by sending ``{"type": "subscribe_viewport", "viewport":
+    {"south": ..., "west": ..., "north": ..., "east": ...}}`` whenever the
+    map moves.
+    
+    After connecting (and after each viewport change) the client gets a
+    snapshot of current counts: for the station, the viewport, or the
+    stations listed in ``?stations=1,2,3``. Inventory messages then carry
+    per-station ``seq``/``prev_seq`` numbers; a client that sees a gap
+    sends ``{"type": "resync"}`` to get a fresh snapshot. A snapshot with
+    ``truncated`` set is continued with ``{"type": "resync", "after":
+    <next>}``.
     """
 
     async def connect(self):
@@ -30,20 +84,37 @@ class StationInventoryConsumer(AsyncWebsocketConsumer):
         """
         # Get station_id from URL route (optional - for specific station updates)
         self.station_id = self.scope['url_route']['kwargs'].get('station_id')
+        self.subscribed_groups = set()
+        self.tiles = []
+        self.viewport = None
+        self.station_ids = []
+        query = parse_qs(self.scope.get('query_string', b'').decode())
         
         # Create group name
         if self.station_id:
             # Subscribe to specific station updates
             self.group_name = f'station_{self.station_id}'
         else:
-            # Subscribe to all station updates
-            self.group_name = 'stations_all'
+            # Subscribe to the viewport's map tiles, or all station updates
+            self.group_name = STATIONS_ALL_GROUP
+            viewport = query.get('viewport')
+            if viewport:
+                try:
+                    south, west, north, east = map(float, viewport[0].split(','))
+                    self.tiles = get_viewport_tiles(south, west, north, east)
+                    self.viewport = (south, west, north, east)
+                except ValueError:
+                    self.tiles = []
+            try:
+                self.station_ids = parse_station_ids(query.get('stations', [''])[0])
+            except ValueError:
+                self.station_ids = []
         
-        # Add this channel to the group
-        await self.channel_layer.group_add(
-            self.group_name,
-            self.channel_name
-        )
+        # Add this channel to the group(s)
+        if self.tiles:
+            await self.set_groups({get_tile_group(tile) for tile in self.tiles})
+        else:
+            await self.set_groups({self.group_name})
         
         # Accept the WebSocket connection
         await self.accept()
@@ -51,25 +122,124 @@ class StationInventoryConsumer(AsyncWebsocketConsumer):
         # Send connection confirmation
         await self.send(text_data=json.dumps({
             'type': 'connection_established',
-            'message': f'Connected to {self.group_name}',
-            'station_id': self.station_id
+            'message': (
+                f'Connected to {len(self.tiles)} map tiles' if self.tiles
+                else f'Connected to {self.group_name}'
+            ),
+            'station_id': self.station_id,
+            'tiles': self.tiles,
         }))
+        
+        # Groups are joined first, so no update falls between the snapshot
+        # and the first delta
+        await self.send_snapshot()
 
     async def disconnect(self, close_code):
         """
         Handle WebSocket disconnection.
         Remove from groups.
         """
-        # Leave the group
-        await self.channel_layer.group_discard(
-            self.group_name,
-            self.channel_name
+        # Leave the groups
+        await self.set_groups(set())
+
+    async def set_groups(self, groups):
+        """Move this channel from its current groups to the given ones"""
+        for group in self.subscribed_groups - groups:
+            await self.channel_layer.group_discard(group, self.channel_name)
+        for group in groups - self.subscribed_groups:
+            await self.channel_layer.group_add(group, self.channel_name)
+        self.subscribed_groups = set(groups)
+
+    async def subscribe_viewport(self, viewport):
+        """
+        Replace the current map subscription with the tiles covering a
+        viewport. Leaves 'stations_all' once a viewport is set.
+        """
+        if self.station_id:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': 'Station subscriptions cannot change viewport'
+            }))
+            return
+        
+        try:
+            tiles = get_viewport_tiles(
+                float(viewport['south']),
+                float(viewport['west']),
+                float(viewport['north']),
+                float(viewport['east']),
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            await self.send(text_data=json.dumps({
+                'type': 'error',
+                'message': f'Invalid viewport: {e}'
+            }))
+            return
+        
+        self.tiles = tiles
+        self.viewport = (
+            float(viewport['south']),
+            float(viewport['west']),
+            float(viewport['north']),
+            float(viewport['east']),
         )
+        await self.set_groups({get_tile_group(tile) for tile in tiles})
+        await self.send(text_data=json.dumps({
+            'type': 'viewport_subscribed',
+            'tiles': tiles
+        }))
+        await self.send_snapshot()
+
+    @database_sync_to_async
+    def get_snapshot(self, station_ids=None, after=None):
+        """
+        Read current counts for the subscribed stations in one query, at
+        most WEBSOCKET_MAX_SNAPSHOT_STATIONS of them from after onwards.
+        Returns None when there is nothing to snapshot (all-stations
+        subscription without a station list).
+        
+        Returns:
+            tuple: (stations, pk to resync after for the next page, or
+            None when this is the last page)
+        """
+        station_ids = station_ids or self.station_ids
+        if self.station_id:
+            stations = Station.objects.filter(pk=self.station_id)
+        elif station_ids:
+            stations = Station.objects.filter(pk__in=station_ids)
+        elif self.viewport:
+            stations = Station.objects.filter(get_viewport_filter(*self.viewport))
+        else:
+            return None
+        limit = getattr(settings, 'WEBSOCKET_MAX_SNAPSHOT_STATIONS', 500)
+        # One extra row tells whether another page follows
+        rows = get_inventory_snapshot(stations, limit=limit + 1, after=after)
+        if len(rows) > limit:
+            rows = rows[:limit]
+            return rows, rows[-1]['station_id']
+        return rows, None
+
+    async def send_snapshot(self, station_ids=None, after=None):
+        """
+        Send current counts; following deltas apply on top of them.
+        A snapshot cut off at the size limit says so with truncated and
+        the next pk to resync after.
+        """
+        snapshot = await self.get_snapshot(station_ids, after)
+        if snapshot is None:
+            return
+        stations, next_after = snapshot
+        await self.send(text_data=json.dumps({
+            'type': 'snapshot',
+            'stations': stations,
+            'truncated': next_after is not None,
+            'next': next_after,
+        }))
 
     async def receive(self, text_data):
         """
         Handle messages received from WebSocket.
-        Currently not used, but can be extended for client requests.
+        Supports ping, viewport subscription changes and resync.
         """
         try:
             data = json.loads(text_data)
@@ -81,6 +251,20 @@ class StationInventoryConsumer(AsyncWebsocketConsumer):
                     'type': 'pong',
                     'timestamp': data.get('timestamp')
                 }))
+            elif message_type == 'subscribe_viewport':
+                await self.subscribe_viewport(data.get('viewport') or {})
+            elif message_type == 'resync':
+                try:
+                    station_ids = parse_station_ids(data.get('station_ids') or [])
+                    after = data.get('after')
+                    after = int(after) if after is not None else None
+                except (TypeError, ValueError) as e:
+                    await self.send(text_data=json.dumps({
+                        'type': 'error',
+                        'message': f'Invalid station_ids or after: {e}'
+                    }))
+                    return
+                await self.send_snapshot(station_ids, after)
             else:
                 # Echo back for now
                 await self.send(text_data=json.dumps({
@@ -93,83 +277,43 @@ class StationInventoryConsumer(AsyncWebsocketConsumer):
                 'message': 'Invalid JSON'
             }))
 
-    # Handler methods for different event types
+    # Handler methods for different event types. Payloads are encoded once
+    # when broadcast (see battery/broadcast.py) and forwarded as is.
     
     async def inventory_update(self, event):
         """
         Handle inventory update events from channel layer.
         Send the update to the WebSocket client.
         """
-        await self.send(text_data=json.dumps({
-            'type': 'inventory_update',
-            'station_id': event['station_id'],
-            'station_name': event.get('station_name'),
-            'available_batteries': event['available_batteries'],
-            'booked_batteries': event['booked_batteries'],
-            'total_batteries': event['total_batteries'],
-            'timestamp': event.get('timestamp'),
-            'action': event.get('action', 'update')
-        }))
+        await self.send(text_data=event['text'])
 
     async def battery_booked(self, event):
         """
         Handle battery booked events.
         Notify clients when a battery is booked.
         """
-        await self.send(text_data=json.dumps({
-            'type': 'battery_booked',
-            'station_id': event['station_id'],
-            'station_name': event.get('station_name'),
-            'battery_id': event.get('battery_id'),
-            'available_batteries': event['available_batteries'],
-            'booked_batteries': event['booked_batteries'],
-            'user': event.get('user'),
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send(text_data=event['text'])
 
     async def battery_collected(self, event):
         """
         Handle battery collected events.
         Notify clients when a battery is collected.
         """
-        await self.send(text_data=json.dumps({
-            'type': 'battery_collected',
-            'station_id': event['station_id'],
-            'station_name': event.get('station_name'),
-            'battery_id': event.get('battery_id'),
-            'available_batteries': event['available_batteries'],
-            'booked_batteries': event['booked_batteries'],
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send(text_data=event['text'])
 
     async def battery_added(self, event):
         """
         Handle battery added events.
         Notify clients when a battery is added to a station.
         """
-        await self.send(text_data=json.dumps({
-            'type': 'battery_added',
-            'station_id': event['station_id'],
-            'station_name': event.get('station_name'),
-            'battery_id': event.get('battery_id'),
-            'available_batteries': event['available_batteries'],
-            'total_batteries': event['total_batteries'],
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send(text_data=event['text'])
 
     async def station_status(self, event):
         """
         Handle station status events.
         Notify clients about station operational status changes.
         """
-        await self.send(text_data=json.dumps({
-            'type': 'station_status',
-            'station_id': event['station_id'],
-            'station_name': event.get('station_name'),
-            'status': event['status'],
-            'message': event.get('message'),
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send(text_data=event['text'])
 
 
 class UserNotificationConsumer(AsyncWebsocketConsumer):
@@ -242,36 +386,17 @@ class UserNotificationConsumer(AsyncWebsocketConsumer):
         """
         Notify user that their booking is confirmed.
         """
-        await self.send(text_data=json.dumps({
-            'type': 'booking_confirmed',
-            'booking_id': event['booking_id'],
-            'station_name': event.get('station_name'),
-            'battery_info': event.get('battery_info'),
-            'message': event.get('message'),
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send(text_data=event['text'])
 
     async def booking_ready(self, event):
         """
         Notify user that their battery is ready for collection.
         """
-        await self.send(text_data=json.dumps({
-            'type': 'booking_ready',
-            'booking_id': event['booking_id'],
-            'station_name': event.get('station_name'),
-            'message': event.get('message'),
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send(text_data=event['text'])
 
     async def notification(self, event):
         """
         Send general notification to user.
         """
-        await self.send(text_data=json.dumps({
-            'type': 'notification',
-            'title': event.get('title'),
-            'message': event['message'],
-            'level': event.get('level', 'info'),
-            'timestamp': event.get('timestamp')
-        }))
+        await self.send(text_data=event['text'])
 
@@ -0,0 +1,115 @@
+"""
+Geohash helpers for map tile subscriptions
+Stations are grouped into geohash cells so WebSocket clients only receive
+updates for the part of the map they are looking at
+"""
+
+from math import floor
+
+BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def encode(latitude, longitude, precision):
+    """
+    Encode a point as a geohash.
+
+    Args:
+        latitude: Latitude in degrees
+        longitude: Longitude in degrees
+        precision: Number of characters
+
+    Returns:
+        str: Geohash of the cell containing the point
+    """
+    lat_range = [-90.0, 90.0]
+    lng_range = [-180.0, 180.0]
+    chars = []
+    bit = 0
+    value = 0
+    even = True  # geohash bits alternate, starting with longitude
+
+    while len(chars) < precision:
+        if even:
+            mid = (lng_range[0] + lng_range[1]) / 2
+            if longitude >= mid:
+                value = value << 1 | 1
+                lng_range[0] = mid
+            else:
+                value <<= 1
+                lng_range[1] = mid
+        else:
+            mid = (lat_range[0] + lat_range[1]) / 2
+            if latitude >= mid:
+                value = value << 1 | 1
+                lat_range[0] = mid
+            else:
+                value <<= 1
+                lat_range[1] = mid
+        even = not even
+
+        bit += 1
+        if bit == 5:
+            chars.append(BASE32[value])
+            bit = 0
+            value = 0
+
+    return ''.join(chars)
+
+
+def cell_size(precision):
+    """
+    Get the size of a geohash cell.
+
+    Returns:
+        tuple: (height, width) in degrees
+    """
+    bits = 5 * precision
+    lat_bits = bits // 2
+    lng_bits = bits - lat_bits
+    return 180 / 2 ** lat_bits, 360 / 2 ** lng_bits
+
+
+def _cell_centres(start, end, size, origin):
+    first = floor((start - origin) / size)
+    last = floor((end - origin) / size)
+    return [origin + (i + 0.5) * size for i in range(first, last + 1)]
+
+
+def tiles_for_viewport(south, west, north, east, precision, max_tiles):
+    """
+    Get the geohash cells covering a map viewport.
+
+    Args:
+        south, west, north, east: Viewport bounds in degrees
+            (west > east means the viewport crosses the antimeridian)
+        precision: Geohash precision of the tiles
+        max_tiles: Upper bound on the number of tiles
+
+    Returns:
+        list: Geohashes of the covering cells
+
+    Raises:
+        ValueError: If the bounds are invalid or need more than max_tiles
+    """
+    if not (-90 <= south <= north <= 90) or not (-180 <= west <= 180 and -180 <= east <= 180):
+        raise ValueError('Invalid viewport bounds')
+
+    height, width = cell_size(precision)
+    lat_centres = _cell_centres(south, min(north, 90 - height / 2), height, -90)
+
+    if west <= east:
+        lng_spans = [(west, east)]
+    else:
+        lng_spans = [(west, 180 - width / 2), (-180, east)]
+    lng_centres = []
+    for start, end in lng_spans:
+        lng_centres += _cell_centres(start, min(end, 180 - width / 2), width, -180)
+
+    if len(lat_centres) * len(lng_centres) > max_tiles:
+        raise ValueError(f'Viewport too large: more than {max_tiles} tiles')
+
+    return sorted({
+        encode(lat, lng, precision)
+        for lat in lat_centres
+        for lng in lng_centres
+    })
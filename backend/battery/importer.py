@@ -0,0 +1,305 @@
+"""
+Partner network import
+Streams CSV or JSONL files of companies, vehicles, batteries, stations and
+station inventory into the database in fixed-size chunks. Records are
+matched on external_id and upserted, so re-running a chunk is harmless.
+
+Columns (CSV header or JSONL keys) per kind:
+    companies: external_id, name
+    vehicles:  external_id, name
+    batteries: external_id, company, vehicle, price
+    stations:  external_id, name, latitude, longitude, owner (optional;
+               a re-imported station without one keeps its owner)
+    inventory: station, battery
+
+company, vehicle, station and battery are external IDs; owner is the
+email of a producer account.
+"""
+
+import csv
+import itertools
+import json
+import os
+
+from django.db import transaction
+
+from battery.bulk import add_station_batteries
+from battery.inventory import rebuild_compatible_stations
+from battery.models import Battery, Station, Vehicle
+from batteryswap.response_cache import invalidate_cached_responses
+from producer.models import Company, Producer
+
+
+# Files are imported in this order, so references point backwards
+IMPORT_KINDS = ('companies', 'vehicles', 'batteries', 'stations', 'inventory')
+
+
+class ImportRowError(ValueError):
+    """A row that can't be imported"""
+
+    def __init__(self, line, message):
+        super().__init__(f'line {line}: {message}')
+        self.line = line
+
+
+def read_rows(path):
+    """
+    Read a .csv or .jsonl/.ndjson file lazily.
+
+    Yields:
+        tuple: (line number, row dict)
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        if extension == '.csv':
+            rows = csv.DictReader(f)
+            for row in rows:
+                yield rows.line_num, row
+        elif extension in ('.jsonl', '.ndjson'):
+            for number, line in enumerate(f, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    row = json.loads(line)
+                except ValueError as e:
+                    raise ImportRowError(number, f'invalid JSON ({e})')
+                if not isinstance(row, dict):
+                    raise ImportRowError(number, 'expected a JSON object')
+                yield number, row
+        else:
+            raise ValueError(f'{path}: expected a .csv or .jsonl file')
+
+
+def iter_chunks(rows, size):
+    """Split an iterator into lists of at most size items"""
+    while True:
+        chunk = list(itertools.islice(rows, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _text(line, row, field, required=True):
+    value = row.get(field)
+    value = str(value).strip() if value is not None else ''
+    if required and not value:
+        raise ImportRowError(line, f'{field} is required')
+    return value or None
+
+
+def _number(line, row, field):
+    try:
+        return float(row.get(field))
+    except (TypeError, ValueError):
+        raise ImportRowError(line, f'{field} must be a number')
+
+
+def parse_row(kind, line, row):
+    """
+    Validate one row.
+
+    Returns:
+        dict: Cleaned values, references still as external IDs
+
+    Raises:
+        ImportRowError: For a missing or malformed value
+    """
+    if kind in ('companies', 'vehicles'):
+        return {'external_id': _text(line, row, 'external_id'), 'name': _text(line, row, 'name')}
+    if kind == 'batteries':
+        return {
+            'external_id': _text(line, row, 'external_id'),
+            'company': _text(line, row, 'company'),
+            'vehicle': _text(line, row, 'vehicle'),
+            'price': _number(line, row, 'price'),
+        }
+    if kind == 'stations':
+        latitude = _number(line, row, 'latitude')
+        longitude = _number(line, row, 'longitude')
+        if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+            raise ImportRowError(line, 'latitude/longitude out of range')
+        return {
+            'external_id': _text(line, row, 'external_id'),
+            'name': _text(line, row, 'name'),
+            'latitude': latitude,
+            'longitude': longitude,
+            'owner': _text(line, row, 'owner', required=False),
+        }
+    return {'station': _text(line, row, 'station'), 'battery': _text(line, row, 'battery')}
+
+
+def get_pks(model, external_ids):
+    """{external_id: pk} for the given external IDs, in one query"""
+    return dict(
+        model.objects.filter(external_id__in=set(external_ids)).values_list('external_id', 'pk')
+    )
+
+
+def get_producer_pks(emails):
+    """{email: producer pk} for producer accounts, in one query"""
+    return dict(
+        Producer.objects.filter(user__email__in=set(emails)).values_list('user__email', 'pk')
+    )
+
+
+# References of each kind: field -> (model, kind imported earlier in the run)
+REFERENCES = {
+    'batteries': {'company': (Company, 'companies'), 'vehicle': (Vehicle, 'vehicles')},
+    'inventory': {'station': (Station, 'stations'), 'battery': (Battery, 'batteries')},
+}
+
+
+def resolve_references(kind, rows, seen=None):
+    """
+    Map the external IDs a chunk refers to onto primary keys.
+
+    Args:
+        kind: Kind of the chunk
+        rows: (line, cleaned row) pairs
+        seen: {kind: set of external IDs} imported earlier in a dry run,
+            accepted although they aren't in the database
+
+    Returns:
+        dict: {field: {external_id: pk}}
+
+    Raises:
+        ImportRowError: For the first reference that can't be resolved
+    """
+    resolved = {}
+    if kind == 'stations':
+        owners = [row['owner'] for _, row in rows if row['owner']]
+        resolved['owner'] = get_producer_pks(owners)
+        for line, row in rows:
+            if row['owner'] and row['owner'] not in resolved['owner']:
+                raise ImportRowError(line, f'no producer with email {row["owner"]}')
+
+    for field, (model, target_kind) in REFERENCES.get(kind, {}).items():
+        resolved[field] = get_pks(model, [row[field] for _, row in rows])
+        known = seen.get(target_kind, set()) if seen is not None else set()
+        for line, row in rows:
+            if row[field] not in resolved[field] and row[field] not in known:
+                raise ImportRowError(line, f'unknown {field} {row[field]}')
+    return resolved
+
+
+def write_chunk(kind, rows, resolved):
+    """
+    Upsert one validated chunk. Must run inside a transaction.
+
+    Returns:
+        int: Rows written (for inventory, batteries newly stocked)
+    """
+    values = [row for _, row in rows]
+    if kind == 'companies':
+        objects = [Company(**row) for row in values]
+        return _upsert(Company, objects, ['name'])
+    if kind == 'vehicles':
+        objects = [Vehicle(**row) for row in values]
+        return _upsert(Vehicle, objects, ['name'])
+    if kind == 'batteries':
+        objects = [
+            Battery(
+                external_id=row['external_id'],
+                company_id=resolved['company'][row['company']],
+                vehicle_id=resolved['vehicle'][row['vehicle']],
+                price=row['price'],
+            )
+            for row in values
+        ]
+        written = _upsert(Battery, objects, ['company', 'vehicle', 'price'])
+        # Upserts skip post_save, so re-index stations stocking a battery
+        # whose vehicle may have changed
+        station_ids = set(
+            Station.batteries.through.objects.filter(
+                battery__external_id__in=[row['external_id'] for row in values]
+            ).values_list('station_id', flat=True)
+        )
+        if station_ids:
+            rebuild_compatible_stations(station_ids)
+        return written
+    if kind == 'stations':
+        objects = [
+            Station(
+                external_id=row['external_id'],
+                name=row['name'],
+                latitude=row['latitude'],
+                longitude=row['longitude'],
+                owner_id=resolved['owner'].get(row['owner']),
+            )
+            for row in values
+        ]
+        # A row without an owner keeps the owner a station already has
+        objects = _dedupe(objects)
+        fields = ['name', 'latitude', 'longitude']
+        return (
+            _upsert(Station, [obj for obj in objects if obj.owner_id], fields + ['owner'])
+            + _upsert(Station, [obj for obj in objects if not obj.owner_id], fields)
+        )
+
+    stations = Station.objects.in_bulk(set(resolved['station'].values()))
+    batteries_by_station = {}
+    for row in values:
+        station = stations[resolved['station'][row['station']]]
+        batteries_by_station.setdefault(station, []).append(resolved['battery'][row['battery']])
+    added = add_station_batteries(batteries_by_station)
+    return sum(len(battery_ids) for battery_ids in added.values())
+
+
+def _dedupe(objects):
+    # One row per external_id (the last wins); an upsert can't touch a
+    # row twice
+    return list({obj.external_id: obj for obj in objects}.values())
+
+
+def _upsert(model, objects, update_fields):
+    objects = _dedupe(objects)
+    if not objects:
+        return 0
+    model.objects.bulk_create(
+        objects,
+        update_conflicts=True,
+        unique_fields=['external_id'],
+        update_fields=update_fields,
+    )
+    # bulk_create skips post_save, so retire cached responses here
+    invalidate_cached_responses(model)
+    return len(objects)
+
+
+def import_file(kind, path, chunk_size=1000, skip_rows=0, dry_run=False, seen=None,
+                on_chunk=None):
+    """
+    Import one file chunk by chunk, each chunk in its own transaction.
+
+    Args:
+        kind: One of IMPORT_KINDS
+        path: .csv or .jsonl file
+        chunk_size: Rows per chunk (and per transaction)
+        skip_rows: Rows already imported (from a checkpoint)
+        dry_run: Validate only; nothing is written
+        seen: {kind: set of external IDs} shared across a dry run, so later
+            files may refer to records that would have been imported
+        on_chunk: Called with the number of rows done after each chunk
+
+    Returns:
+        int: Rows processed, including skipped ones
+
+    Raises:
+        ImportRowError: For the first invalid row; earlier chunks stay
+        committed
+    """
+    done = skip_rows
+    rows = itertools.islice(read_rows(path), skip_rows, None)
+    for chunk in iter_chunks(rows, chunk_size):
+        cleaned = [(line, parse_row(kind, line, row)) for line, row in chunk]
+        resolved = resolve_references(kind, cleaned, seen if dry_run else None)
+        if dry_run:
+            if seen is not None and kind != 'inventory':
+                seen.setdefault(kind, set()).update(row['external_id'] for _, row in cleaned)
+        else:
+            with transaction.atomic():
+                write_chunk(kind, cleaned, resolved)
+        done += len(chunk)
+        if on_chunk:
+            on_chunk(done)
+    return done
@@ -0,0 +1,297 @@
+"""
+Denormalized station inventory
+Keeps derived inventory data in step with the Station battery M2M tables
+"""
+
+from collections import Counter
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from battery.models import Battery, CompatibleStation, Station
+
+
+# Station counter field for each inventory M2M
+COUNTER_FIELDS = {
+    Station.batteries.through: "available_battery_count",
+    Station.booked_batteries.through: "booked_battery_count",
+}
+
+# Station fields describing its inventory at one point in the sequence
+INVENTORY_FIELDS = [*COUNTER_FIELDS.values(), "inventory_seq"]
+
+
+def get_changed_pairs(instance, reverse, pk_set):
+    """
+    Get the (station_id, battery_id) pairs named by an m2m_changed event.
+
+    Args:
+        instance: Station (forward) or Battery (reverse) instance
+        reverse: True when the change was made from the Battery side
+        pk_set: Primary keys of the other side of the relation
+
+    Returns:
+        list: (station_id, battery_id) tuples
+    """
+    if reverse:
+        return [(station_id, instance.pk) for station_id in pk_set]
+    return [(instance.pk, battery_id) for battery_id in pk_set]
+
+
+def get_existing_pairs(through, instance, reverse, pk_set=None):
+    """
+    Get the (station_id, battery_id) pairs currently stored in a through
+    table for an instance. Used on pre_remove/pre_clear, where Django's
+    pk_set may name rows that do not exist.
+
+    Args:
+        through: Station.batteries.through or Station.booked_batteries.through
+        instance: Station (forward) or Battery (reverse) instance
+        reverse: True when the change was made from the Battery side
+        pk_set: Limit to these primary keys (None for all, as on clear)
+
+    Returns:
+        list: (station_id, battery_id) tuples
+    """
+    own, other = ("battery_id", "station_id") if reverse else ("station_id", "battery_id")
+    rows = through.objects.filter(**{own: instance.pk})
+    if pk_set is not None:
+        rows = rows.filter(**{f"{other}__in": pk_set})
+    return list(rows.values_list("station_id", "battery_id"))
+
+
+def update_station_counters(through, pairs, sign, station=None):
+    """
+    Apply battery additions/removals to the denormalized Station counters.
+
+    Args:
+        through: Through model of the M2M that changed
+        pairs: (station_id, battery_id) tuples added or removed
+        sign: 1 for added batteries, -1 for removed ones
+        station: Station instance to refresh in place (forward changes).
+            Its state before the change is kept in station.inventory_before
+            for the delta broadcast.
+    """
+    counter = COUNTER_FIELDS[through]
+    deltas = Counter(station_id for station_id, _ in pairs)
+    for station_id, delta in deltas.items():
+        Station.objects.filter(pk=station_id).update(
+            **{counter: F(counter) + sign * delta, "inventory_seq": F("inventory_seq") + 1}
+        )
+
+    if station is not None and station.pk in deltas:
+        # Row is locked by our UPDATE, so this read is consistent and the
+        # state before it is exactly one step back
+        station.refresh_from_db(fields=INVENTORY_FIELDS)
+        before = {field: getattr(station, field) for field in INVENTORY_FIELDS}
+        before[counter] -= sign * deltas[station.pk]
+        before["inventory_seq"] -= 1
+        station.inventory_before = before
+
+
+def get_live_station_counters(station_ids=None):
+    """
+    Count available/booked batteries per station from the M2M tables.
+
+    Args:
+        station_ids: Limit to these stations (None for all)
+
+    Returns:
+        dict: {station_id: {counter_field: count}} for every station
+    """
+    stations = Station.objects.all()
+    if station_ids is not None:
+        stations = stations.filter(pk__in=station_ids)
+    live = {
+        station_id: {counter: 0 for counter in COUNTER_FIELDS.values()}
+        for station_id in stations.values_list("pk", flat=True)
+    }
+
+    for through, counter in COUNTER_FIELDS.items():
+        rows = through.objects.all()
+        if station_ids is not None:
+            rows = rows.filter(station_id__in=station_ids)
+        for row in rows.values("station_id").annotate(count=Count("pk")):
+            if row["station_id"] in live:
+                live[row["station_id"]][counter] = row["count"]
+    return live
+
+
+def reconcile_station_counters(station_ids=None, dry_run=False):
+    """
+    Find (and unless dry_run, repair) drift in the Station counters.
+
+    Args:
+        station_ids: Limit to these stations (None for all)
+        dry_run: Only report, don't write
+
+    Returns:
+        list: (station_id, {counter_field: (stored, live)}) for drifted stations
+    """
+    live = get_live_station_counters(station_ids)
+    stored = Station.objects.filter(pk__in=live.keys()).values(
+        "pk", *COUNTER_FIELDS.values()
+    )
+
+    drifted = []
+    for row in stored.iterator():
+        counts = live[row["pk"]]
+        changes = {
+            counter: (row[counter], count)
+            for counter, count in counts.items()
+            if row[counter] != count
+        }
+        if changes:
+            drifted.append((row["pk"], changes))
+            if not dry_run:
+                _repair_station_counters(row["pk"])
+    return drifted
+
+
+def _repair_station_counters(station_id):
+    # Lock the station row so in-flight M2M changes (which also update it)
+    # can't interleave between the recount and the write
+    with transaction.atomic():
+        Station.objects.select_for_update().filter(pk=station_id).exists()
+        counts = get_live_station_counters([station_id]).get(station_id)
+        if counts:
+            # Bump the sequence so subscribed clients resync
+            Station.objects.filter(pk=station_id).update(
+                **counts, inventory_seq=F("inventory_seq") + 1
+            )
+
+
+def update_compatible_stations(pairs, sign):
+    """
+    Apply available-battery changes to the CompatibleStation index.
+
+    Args:
+        pairs: (station_id, battery_id) tuples added to or removed from
+            Station.batteries
+        sign: 1 for added batteries, -1 for removed ones
+    """
+    if not pairs:
+        return
+
+    vehicles = dict(
+        Battery.objects.filter(
+            pk__in={battery_id for _, battery_id in pairs}
+        ).values_list("pk", "vehicle_id")
+    )
+    deltas = Counter()
+    for station_id, battery_id in pairs:
+        vehicle_id = vehicles.get(battery_id)
+        if vehicle_id is not None:
+            deltas[(vehicle_id, station_id)] += sign
+
+    for (vehicle_id, station_id), delta in deltas.items():
+        if delta:
+            _bump_compatible_station(vehicle_id, station_id, delta)
+
+
+def _bump_compatible_station(vehicle_id, station_id, delta):
+    rows = CompatibleStation.objects.filter(vehicle_id=vehicle_id, station_id=station_id)
+    if rows.update(available_batteries=F("available_batteries") + delta):
+        return
+    try:
+        with transaction.atomic():
+            CompatibleStation.objects.create(
+                vehicle_id=vehicle_id,
+                station_id=station_id,
+                available_batteries=max(delta, 0),
+            )
+    except IntegrityError:
+        # Created concurrently by another transaction
+        rows.update(available_batteries=F("available_batteries") + delta)
+
+
+def get_live_compatible_stations(station_ids=None):
+    """
+    Compute the CompatibleStation index from the live tables.
+
+    Args:
+        station_ids: Limit to these stations (None for all)
+
+    Returns:
+        dict: {(vehicle_id, station_id): available_batteries}
+    """
+    rows = Station.batteries.through.objects.filter(battery__vehicle__isnull=False)
+    if station_ids is not None:
+        rows = rows.filter(station_id__in=station_ids)
+    return {
+        (row["battery__vehicle_id"], row["station_id"]): row["available"]
+        for row in rows.values("battery__vehicle_id", "station_id").annotate(
+            available=Count("pk")
+        )
+    }
+
+
+def get_indexed_compatible_stations(station_ids=None):
+    """Read the CompatibleStation index as {(vehicle_id, station_id): available}"""
+    rows = CompatibleStation.objects.filter(available_batteries__gt=0)
+    if station_ids is not None:
+        rows = rows.filter(station_id__in=station_ids)
+    return {
+        (vehicle_id, station_id): available
+        for vehicle_id, station_id, available in rows.values_list(
+            "vehicle_id", "station_id", "available_batteries"
+        )
+    }
+
+
+def rebuild_compatible_stations(station_ids=None, batch_size=1000):
+    """
+    Rebuild the CompatibleStation index from the live tables.
+
+    Args:
+        station_ids: Only rebuild these stations (None for all)
+        batch_size: Rows per INSERT
+
+    Returns:
+        int: Number of index rows written
+    """
+    with transaction.atomic():
+        # Lock the station rows first: inventory changes update them (via
+        # update_station_counters) before touching the index, so none can
+        # land between the live read and the rewrite
+        stations = Station.objects.select_for_update().order_by("pk")
+        if station_ids is not None:
+            stations = stations.filter(pk__in=station_ids)
+        list(stations.values_list("pk", flat=True))
+
+        live = get_live_compatible_stations(station_ids)
+        stale = CompatibleStation.objects.all()
+        if station_ids is not None:
+            stale = stale.filter(station_id__in=station_ids)
+        stale.delete()
+        CompatibleStation.objects.bulk_create(
+            [
+                CompatibleStation(
+                    vehicle_id=vehicle_id,
+                    station_id=station_id,
+                    available_batteries=available,
+                )
+                for (vehicle_id, station_id), available in live.items()
+            ],
+            batch_size=batch_size,
+        )
+    return len(live)
+
+
+def diff_compatible_stations():
+    """
+    Compare the CompatibleStation index with the live tables.
+
+    Returns:
+        list: (vehicle_id, station_id, indexed, live) for every mismatch
+    """
+    live = get_live_compatible_stations()
+    indexed = get_indexed_compatible_stations()
+    mismatches = []
+    for vehicle_id, station_id in live.keys() | indexed.keys():
+        key = (vehicle_id, station_id)
+        if indexed.get(key, 0) != live.get(key, 0):
+            mismatches.append(
+                (vehicle_id, station_id, indexed.get(key, 0), live.get(key, 0))
+            )
+    return sorted(mismatches)
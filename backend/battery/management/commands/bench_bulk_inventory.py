@@ -0,0 +1,104 @@
+"""
+Management command to benchmark bulk vs one-at-a-time station stocking
+Usage: python manage.py bench_bulk_inventory [--batteries 50 500] [--repeat 3]
+
+Runs against the configured database inside a transaction that is rolled
+back, so no data is kept and no broadcast is sent.
+"""
+
+import time
+from unittest import mock
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from battery import websocket_utils
+from battery.bulk import add_station_batteries
+from battery.models import Battery, Station, Vehicle
+from battery.websocket_utils import broadcast_battery_added
+from producer.models import Company
+
+
+class Rollback(Exception):
+    pass
+
+
+class QueryCounter:
+    """connection.execute_wrapper counting executed statements"""
+
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Compare ManageStationBatteries (one battery per request) with the bulk loader'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batteries',
+            type=int,
+            nargs='+',
+            default=[50, 500],
+            help='Batteries stocked into a new station',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=3,
+            help='Runs per size (best time is reported)',
+        )
+
+    def handle(self, *args, **options):
+        if not Vehicle.objects.exists() or not Company.objects.exists():
+            raise CommandError('Needs at least one Vehicle and one Company')
+
+        self.stdout.write(
+            f"{'batteries':>10} {'path':>8} {'ms':>10} {'queries':>9} {'events':>8}"
+        )
+        for count in options['batteries']:
+            for name, load in (('single', self.load_single), ('bulk', self.load_bulk)):
+                results = [self.run(load, count) for _ in range(options['repeat'])]
+                ms, queries, events = min(results)
+                self.stdout.write(
+                    f'{count:>10} {name:>8} {ms:>10.1f} {queries:>9} {events:>8}'
+                )
+
+    def run(self, load, count):
+        """Stock a fresh station, then roll everything back"""
+        result = None
+        try:
+            with transaction.atomic():
+                vehicle = Vehicle.objects.first()
+                company = Company.objects.first()
+                station = Station.objects.create(name='Benchmark', latitude=0.0, longitude=0.0)
+                batteries = Battery.objects.bulk_create(
+                    [Battery(vehicle=vehicle, company=company, price=0) for _ in range(count)]
+                )
+                queue = websocket_utils.queue_station_event
+                with mock.patch.object(websocket_utils, 'queue_station_event', wraps=queue) as events:
+                    queries = QueryCounter()
+                    with connection.execute_wrapper(queries):
+                        start = time.perf_counter()
+                        load(station, [battery.pk for battery in batteries])
+                        elapsed = (time.perf_counter() - start) * 1000
+                result = (elapsed, queries.count, events.call_count)
+                raise Rollback
+        except Rollback:
+            pass
+        return result
+
+    def load_single(self, station, battery_ids):
+        # What N calls to ManageStationBatteries.put do, one transaction each
+        for battery_id in battery_ids:
+            battery = Battery.objects.get(pk=battery_id)
+            with transaction.atomic():
+                station.batteries.add(battery)
+                broadcast_battery_added(station, battery)
+
+    def load_bulk(self, station, battery_ids):
+        with transaction.atomic():
+            add_station_batteries({station: battery_ids})
@@ -0,0 +1,98 @@
+"""
+Management command to benchmark nearest-station distance computation
+Usage: python manage.py bench_distances [--sizes 1000 10000 100000] [--limit 50]
+"""
+
+import random
+import time
+
+from django.core.management.base import BaseCommand
+import numpy as np
+
+from battery.utils import (
+    format_distance,
+    format_time,
+    get_distance_btw,
+    get_distances,
+)
+
+
+class Command(BaseCommand):
+    help = 'Compare per-station vs batched distance computation per request'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[1000, 10000, 100000],
+            help='Station counts to benchmark',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=50,
+            help='Stations returned per request (rows that get display strings)',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Requests simulated per size (best time is reported)',
+        )
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        repeat = options['repeat']
+        user = {'latitude': 10.0484417, 'longitude': 76.3310651}
+
+        self.stdout.write(
+            f"{'stations':>10} {'per-station (ms)':>18} {'batched (ms)':>14} {'speedup':>9}"
+        )
+        for size in options['sizes']:
+            rng = random.Random(size)
+            stations = [
+                (rng.uniform(8, 13), rng.uniform(74, 78)) for _ in range(size)
+            ]
+            lats = np.fromiter((lat for lat, _ in stations), dtype=np.float64, count=size)
+            lngs = np.fromiter((lng for _, lng in stations), dtype=np.float64, count=size)
+
+            def per_station():
+                # Previous behaviour: distance + display strings for every
+                # station, then a full sort
+                rows = [
+                    get_distance_btw(
+                        dict(user), {'latitude': lat, 'longitude': lng}
+                    )
+                    for lat, lng in stations
+                ]
+                rows.sort(key=lambda row: row[0])
+                return rows[:limit]
+
+            def batched():
+                distances, times = get_distances(
+                    user['latitude'], user['longitude'], lats, lngs
+                )
+                k = min(limit, size)
+                top = np.argpartition(distances, k - 1)[:k]
+                top = top[np.argsort(distances[top])]
+                return [
+                    (distances[i], format_distance(distances[i]),
+                     times[i], format_time(times[i]))
+                    for i in top
+                ]
+
+            legacy_ms = self._best_of(per_station, repeat)
+            batched_ms = self._best_of(batched, repeat)
+            self.stdout.write(
+                f'{size:>10} {legacy_ms:>18.2f} {batched_ms:>14.2f} '
+                f'{legacy_ms / batched_ms:>8.1f}x'
+            )
+
+    def _best_of(self, func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.process_time()
+            func()
+            best = min(best, time.process_time() - start)
+        return best * 1000
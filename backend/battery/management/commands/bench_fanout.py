@@ -0,0 +1,81 @@
+"""
+Management command to benchmark WebSocket event fan-out CPU cost
+Usage: python manage.py bench_fanout [--consumers 100 1000 10000] [--repeat 5]
+"""
+
+import json
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand
+
+from battery.broadcast import CLIENT_FIELDS, encode_event
+
+
+class Command(BaseCommand):
+    help = 'Compare per-consumer vs once-per-event JSON encoding of one broadcast'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--consumers',
+            type=int,
+            nargs='+',
+            default=[100, 1000, 10000],
+            help='Sockets in the group receiving the event',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Fan-outs simulated per size (best time is reported)',
+        )
+
+    def handle(self, *args, **options):
+        repeat = options['repeat']
+        event = {
+            'type': 'battery_booked',
+            'station_id': 42,
+            'station_name': 'Kochi Central Swap Hub',
+            'battery_id': 1234,
+            'available_batteries': 11,
+            'booked_batteries': 3,
+            'total_batteries': 14,
+            'user': 'rider@example.com',
+            'timestamp': datetime.now().isoformat(),
+        }
+        fields = CLIENT_FIELDS[event['type']]
+
+        self.stdout.write(
+            f"{'consumers':>10} {'per-consumer (ms)':>18} {'encoded once (ms)':>18} "
+            f"{'us/socket':>10} {'speedup':>9}"
+        )
+        for consumers in options['consumers']:
+            def per_consumer():
+                # Previous behaviour: every consumer rebuilds and dumps the dict
+                for _ in range(consumers):
+                    payload = {'type': event['type']}
+                    for key, default in fields.items():
+                        payload[key] = event.get(key, default)
+                    json.dumps(payload)
+
+            def encoded_once():
+                # Current behaviour: one encode, consumers forward the text
+                message = encode_event(event)
+                for _ in range(consumers):
+                    message['text']
+
+            legacy_ms = self._best_of(per_consumer, repeat)
+            once_ms = self._best_of(encoded_once, repeat)
+            self.stdout.write(
+                f'{consumers:>10} {legacy_ms:>18.3f} {once_ms:>18.3f} '
+                f'{once_ms * 1000 / consumers:>10.3f} '
+                f'{legacy_ms / max(once_ms, 1e-6):>8.1f}x'
+            )
+
+    def _best_of(self, func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.process_time()
+            func()
+            best = min(best, time.process_time() - start)
+        return best * 1000
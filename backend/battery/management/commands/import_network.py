@@ -0,0 +1,122 @@
+"""
+Management command to import a partner network from CSV/JSONL files
+Usage:
+    python manage.py import_network --companies companies.csv --vehicles vehicles.csv \\
+        --batteries batteries.jsonl --stations stations.csv --inventory inventory.jsonl \\
+        [--chunk-size 1000] [--dry-run] [--resume] [--checkpoint import_network.checkpoint.json]
+
+Files are streamed in fixed-size chunks, one transaction per chunk, and
+records are upserted on external_id. Progress is saved to the checkpoint
+file after every chunk; after a failure, fix the data and re-run with
+--resume to continue where the import stopped. See battery/importer.py
+for the columns of each file.
+"""
+
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+
+from battery.importer import IMPORT_KINDS, import_file
+
+
+class Command(BaseCommand):
+    help = 'Import companies, vehicles, batteries, stations and inventory from CSV/JSONL files'
+
+    def add_arguments(self, parser):
+        for kind in IMPORT_KINDS:
+            parser.add_argument(f'--{kind}', help=f'{kind.capitalize()} file (.csv or .jsonl)')
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Rows per chunk (and per transaction)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate every file without writing anything',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            default='import_network.checkpoint.json',
+            help='File recording progress after each chunk',
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Skip the rows the checkpoint file records as imported',
+        )
+
+    def handle(self, *args, **options):
+        files = [(kind, options[kind]) for kind in IMPORT_KINDS if options[kind]]
+        if not files:
+            raise CommandError(f'Give at least one of: --{", --".join(IMPORT_KINDS)}')
+        for kind, path in files:
+            if not os.path.isfile(path):
+                raise CommandError(f'{kind}: no such file {path}')
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive')
+
+        dry_run = options['dry_run']
+        checkpoint_path = options['checkpoint']
+        checkpoint = self.load_checkpoint(checkpoint_path) if options['resume'] else {}
+        seen = {}
+
+        for kind, path in files:
+            path = os.path.abspath(path)
+            done = checkpoint.get(kind, {})
+            if done and done.get('path') != path:
+                raise CommandError(
+                    f'The checkpoint is for {done.get("path")}, not {path}; '
+                    'run without --resume to start over'
+                )
+            skip_rows = 0 if dry_run else done.get('rows', 0)
+            if skip_rows:
+                self.stdout.write(f'{kind}: resuming after row {skip_rows}')
+
+            def on_chunk(rows, kind=kind, path=path):
+                self.stdout.write(f'  {kind}: {rows} rows')
+                if not dry_run:
+                    checkpoint[kind] = {'path': path, 'rows': rows}
+                    self.save_checkpoint(checkpoint_path, checkpoint)
+
+            try:
+                rows = import_file(
+                    kind,
+                    path,
+                    chunk_size=options['chunk_size'],
+                    skip_rows=skip_rows,
+                    dry_run=dry_run,
+                    seen=seen,
+                    on_chunk=on_chunk,
+                )
+            except ValueError as e:
+                hint = '' if dry_run else ' Fix the file and re-run with --resume.'
+                raise CommandError(f'{kind} ({path}): {e}.{hint}')
+            self.stdout.write(self.style.SUCCESS(
+                f'✓ {kind}: {rows} rows {"valid" if dry_run else "imported"}'
+            ))
+
+        if dry_run:
+            self.stdout.write(self.style.SUCCESS('✓ Dry run passed; nothing was written'))
+        else:
+            if os.path.exists(checkpoint_path):
+                os.remove(checkpoint_path)
+            self.stdout.write(self.style.SUCCESS('✓ Import complete'))
+
+    def load_checkpoint(self, path):
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except ValueError:
+            raise CommandError(f'Unreadable checkpoint file {path}')
+
+    def save_checkpoint(self, path, checkpoint):
+        # Write then rename, so a crash never leaves a half-written file
+        tmp_path = f'{path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, path)
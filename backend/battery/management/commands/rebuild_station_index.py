@@ -0,0 +1,41 @@
+"""
+Management command to rebuild the vehicle -> compatible station index
+Usage: python manage.py rebuild_station_index [--check]
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from battery.inventory import diff_compatible_stations, rebuild_compatible_stations
+
+
+class Command(BaseCommand):
+    help = 'Rebuild (or check) the CompatibleStation index from live station inventory'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Only diff the index against the live tables; exit non-zero on drift',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = diff_compatible_stations()
+            if not mismatches:
+                self.stdout.write(self.style.SUCCESS('✓ CompatibleStation index is consistent'))
+                return
+
+            for vehicle_id, station_id, indexed, live in mismatches:
+                self.stdout.write(
+                    self.style.WARNING(
+                        f'vehicle={vehicle_id} station={station_id}: '
+                        f'indexed={indexed} live={live}'
+                    )
+                )
+            raise CommandError(
+                f'{len(mismatches)} index entries differ from live inventory. '
+                'Run "python manage.py rebuild_station_index" to repair.'
+            )
+
+        self.stdout.write(self.style.SUCCESS('Rebuilding CompatibleStation index...'))
+        rows = rebuild_compatible_stations()
+        self.stdout.write(self.style.SUCCESS(f'✓ Index rebuilt with {rows} entries'))
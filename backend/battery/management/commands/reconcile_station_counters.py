@@ -0,0 +1,36 @@
+"""
+Management command to repair drift in the denormalized station counters
+Usage: python manage.py reconcile_station_counters [--dry-run]
+"""
+
+from django.core.management.base import BaseCommand
+from battery.inventory import reconcile_station_counters
+
+
+class Command(BaseCommand):
+    help = 'Recount available/booked batteries per station and fix drifted counters'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report drifted stations without updating them',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        drifted = reconcile_station_counters(dry_run=dry_run)
+
+        for station_id, changes in drifted:
+            detail = ', '.join(
+                f'{counter}: {stored} -> {live}'
+                for counter, (stored, live) in changes.items()
+            )
+            self.stdout.write(self.style.WARNING(f'Station {station_id}: {detail}'))
+
+        if not drifted:
+            self.stdout.write(self.style.SUCCESS('✓ All station counters are consistent'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f'{len(drifted)} stations have drifted (dry run, nothing changed)'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ Repaired counters for {len(drifted)} stations'))
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:20
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battery', '0003_station_owner'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='station',
+            index=models.Index(fields=['latitude', 'longitude'], name='station_lat_lng_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:23
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_compatible_station_index(apps, schema_editor):
+    Station = apps.get_model('battery', 'Station')
+    CompatibleStation = apps.get_model('battery', 'CompatibleStation')
+    rows = (
+        Station.batteries.through.objects.filter(battery__vehicle__isnull=False)
+        .values('battery__vehicle_id', 'station_id')
+        .annotate(available=models.Count('pk'))
+    )
+    CompatibleStation.objects.bulk_create(
+        [
+            CompatibleStation(
+                vehicle_id=row['battery__vehicle_id'],
+                station_id=row['station_id'],
+                available_batteries=row['available'],
+            )
+            for row in rows
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battery', '0004_station_lat_lng_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CompatibleStation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('available_batteries', models.IntegerField(default=0, verbose_name='Available compatible batteries')),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compatible_vehicles', to='battery.station')),
+                ('vehicle', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='compatible_stations', to='battery.vehicle')),
+            ],
+            options={
+                'verbose_name': 'Compatible Station',
+                'verbose_name_plural': 'Compatible Stations',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='compatiblestation',
+            constraint=models.UniqueConstraint(fields=('vehicle', 'station'), name='unique_vehicle_station'),
+        ),
+        migrations.RunPython(build_compatible_station_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:24
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+
+def backfill_station_counters(apps, schema_editor):
+    Station = apps.get_model('battery', 'Station')
+
+    def count_of(through):
+        return Coalesce(
+            models.Subquery(
+                through.objects.filter(station_id=models.OuterRef('pk'))
+                .values('station_id')
+                .annotate(count=models.Count('pk'))
+                .values('count')
+            ),
+            0,
+        )
+
+    Station.objects.update(
+        available_battery_count=count_of(Station.batteries.through),
+        booked_battery_count=count_of(Station.booked_batteries.through),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battery', '0005_compatiblestation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='available_battery_count',
+            field=models.IntegerField(default=0, verbose_name='Available batteries'),
+        ),
+        migrations.AddField(
+            model_name='station',
+            name='booked_battery_count',
+            field=models.IntegerField(default=0, verbose_name='Booked batteries'),
+        ),
+        migrations.RunPython(backfill_station_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battery', '0006_station_inventory_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='station',
+            name='inventory_seq',
+            field=models.PositiveBigIntegerField(default=0, verbose_name='Inventory sequence'),
+        ),
+    ]
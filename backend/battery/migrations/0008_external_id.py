@@ -0,0 +1,28 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battery', '0007_station_inventory_seq'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='battery',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='External ID'),
+        ),
+        migrations.AddField(
+            model_name='station',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='External ID'),
+        ),
+        migrations.AddField(
+            model_name='vehicle',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='External ID'),
+        ),
+    ]
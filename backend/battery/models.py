@@ -3,6 +3,10 @@ from django.db import models
 
 class Vehicle(models.Model):
     name = models.CharField("Vehicle Name", max_length=150)
+    # Identifier in a partner's own system, matched by manage.py import_network
+    external_id = models.CharField(
+        "External ID", max_length=64, unique=True, null=True, blank=True
+    )
 
     class Meta:
         verbose_name = "Vehicle"
@@ -16,6 +20,10 @@ class Battery(models.Model):
     vehicle = models.ForeignKey("battery.Vehicle", on_delete=models.CASCADE, null=True)
     company = models.ForeignKey("producer.Company", on_delete=models.CASCADE, null=True)
     price = models.FloatField("Price")
+    # Identifier in a partner's own system, matched by manage.py import_network
+    external_id = models.CharField(
+        "External ID", max_length=64, unique=True, null=True, blank=True
+    )
 
     class Meta:
         verbose_name = "Battery"
@@ -31,6 +39,10 @@ class Station(models.Model):
     name = models.CharField("Station Name", max_length=150, null=True)
     latitude = models.FloatField("Latitude")
     longitude = models.FloatField("Longitude")
+    # Identifier in a partner's own system, matched by manage.py import_network
+    external_id = models.CharField(
+        "External ID", max_length=64, unique=True, null=True, blank=True
+    )
     owner = models.ForeignKey(
         "producer.Producer",
         on_delete=models.CASCADE,
@@ -47,10 +59,52 @@ class Station(models.Model):
         blank=True,
         symmetrical=False,
     )
+    # Denormalized counts of the two M2Ms above, kept in step by the
+    # m2m_changed handlers in battery/signals.py
+    available_battery_count = models.IntegerField("Available batteries", default=0)
+    booked_battery_count = models.IntegerField("Booked batteries", default=0)
+    # Bumped with every counter change; lets WebSocket clients spot missed
+    # inventory deltas and resync
+    inventory_seq = models.PositiveBigIntegerField("Inventory sequence", default=0)
 
     class Meta:
         verbose_name = "Station"
         verbose_name_plural = "Stations"
+        indexes = [
+            # Bounding-box prefilter for nearest-station search
+            models.Index(fields=["latitude", "longitude"], name="station_lat_lng_idx"),
+        ]
 
     def __str__(self) -> str:
-        return f"{self.name} ({self.batteries.count()} batteries)"
+        return f"{self.name} ({self.available_battery_count} batteries)"
+
+
+class CompatibleStation(models.Model):
+    """
+    Materialized index of the stations holding available batteries for a
+    vehicle. Maintained by the Station.batteries m2m_changed handlers and
+    rebuildable with ``manage.py rebuild_station_index``.
+    """
+
+    vehicle = models.ForeignKey(
+        "battery.Vehicle", on_delete=models.CASCADE, related_name="compatible_stations"
+    )
+    station = models.ForeignKey(
+        "battery.Station", on_delete=models.CASCADE, related_name="compatible_vehicles"
+    )
+    available_batteries = models.IntegerField("Available compatible batteries", default=0)
+
+    class Meta:
+        verbose_name = "Compatible Station"
+        verbose_name_plural = "Compatible Stations"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["vehicle", "station"], name="unique_vehicle_station"
+            ),
+        ]
+
+    def __str__(self):
+        return (
+            f"Vehicle {self.vehicle_id} at station {self.station_id} "
+            f"({self.available_batteries} available)"
+        )
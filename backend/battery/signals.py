@@ -3,46 +3,159 @@ Django signals for automatic WebSocket broadcasting
 Triggers real-time updates when station inventory changes
 """
 
-from django.db.models.signals import m2m_changed, post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete, pre_save
 from django.dispatch import receiver
-from battery.models import Station
+from battery.inventory import (
+    COUNTER_FIELDS,
+    get_changed_pairs,
+    get_existing_pairs,
+    rebuild_compatible_stations,
+    update_compatible_stations,
+    update_station_counters,
+)
+from battery.models import Battery, Station, Vehicle
 from battery.websocket_utils import broadcast_inventory_update
+from batteryswap.response_cache import invalidate_cached_responses
+
+
+def track_inventory_change(sender, instance, action, reverse, pk_set):
+    """
+    Apply an m2m_changed event on a station inventory M2M to the
+    denormalized Station counters.
+
+    Returns:
+        tuple: (pairs, sign) on post_* actions, where pairs are the
+        (station_id, battery_id) rows added (sign 1) or removed (sign -1);
+        None on pre_* actions
+    """
+    # Remember which rows really go away; pk_set may name missing ones
+    if action == 'pre_remove':
+        instance._removed_station_batteries = get_existing_pairs(
+            sender, instance, reverse, pk_set
+        )
+    elif action == 'pre_clear':
+        instance._removed_station_batteries = get_existing_pairs(
+            sender, instance, reverse
+        )
+    elif action in ['post_add', 'post_remove', 'post_clear']:
+        if action == 'post_add':
+            pairs, sign = get_changed_pairs(instance, reverse, pk_set), 1
+        else:
+            pairs, sign = instance.__dict__.pop('_removed_station_batteries', []), -1
+        update_station_counters(
+            sender, pairs, sign, station=None if reverse else instance
+        )
+        return pairs, sign
+    return None
 
 
 @receiver(m2m_changed, sender=Station.batteries.through)
-def station_batteries_changed(sender, instance, action, **kwargs):
+def station_batteries_changed(sender, instance, action, reverse, pk_set, **kwargs):
     """
     Signal handler for when batteries are added/removed from a station.
-    Broadcasts inventory update to connected WebSocket clients.
+    Updates the station counters and CompatibleStation index in the same
+    transaction, then broadcasts inventory update to connected WebSocket
+    clients.
     
     Args:
         sender: The intermediate model for the many-to-many relation
-        instance: The Station instance
+        instance: The Station instance (Battery when reverse)
         action: The type of update (post_add, post_remove, post_clear)
+        reverse: True when the change was made from the Battery side
+        pk_set: Primary keys added or removed
         **kwargs: Additional keyword arguments
     """
+    change = track_inventory_change(sender, instance, action, reverse, pk_set)
+    if change:
+        update_compatible_stations(*change)
+
     # Only broadcast after the change is complete
-    if action in ['post_add', 'post_remove', 'post_clear']:
+    if change and not reverse:
         broadcast_inventory_update(instance, action='update')
 
 
 @receiver(m2m_changed, sender=Station.booked_batteries.through)
-def station_booked_batteries_changed(sender, instance, action, **kwargs):
+def station_booked_batteries_changed(sender, instance, action, reverse, pk_set, **kwargs):
     """
     Signal handler for when booked batteries change.
-    Broadcasts inventory update to connected WebSocket clients.
+    Updates the station counters, then broadcasts inventory update to
+    connected WebSocket clients.
     
     Args:
         sender: The intermediate model for the many-to-many relation
-        instance: The Station instance
+        instance: The Station instance (Battery when reverse)
         action: The type of update (post_add, post_remove, post_clear)
+        reverse: True when the change was made from the Battery side
+        pk_set: Primary keys added or removed
         **kwargs: Additional keyword arguments
     """
+    change = track_inventory_change(sender, instance, action, reverse, pk_set)
+
     # Only broadcast after the change is complete
-    if action in ['post_add', 'post_remove', 'post_clear']:
+    if change and not reverse:
         broadcast_inventory_update(instance, action='update')
 
 
+@receiver(pre_save, sender=Battery)
+def battery_saving(sender, instance, update_fields=None, **kwargs):
+    """Remember a battery's vehicle before an update that may change it"""
+    if instance.pk is None or (update_fields is not None and 'vehicle' not in update_fields):
+        return
+    instance._previous_vehicle_id = (
+        Battery.objects.filter(pk=instance.pk).values_list('vehicle_id', flat=True).first()
+    )
+
+
+@receiver(post_save, sender=Battery)
+def battery_saved(sender, instance, created, **kwargs):
+    """
+    Signal handler for when a battery is updated.
+    If its vehicle changed, re-index the stations stocking it.
+    """
+    if created or '_previous_vehicle_id' not in instance.__dict__:
+        return
+    if instance.__dict__.pop('_previous_vehicle_id') == instance.vehicle_id:
+        return
+    station_ids = list(instance.Batteries.values_list('pk', flat=True))
+    if station_ids:
+        rebuild_compatible_stations(station_ids)
+
+
+@receiver(pre_delete, sender=Battery)
+def battery_deleting(sender, instance, **kwargs):
+    """
+    Remember the station inventory rows of a battery before they cascade
+    away (the cascade doesn't send m2m_changed).
+    """
+    instance._deleted_inventory_pairs = {
+        through: get_existing_pairs(through, instance, reverse=True)
+        for through in COUNTER_FIELDS
+    }
+
+
+@receiver(post_delete, sender=Battery)
+def battery_deleted(sender, instance, **kwargs):
+    """
+    Take a deleted battery out of the counters of the stations that held
+    it, re-index them and broadcast their new inventory.
+    """
+    removed = instance.__dict__.pop('_deleted_inventory_pairs', {})
+    station_ids = {station_id for pairs in removed.values() for station_id, _ in pairs}
+    if not station_ids:
+        return
+
+    stations = Station.objects.in_bulk(station_ids)
+    for through, pairs in removed.items():
+        for station_id, _ in pairs:
+            update_station_counters(through, [(station_id, instance.pk)], -1, station=stations[station_id])
+    if removed.get(Station.batteries.through):
+        rebuild_compatible_stations(
+            {station_id for station_id, _ in removed[Station.batteries.through]}
+        )
+    for station in stations.values():
+        broadcast_inventory_update(station, action='update')
+
+
 @receiver(post_save, sender=Station)
 def station_saved(sender, instance, created, **kwargs):
     """
@@ -59,3 +172,11 @@ def station_saved(sender, instance, created, **kwargs):
         # Broadcast that a new station is available
         broadcast_inventory_update(instance, action='created')
 
+
+@receiver(post_save, sender=Vehicle)
+@receiver(post_delete, sender=Vehicle)
+@receiver(post_save, sender=Battery)
+@receiver(post_delete, sender=Battery)
+def catalog_changed(sender, instance, **kwargs):
+    """Retire the cached vehicle and battery list responses"""
+    invalidate_cached_responses(sender)
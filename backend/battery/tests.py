@@ -1,3 +1,835 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import threading
+import time
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync
+from channels.testing import WebsocketCommunicator
+from channels.layers import get_channel_layer
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection, transaction
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from battery.bulk import add_station_batteries
+from battery.inventory import (
+    diff_compatible_stations,
+    get_indexed_compatible_stations,
+    reconcile_station_counters,
+)
+from battery.models import Battery, CompatibleStation, Station, Vehicle
+from battery import broadcast, geohash
+from battery.broadcast import get_station_tile, get_tile_group, map_throttle, outbox
+from battery.consumers import StationInventoryConsumer
+from battery.websocket_utils import broadcast_battery_booked, get_station_inventory_data
+from batteryswap import response_cache
+from consumer.models import Consumer
+from producer.models import Company, Producer
+from user.models import CustomUser
+
+
+IN_MEMORY_CHANNEL_LAYERS = {
+    "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+}
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+class GroupListener:
+    """Collects the channel layer messages sent to some groups"""
+
+    def __init__(self, *groups):
+        self.layer = get_channel_layer()
+        self.channel = async_to_sync(self.layer.new_channel)()
+        for group in groups:
+            async_to_sync(self.layer.group_add)(group, self.channel)
+
+    def messages(self):
+        """Decoded client payloads received so far"""
+        outbox.join(timeout=5)
+        queue = self.layer.channels.get(self.channel)
+        messages = []
+        while queue is not None and not queue.empty():
+            messages.append(json.loads(queue.get_nowait()[1]["text"]))
+        return messages
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class FindStationsTests(TestCase):
+    latitude = 10.0484417
+    longitude = 76.3310651
+
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(name="Ather 450X")
+        self.other_vehicle = Vehicle.objects.create(name="Ola S1")
+        self.company = Company.objects.create(name="Volt")
+        self.user = CustomUser.objects.create_user(
+            email="rider@example.com",
+            password="password123",
+            name="Rider",
+            username="rider@example.com",
+            user_type="consumer",
+        )
+        Consumer.objects.create(user=self.user, vehicle=self.vehicle)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def add_stations(self, count, vehicle=None):
+        stations = []
+        for i in range(count):
+            station = Station.objects.create(
+                name=f"Station {Station.objects.count()}",
+                latitude=self.latitude + 0.01 * (i + 1),
+                longitude=self.longitude,
+            )
+            station.batteries.add(
+                Battery.objects.create(
+                    vehicle=vehicle or self.vehicle, company=self.company, price=100
+                ),
+                Battery.objects.create(
+                    vehicle=self.other_vehicle, company=self.company, price=80
+                ),
+            )
+            stations.append(station)
+        return stations
+
+    def find_stations(self, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("find_stations"),
+                {"latitude": self.latitude, "longitude": self.longitude, **params},
+            )
+        return response, len(queries)
+
+    def test_query_count_does_not_grow_with_stations(self):
+        self.add_stations(2)
+        response, few = self.find_stations(radius_km=50)
+        self.assertEqual(len(response.data["stations"]), 2)
+
+        self.add_stations(25)
+        response, many = self.find_stations(radius_km=50)
+        self.assertEqual(len(response.data["stations"]), 27)
+
+        self.assertEqual(few, many)
+
+    def test_only_compatible_stations_are_returned(self):
+        compatible = self.add_stations(2)
+        self.add_stations(3, vehicle=self.other_vehicle)
+
+        response, _ = self.find_stations(radius_km=50)
+
+        self.assertEqual(
+            [s["pk"] for s in response.data["stations"]],
+            [s.pk for s in compatible],
+        )
+
+    def test_limit_returns_nearest_first(self):
+        stations = self.add_stations(5)
+
+        response, _ = self.find_stations(limit=2)
+
+        self.assertEqual(
+            [s["pk"] for s in response.data["stations"]],
+            [stations[0].pk, stations[1].pk],
+        )
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class CompatibleStationIndexTests(TestCase):
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(name="Ather 450X")
+        self.company = Company.objects.create(name="Volt")
+        self.station = Station.objects.create(name="Hub", latitude=10.0, longitude=76.0)
+        self.batteries = [
+            Battery.objects.create(vehicle=self.vehicle, company=self.company, price=100)
+            for _ in range(3)
+        ]
+
+    def indexed(self):
+        return get_indexed_compatible_stations().get((self.vehicle.pk, self.station.pk), 0)
+
+    def test_index_follows_station_batteries(self):
+        self.station.batteries.add(*self.batteries)
+        self.assertEqual(self.indexed(), 3)
+
+        # Removing a battery that is not stocked must not skew the count
+        self.station.batteries.remove(self.batteries[0], self.batteries[0])
+        self.station.batteries.remove(self.batteries[0])
+        self.assertEqual(self.indexed(), 2)
+
+        self.batteries[1].Batteries.remove(self.station)
+        self.assertEqual(self.indexed(), 1)
+
+        self.station.batteries.clear()
+        self.assertEqual(self.indexed(), 0)
+        self.assertEqual(diff_compatible_stations(), [])
+
+    def test_only_vehicle_change_reindexes(self):
+        self.station.batteries.add(*self.batteries)
+        battery = self.batteries[0]
+
+        with mock.patch("battery.signals.rebuild_compatible_stations") as rebuild:
+            battery.price = 120
+            battery.save()
+        rebuild.assert_not_called()
+
+        scooter = Vehicle.objects.create(name="Ola S1")
+        battery.vehicle = scooter
+        battery.save()
+        self.assertEqual(self.indexed(), 2)
+        self.assertEqual(get_indexed_compatible_stations()[(scooter.pk, self.station.pk)], 1)
+        self.assertEqual(diff_compatible_stations(), [])
+
+    def test_rebuild_repairs_drift(self):
+        self.station.batteries.add(*self.batteries)
+        CompatibleStation.objects.update(available_batteries=0)
+        self.assertEqual(len(diff_compatible_stations()), 1)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_station_index", "--check", stdout=StringIO())
+        call_command("rebuild_station_index", stdout=StringIO())
+
+        self.assertEqual(self.indexed(), 3)
+        self.assertEqual(diff_compatible_stations(), [])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class StationCounterTests(TestCase):
+    def setUp(self):
+        vehicle = Vehicle.objects.create(name="Ather 450X")
+        company = Company.objects.create(name="Volt")
+        self.station = Station.objects.create(name="Hub", latitude=10.0, longitude=76.0)
+        self.batteries = [
+            Battery.objects.create(vehicle=vehicle, company=company, price=100)
+            for _ in range(3)
+        ]
+
+    def assertCounters(self, available, booked):
+        self.assertEqual(
+            (self.station.available_battery_count, self.station.booked_battery_count),
+            (available, booked),
+        )
+        self.station.refresh_from_db()
+        self.assertEqual(
+            (self.station.available_battery_count, self.station.booked_battery_count),
+            (available, booked),
+        )
+
+    def test_counters_follow_booking_and_collection(self):
+        self.station.batteries.add(*self.batteries)
+        self.assertCounters(3, 0)
+
+        self.station.batteries.remove(self.batteries[0])
+        self.station.booked_batteries.add(self.batteries[0])
+        self.assertCounters(2, 1)
+
+        self.station.booked_batteries.remove(self.batteries[0])
+        self.assertCounters(2, 0)
+
+    def test_deleting_a_battery_updates_counters(self):
+        self.station.batteries.add(*self.batteries[:2])
+        self.station.booked_batteries.add(self.batteries[2])
+        seq = Station.objects.get(pk=self.station.pk).inventory_seq
+
+        with mock.patch("battery.signals.broadcast_inventory_update") as broadcast:
+            self.batteries[0].delete()
+            self.batteries[2].delete()
+
+        self.station.refresh_from_db()
+        self.assertCounters(1, 0)
+        self.assertEqual(self.station.inventory_seq, seq + 2)
+        self.assertEqual(broadcast.call_count, 2)
+        self.assertEqual(reconcile_station_counters(dry_run=True), [])
+        self.assertEqual(diff_compatible_stations(), [])
+
+    def test_inventory_broadcast_runs_no_count_queries(self):
+        self.station.batteries.add(*self.batteries)
+        with CaptureQueriesContext(connection) as queries:
+            data = get_station_inventory_data(self.station)
+        self.assertEqual(len(queries), 0)
+        self.assertEqual(data["available_batteries"], 3)
+
+    def test_reconcile_repairs_drift(self):
+        self.station.batteries.add(*self.batteries)
+        Station.objects.filter(pk=self.station.pk).update(available_battery_count=7)
+
+        self.assertEqual(len(reconcile_station_counters(dry_run=True)), 1)
+        call_command("reconcile_station_counters", stdout=StringIO())
+
+        self.assertEqual(reconcile_station_counters(dry_run=True), [])
+        self.station.refresh_from_db()
+        self.assertEqual(self.station.available_battery_count, 3)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class CoalescedBroadcastTests(TransactionTestCase):
+    def setUp(self):
+        vehicle = Vehicle.objects.create(name="Ather 450X")
+        company = Company.objects.create(name="Volt")
+        self.user = CustomUser.objects.create_user(
+            email="rider@example.com",
+            name="Rider",
+            username="rider@example.com",
+            user_type="consumer",
+        )
+        self.station = Station.objects.create(name="Hub", latitude=10.0, longitude=76.0)
+        self.battery = Battery.objects.create(vehicle=vehicle, company=company, price=100)
+        self.station.batteries.add(self.battery)
+
+    def book(self):
+        self.station.batteries.remove(self.battery)
+        self.station.booked_batteries.add(self.battery)
+        broadcast_battery_booked(self.station, self.battery, self.user)
+
+    def test_booking_sends_one_message_per_group(self):
+        station_listener = GroupListener(f"station_{self.station.pk}")
+        all_listener = GroupListener("stations_all")
+        user_listener = GroupListener(f"user_{self.user.pk}")
+
+        with transaction.atomic():
+            self.book()
+            self.assertEqual(station_listener.messages(), [])
+
+        for listener in (station_listener, all_listener):
+            messages = listener.messages()
+            self.assertEqual(len(messages), 1)
+            self.assertEqual(messages[0]["type"], "battery_booked")
+            self.assertEqual(messages[0]["battery_id"], self.battery.pk)
+            self.assertEqual(messages[0]["available_batteries"], 0)
+            self.assertEqual(messages[0]["booked_batteries"], 1)
+        self.assertEqual(len(user_listener.messages()), 1)
+
+    def test_collapsed_message_is_one_delta(self):
+        listener = GroupListener(f"station_{self.station.pk}")
+        seq = Station.objects.get(pk=self.station.pk).inventory_seq
+
+        with transaction.atomic():
+            self.book()
+
+        [message] = listener.messages()
+        # Two counter changes: off the shelf, then into the booked list
+        self.assertEqual(message["prev_seq"], seq)
+        self.assertEqual(message["seq"], seq + 2)
+        self.assertEqual(message["available_delta"], -1)
+        self.assertEqual(message["booked_delta"], 1)
+        self.assertEqual(Station.objects.get(pk=self.station.pk).inventory_seq, seq + 2)
+
+    def test_payload_is_encoded_once_per_event(self):
+        listeners = [
+            GroupListener(f"station_{self.station.pk}"),
+            GroupListener("stations_all"),
+            GroupListener(get_tile_group(get_station_tile(self.station))),
+        ]
+        dumps = broadcast.json_encoder.dumps
+
+        with mock.patch.object(broadcast.json_encoder, "dumps", wraps=dumps) as encode:
+            with transaction.atomic():
+                self.book()
+            for listener in listeners:
+                self.assertEqual(len(listener.messages()), 1)
+
+        # One station event and one booking notification, whatever the fan-out
+        self.assertEqual(encode.call_count, 2)
+
+    def test_rolled_back_transaction_sends_nothing(self):
+        listener = GroupListener(f"station_{self.station.pk}", "stations_all")
+
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.book()
+                raise RuntimeError
+
+        self.assertEqual(listener.messages(), [])
+
+    @override_settings(WEBSOCKET_MAP_MAX_RATE=1)
+    def test_stations_all_is_rate_limited(self):
+        station_listener = GroupListener(f"station_{self.station.pk}")
+        all_listener = GroupListener("stations_all")
+
+        self.station.batteries.remove(self.battery)
+        self.station.batteries.add(self.battery)
+
+        self.assertEqual(len(station_listener.messages()), 2)
+        self.assertEqual(len(all_listener.messages()), 1)
+
+        # The trailing send delivers the latest state
+        map_throttle.send_pending("stations_all", self.station.pk)
+        messages = all_listener.messages()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]["available_batteries"], 1)
+
+    @override_settings(WEBSOCKET_MAP_MAX_RATE=1)
+    def test_rate_limit_forgets_old_sends(self):
+        throttle = broadcast.MapThrottle()
+        with mock.patch.object(broadcast, "send_to_group"), \
+                mock.patch.object(broadcast.time, "monotonic", side_effect=[0, 0.5, 2]):
+            throttle.send("stations_all", 1, {}, "{}")
+            throttle.send("stations_all", 2, {}, "{}")
+            self.assertEqual(len(throttle.last_sent), 2)
+            throttle.send("stations_all", 3, {}, "{}")
+
+        self.assertEqual(list(throttle.last_sent), [("stations_all", 3)])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class BulkStationBatteriesTests(TransactionTestCase):
+    def setUp(self):
+        self.vehicle = Vehicle.objects.create(name="Ather 450X")
+        company = Company.objects.create(name="Volt")
+        self.producer = Producer.objects.create(
+            user=CustomUser.objects.create_user(
+                email="depot@example.com", name="Depot", username="depot@example.com",
+                user_type="producer",
+            ),
+            company=company,
+        )
+        self.stations = [
+            Station.objects.create(name="Hub", latitude=10.0, longitude=76.0, owner=self.producer)
+            for _ in range(2)
+        ]
+        self.batteries = [
+            Battery.objects.create(vehicle=self.vehicle, company=company, price=100)
+            for _ in range(4)
+        ]
+        self.client = APIClient()
+        self.client.force_authenticate(self.producer.user)
+
+    def test_json_list_is_added_with_one_broadcast(self):
+        station = self.stations[0]
+        station.batteries.add(self.batteries[0])
+        listener = GroupListener(f"station_{station.pk}")
+        listener.messages()
+
+        response = self.client.post(
+            reverse("bulk_station_batteries", args=[station.pk]),
+            {"batteries": [b.pk for b in self.batteries]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data["added"], response.data["skipped"]), (3, 1))
+        station.refresh_from_db()
+        self.assertEqual(station.available_battery_count, 4)
+        self.assertEqual(station.batteries.count(), 4)
+        self.assertEqual(
+            CompatibleStation.objects.get(vehicle=self.vehicle, station=station).available_batteries, 4
+        )
+        [message] = listener.messages()
+        self.assertEqual(message["available_batteries"], 4)
+        self.assertEqual(message["available_delta"], 3)
+
+    def test_csv_and_ndjson_streams_cover_many_stations(self):
+        first, second = self.stations
+        csv_body = "station,battery\n" + "".join(
+            f"{first.pk},{b.pk}\n" for b in self.batteries[:2]
+        )
+        response = self.client.post(
+            reverse("bulk_stations_batteries"), csv_body, content_type="text/csv"
+        )
+        self.assertEqual(response.data["added"], 2)
+
+        ndjson_body = "\n".join(
+            json.dumps({"station": second.pk, "battery": b.pk}) for b in self.batteries[2:]
+        )
+        response = self.client.post(
+            reverse("bulk_stations_batteries"), ndjson_body, content_type="application/x-ndjson"
+        )
+        self.assertEqual(response.data["stations"], {second.pk: 2})
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.available_battery_count, second.available_battery_count), (2, 2))
+
+    def test_unknown_ids_and_foreign_stations_add_nothing(self):
+        other = Station.objects.create(name="Elsewhere", latitude=10.0, longitude=76.0)
+        response = self.client.post(
+            reverse("bulk_stations_batteries"),
+            {"items": [
+                {"station": self.stations[0].pk, "battery": self.batteries[0].pk},
+                {"station": self.stations[0].pk, "battery": 999999},
+                {"station": other.pk, "battery": self.batteries[1].pk},
+            ]},
+            format="json",
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data["missing_batteries"], [999999])
+        self.assertEqual(response.data["missing_stations"], [other.pk])
+        self.assertFalse(Station.batteries.through.objects.exists())
+
+        response = self.client.post(
+            reverse("bulk_stations_batteries"), "battery\nabc\n", content_type="text/csv"
+        )
+        self.assertEqual(response.status_code, 400)
+
+    def test_body_station_cannot_override_url_station(self):
+        first, second = self.stations
+        for body in (
+            {"station": second.pk, "batteries": [self.batteries[0].pk]},
+            {"items": [{"station": second.pk, "battery": self.batteries[0].pk}]},
+        ):
+            response = self.client.post(
+                reverse("bulk_station_batteries", args=[first.pk]), body, format="json"
+            )
+            self.assertEqual(response.status_code, 400)
+        self.assertFalse(Station.batteries.through.objects.exists())
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ImportNetworkTests(TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.checkpoint = os.path.join(self.tmp.name, "checkpoint.json")
+        self.files = {
+            "companies": self.write("companies.csv", "external_id,name\nC1,Volt\n"),
+            "vehicles": self.write("vehicles.jsonl", '{"external_id": "V1", "name": "Ather 450X"}\n'),
+            "batteries": self.write(
+                "batteries.csv",
+                "external_id,company,vehicle,price\n"
+                + "".join(f"B{i},C1,V1,100\n" for i in range(5)),
+            ),
+            "stations": self.write(
+                "stations.csv",
+                "external_id,name,latitude,longitude\nS1,Hub,10.0,76.0\nS2,Depot,10.1,76.1\n",
+            ),
+            "inventory": self.write(
+                "inventory.jsonl",
+                "".join(json.dumps({"station": "S1", "battery": f"B{i}"}) + "\n" for i in range(5)),
+            ),
+        }
+
+    def write(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w") as f:
+            f.write(content)
+        return path
+
+    def run_import(self, *args, **files):
+        options = []
+        for kind, path in {**self.files, **files}.items():
+            options += [f"--{kind}", path]
+        call_command(
+            "import_network", *options, "--chunk-size", "2", "--checkpoint", self.checkpoint,
+            *args, stdout=StringIO(),
+        )
+
+    def test_import_upserts_on_external_id(self):
+        self.run_import()
+        self.files["batteries"] = self.write(
+            "batteries.csv", "external_id,company,vehicle,price\nB0,C1,V1,250\n"
+        )
+        self.run_import()
+
+        self.assertEqual(Battery.objects.count(), 5)
+        self.assertEqual(Battery.objects.get(external_id="B0").price, 250)
+        station = Station.objects.get(external_id="S1")
+        self.assertEqual(station.available_battery_count, 5)
+        self.assertEqual(CompatibleStation.objects.get(station=station).available_batteries, 5)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_reimport_without_owner_keeps_station_owner(self):
+        user = CustomUser.objects.create_user(
+            email="owner@example.com", name="Owner", username="owner@example.com", user_type="producer"
+        )
+        producer = Producer.objects.create(user=user, company=Company.objects.create(name="Volt"))
+        self.files["stations"] = self.write(
+            "stations.csv",
+            "external_id,name,latitude,longitude,owner\nS1,Hub,10.0,76.0,owner@example.com\n",
+        )
+        self.run_import()
+
+        self.files["stations"] = self.write(
+            "stations.csv", "external_id,name,latitude,longitude\nS1,Main Hub,10.0,76.0\n"
+        )
+        self.run_import()
+
+        station = Station.objects.get(external_id="S1")
+        self.assertEqual(station.name, "Main Hub")
+        self.assertEqual(station.owner, producer)
+
+    def test_dry_run_validates_without_writing(self):
+        self.run_import("--dry-run")
+        self.assertFalse(Station.objects.exists())
+
+        bad = self.write("bad.jsonl", '{"station": "S1", "battery": "B9"}\n')
+        with self.assertRaisesMessage(CommandError, "line 1: unknown battery B9"):
+            self.run_import("--dry-run", inventory=bad)
+
+    def test_resume_continues_after_failed_chunk(self):
+        rows = [json.dumps({"station": "S2", "battery": f"B{i}"}) for i in range(5)]
+        rows[3] = '{"station": "S2"}'
+        broken = self.write("inventory.jsonl", "\n".join(rows) + "\n")
+        with self.assertRaisesMessage(CommandError, "line 4: battery is required"):
+            self.run_import(inventory=broken)
+        with open(self.checkpoint) as f:
+            self.assertEqual(json.load(f)["inventory"]["rows"], 2)
+
+        rows[3] = json.dumps({"station": "S2", "battery": "B3"})
+        self.write("inventory.jsonl", "\n".join(rows) + "\n")
+        with mock.patch("battery.importer.add_station_batteries", wraps=add_station_batteries) as add:
+            self.run_import("--resume", inventory=broken)
+
+        # Only the two remaining chunks (rows 3-4 and 5) were written
+        self.assertEqual(add.call_count, 2)
+        self.assertEqual(Station.objects.get(external_id="S2").batteries.count(), 5)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class BroadcastOutboxTests(TestCase):
+    def tearDown(self):
+        # Next send starts a fresh sender with the default queue size
+        outbox.queue = None
+
+    def test_full_outbox_drops_instead_of_blocking(self):
+        release = threading.Event()
+
+        async def stalled_group_send(group, message):
+            release.wait(5)
+
+        layer = get_channel_layer()
+        with override_settings(WEBSOCKET_OUTBOX_SIZE=1), \
+                mock.patch.object(layer, "group_send", stalled_group_send):
+            outbox.queue = None
+            before = outbox.get_stats()
+
+            # The sender takes the first event and stalls on it
+            self.assertTrue(outbox.put("stations_all", {"type": "inventory_update"}))
+            while outbox.queue.qsize():
+                time.sleep(0.01)
+
+            self.assertTrue(outbox.put("stations_all", {"type": "inventory_update"}))
+            self.assertFalse(outbox.put("stations_all", {"type": "inventory_update"}))
+            self.assertEqual(outbox.get_stats()["queue_depth"], 1)
+
+            release.set()
+            self.assertTrue(outbox.join(timeout=5))
+
+        after = outbox.get_stats()
+        self.assertEqual(after["dropped"] - before["dropped"], 1)
+        self.assertEqual(after["sent"] - before["sent"], 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        response_cache.metrics.reset()
+        self.vehicle = Vehicle.objects.create(name="Ather 450X")
+        self.company = Company.objects.create(name="Volt")
+        Battery.objects.create(vehicle=self.vehicle, company=self.company, price=100)
+        self.client = APIClient()
+        self.client.force_authenticate(CustomUser.objects.create_user(
+            email="rider@example.com", name="Rider", username="rider@example.com",
+            user_type="consumer",
+        ))
+
+    def test_repeat_request_is_served_from_cache(self):
+        first = self.client.get(reverse("manage_batteries_list"))
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse("manage_batteries_list"))
+
+        self.assertEqual((first["X-Cache"], second["X-Cache"]), ("MISS", "HIT"))
+        self.assertEqual(first.content, second.content)
+        self.assertEqual(first["ETag"], second["ETag"])
+        self.assertEqual(json.loads(second.content)["total"], 1)
+        stats = response_cache.metrics.get_stats()["ListBatteries"]
+        self.assertEqual((stats["hits"], stats["misses"], stats["hit_ratio"]), (1, 1, 0.5))
+
+    def test_matching_etag_gets_not_modified(self):
+        etag = self.client.get(reverse("list_vehicles"))["ETag"]
+
+        response = self.client.get(reverse("list_vehicles"), HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["ETag"], etag)
+        self.assertEqual(response_cache.metrics.get_stats()["ListVehicles"]["not_modified"], 1)
+
+    def test_saving_a_dependency_retires_cached_responses(self):
+        vehicles = self.client.get(reverse("list_vehicles"))
+        batteries = self.client.get(reverse("manage_batteries"))
+
+        self.company.name = "Volt Energy"
+        self.company.save()
+
+        # Vehicles don't depend on companies
+        self.assertEqual(self.client.get(reverse("list_vehicles"))["X-Cache"], "HIT")
+        response = self.client.get(reverse("manage_batteries"), HTTP_IF_NONE_MATCH=batteries["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertNotEqual(response["ETag"], batteries["ETag"])
+        self.assertEqual(json.loads(response.content)["batteries"][0]["company"]["name"], "Volt Energy")
+
+        self.vehicle.delete()
+        response = self.client.get(reverse("list_vehicles"), HTTP_IF_NONE_MATCH=vehicles["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.content), [])
+
+    def test_error_responses_are_not_cached(self):
+        client = APIClient()
+        self.assertEqual(client.get(reverse("list_vehicles")).status_code, 401)
+        self.assertEqual(self.client.get(reverse("list_vehicles"))["X-Cache"], "MISS")
+
+    def test_stats_require_admin(self):
+        self.client.get(reverse("list_vehicles"))
+        self.assertEqual(self.client.get(reverse("response_cache_stats")).status_code, 403)
+
+        admin = CustomUser.objects.create_user(
+            email="admin@example.com", name="Admin", username="admin@example.com",
+            user_type="admin",
+        )
+        self.client.force_authenticate(admin)
+        response = self.client.get(reverse("response_cache_stats"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data["endpoints"]["ListVehicles"]["misses"], 1)
+
+
+class GeohashTests(SimpleTestCase):
+    def test_encode(self):
+        self.assertEqual(geohash.encode(57.64911, 10.40744, 11), "u4pruydqqvj")
+
+    def test_viewport_tiles_contain_points_inside(self):
+        tiles = geohash.tiles_for_viewport(9.9, 76.2, 10.1, 76.4, precision=4, max_tiles=64)
+        self.assertIn(geohash.encode(10.0, 76.3, 4), tiles)
+        self.assertIn(geohash.encode(9.9, 76.2, 4), tiles)
+        self.assertIn(geohash.encode(10.1, 76.4, 4), tiles)
+
+    def test_viewport_across_antimeridian(self):
+        tiles = geohash.tiles_for_viewport(-1, 179.9, 1, -179.9, precision=3, max_tiles=64)
+        self.assertIn(geohash.encode(0, 179.95, 3), tiles)
+        self.assertIn(geohash.encode(0, -179.95, 3), tiles)
+
+    def test_invalid_or_large_viewport_is_rejected(self):
+        with self.assertRaises(ValueError):
+            geohash.tiles_for_viewport(10, 0, 5, 1, precision=4, max_tiles=64)
+        with self.assertRaises(ValueError):
+            geohash.tiles_for_viewport(-60, -120, 60, 120, precision=4, max_tiles=64)
+
+
+@override_settings(
+    CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS,
+    WEBSOCKET_OUTBOX_ENABLED=False,
+    WEBSOCKET_LEGACY_STATIONS_ALL=False,
+)
+class ViewportSubscriptionTests(TransactionTestCase):
+    def setUp(self):
+        vehicle = Vehicle.objects.create(name="Ather 450X")
+        company = Company.objects.create(name="Volt")
+        self.station = Station.objects.create(name="Hub", latitude=10.0, longitude=76.3)
+        self.battery = Battery.objects.create(vehicle=vehicle, company=company, price=100)
+
+    def test_inventory_goes_to_station_tile_only(self):
+        tile_listener = GroupListener(get_tile_group(get_station_tile(self.station)))
+        far_listener = GroupListener(get_tile_group(geohash.encode(52.5, 13.4, 4)))
+        all_listener = GroupListener("stations_all")
+
+        self.station.batteries.add(self.battery)
+
+        messages = tile_listener.messages()
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(messages[0]["station_id"], self.station.pk)
+        self.assertEqual(far_listener.messages(), [])
+        self.assertEqual(all_listener.messages(), [])
+
+    def test_consumer_follows_viewport(self):
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                StationInventoryConsumer.as_asgi(),
+                "/ws/stations/?viewport=9.9,76.2,10.1,76.4",
+            )
+            communicator.scope["url_route"] = {"kwargs": {}}
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            welcome = await communicator.receive_json_from()
+            self.assertIn(get_station_tile(self.station), welcome["tiles"])
+            snapshot = await communicator.receive_json_from()
+            self.assertEqual(snapshot["type"], "snapshot")
+            self.assertEqual(
+                [station["station_id"] for station in snapshot["stations"]],
+                [self.station.pk],
+            )
+
+            # Moving the map away stops updates for this station
+            await communicator.send_json_to({
+                "type": "subscribe_viewport",
+                "viewport": {"south": 52.4, "west": 13.3, "north": 52.6, "east": 13.5},
+            })
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply["type"], "viewport_subscribed")
+            self.assertNotIn(get_station_tile(self.station), reply["tiles"])
+            snapshot = await communicator.receive_json_from()
+            self.assertEqual(snapshot["stations"], [])
+
+            await communicator.send_json_to({
+                "type": "subscribe_viewport",
+                "viewport": {"south": -60, "west": -120, "north": 60, "east": 120},
+            })
+            reply = await communicator.receive_json_from()
+            self.assertEqual(reply["type"], "error")
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    def test_station_snapshot_on_connect_and_resync(self):
+        self.station.batteries.add(self.battery)
+        seq = Station.objects.get(pk=self.station.pk).inventory_seq
+
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                StationInventoryConsumer.as_asgi(), f"/ws/stations/{self.station.pk}/"
+            )
+            communicator.scope["url_route"] = {"kwargs": {"station_id": str(self.station.pk)}}
+            await communicator.connect()
+            await communicator.receive_json_from()
+            expected = {
+                "type": "snapshot",
+                "stations": [{
+                    "station_id": self.station.pk,
+                    "available_batteries": 1,
+                    "booked_batteries": 0,
+                    "seq": seq,
+                }],
+                "truncated": False,
+                "next": None,
+            }
+            self.assertEqual(await communicator.receive_json_from(), expected)
+
+            await communicator.send_json_to({"type": "resync"})
+            self.assertEqual(await communicator.receive_json_from(), expected)
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
+
+    @override_settings(WEBSOCKET_MAX_SNAPSHOT_STATIONS=1)
+    def test_truncated_snapshot_pages_through_resync(self):
+        other = Station.objects.create(name="Depot", latitude=10.05, longitude=76.35)
+
+        async def scenario():
+            communicator = WebsocketCommunicator(
+                StationInventoryConsumer.as_asgi(),
+                f"/ws/stations/?stations={self.station.pk},{other.pk}",
+            )
+            communicator.scope["url_route"] = {"kwargs": {}}
+            await communicator.connect()
+            await communicator.receive_json_from()
+
+            first = await communicator.receive_json_from()
+            self.assertEqual([s["station_id"] for s in first["stations"]], [self.station.pk])
+            self.assertEqual((first["truncated"], first["next"]), (True, self.station.pk))
+
+            await communicator.send_json_to({"type": "resync", "after": first["next"]})
+            second = await communicator.receive_json_from()
+            self.assertEqual([s["station_id"] for s in second["stations"]], [other.pk])
+            self.assertEqual((second["truncated"], second["next"]), (False, None))
+            await communicator.disconnect()
+
+        async_to_sync(scenario)()
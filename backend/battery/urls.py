@@ -1,6 +1,8 @@
 from django.urls import path
 
 from battery.views import (
+    BroadcastStats,
+    BulkStationBatteries,
     FindStations,
     GetMyStation,
     GetStation,
@@ -16,6 +18,7 @@ from battery.views import (
     MyStations,
     MyStationBookings,
     MyStationStats,
+    ResponseCacheStats,
 )
 
 
@@ -37,6 +40,18 @@ urlpatterns = [
         ManageStationBatteries.as_view(),
         name="manage_stations_batteries",
     ),
+    path(
+        "station/batteries/<int:pk>/bulk/",
+        BulkStationBatteries.as_view(),
+        name="bulk_station_batteries",
+    ),
+    path(
+        "stations/batteries/bulk/",
+        BulkStationBatteries.as_view(),
+        name="bulk_stations_batteries",
+    ),
     path("station/get/<int:pk>/", GetStation.as_view(), name="get_station"),
     path("vehicle/<int:pk>/", ManageVehicle.as_view(), name="manage_vehicle"),
+    path("broadcast/stats/", BroadcastStats.as_view(), name="broadcast_stats"),
+    path("cache/stats/", ResponseCacheStats.as_view(), name="response_cache_stats"),
 ]
@@ -1,56 +1,235 @@
-from math import radians, asin, sqrt, sin, cos
+from math import radians, degrees, asin, sqrt, sin, cos
 from turtle import back
 
+import numpy as np
+from django.db.models import Q
+
+
+EARTH_RADIUS_KM = 6371
+# Average riding speed used for ETAs (45 km/h)
+AVERAGE_SPEED_M_PER_HR = 45000
+
+# Nearest-station search defaults (used when the client sends no ?limit=)
+DEFAULT_STATION_LIMIT = 50
+MAX_STATION_LIMIT = 500
+# First search ring for k-nearest queries; grown until enough stations are found
+INITIAL_SEARCH_RADIUS_KM = 5
+MAX_SEARCH_RADIUS_KM = 20038  # half of earth's circumference
+
 
 def closest(stations, currLoc):
-    return min(stations, key=lambda station: get_distance_btw(currLoc, station))
+    distances, _ = get_distances(
+        currLoc["latitude"],
+        currLoc["longitude"],
+        [station["latitude"] for station in stations],
+        [station["longitude"] for station in stations],
+    )
+    return stations[int(np.argmin(distances))]
 
 
-def get_distance_btw(currLoc, station) -> str:
-    # deg -> rad
-    station["longitude"] = radians(station["longitude"])
-    currLoc["longitude"] = radians(currLoc["longitude"])
-    station["latitude"] = radians(station["latitude"])
-    currLoc["latitude"] = radians(currLoc["latitude"])
+def get_distances(latitude, longitude, latitudes, longitudes):
+    """
+    Vectorized haversine from one point to many stations.
 
-    # Haversine formula
-    dlon = currLoc["longitude"] - station["longitude"]
-    dlat = currLoc["latitude"] - station["latitude"]
-    c = 2 * asin(
-        sqrt(
-            sin(dlat / 2) ** 2
-            + cos(station["latitude"]) * cos(currLoc["latitude"]) * sin(dlon / 2) ** 2
-        )
+    Args:
+        latitude: User latitude in degrees
+        longitude: User longitude in degrees
+        latitudes: Sequence/array of station latitudes in degrees
+        longitudes: Sequence/array of station longitudes in degrees
+
+    Returns:
+        tuple: (distances in metres, travel times in hours) as NumPy arrays
+    """
+    lats = np.radians(np.asarray(latitudes, dtype=np.float64))
+    lngs = np.radians(np.asarray(longitudes, dtype=np.float64))
+    lat0 = radians(latitude)
+    lng0 = radians(longitude)
+
+    a = (
+        np.sin((lats - lat0) / 2) ** 2
+        + cos(lat0) * np.cos(lats) * np.sin((lngs - lng0) / 2) ** 2
     )
+    distances = 2 * EARTH_RADIUS_KM * 1000 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+    return distances, distances / AVERAGE_SPEED_M_PER_HR
 
-    # radius of earth = 6371 km or 3956 miles
-    d_num = c * 6371 * 1000
-    t_num = d_num / 45000
 
+def format_distance(d_num):
     if d_num > 1000:
         d_str = round(d_num / 1000, 2)
-        d_str = str(d_str) + " km" + ("s" if d_str > 1 else "")
-    else:
-        d_str = round(d_num, 1)
-        d_str = str(d_str) + "  m" + ("s" if d_str > 1 else "")
+        return str(d_str) + " km" + ("s" if d_str > 1 else "")
+    d_str = round(d_num, 1)
+    return str(d_str) + "  m" + ("s" if d_str > 1 else "")
 
+
+def format_time(t_num):
     if t_num < 1 / 60:
-        t_str = round((t_num * 60 * 60), 2)
-        t_str = str(t_str) + " sec"
-    elif t_num < 1:
-        t_str = round((t_num * 60), 2)
-        t_str = str(t_str) + " min"
+        return str(round((t_num * 60 * 60), 2)) + " sec"
+    if t_num < 1:
+        return str(round((t_num * 60), 2)) + " min"
+    return str(round(t_num, 1)) + " hr"
+
+
+def haversine_distance(lat1, lng1, lat2, lng2):
+    """
+    Great-circle distance between two points given in degrees.
+
+    Returns:
+        float: Distance in metres
+    """
+    lat1, lng1, lat2, lng2 = map(radians, (lat1, lng1, lat2, lng2))
+    dlon = lng2 - lng1
+    dlat = lat2 - lat1
+    c = 2 * asin(
+        sqrt(sin(dlat / 2) ** 2 + cos(lat1) * cos(lat2) * sin(dlon / 2) ** 2)
+    )
+    return c * EARTH_RADIUS_KM * 1000
+
+
+def get_bounding_box_filter(latitude, longitude, radius_km, prefix=""):
+    """
+    Build a Q object selecting rows inside the lat/long box that encloses a
+    circle of ``radius_km`` around the given point. The box is a cheap,
+    index-friendly superset of the circle; callers still need the exact
+    haversine check on the rows it returns.
+
+    Args:
+        latitude: Centre latitude in degrees
+        longitude: Centre longitude in degrees
+        radius_km: Search radius in kilometres
+        prefix: Optional lookup prefix (e.g. "station__")
+
+    Returns:
+        Q: Filter on ``latitude``/``longitude``
+    """
+    angular = radius_km / EARTH_RADIUS_KM
+    min_lat = latitude - degrees(angular)
+    max_lat = latitude + degrees(angular)
+
+    lat_q = Q(**{f"{prefix}latitude__range": (max(min_lat, -90), min(max_lat, 90))})
+
+    # Box touches a pole: every longitude qualifies
+    if min_lat <= -90 or max_lat >= 90:
+        return lat_q
+
+    lng_delta = degrees(asin(min(1.0, sin(angular) / cos(radians(latitude)))))
+    min_lng = longitude - lng_delta
+    max_lng = longitude + lng_delta
+
+    if lng_delta >= 180:
+        return lat_q
+
+    # Split the box in two when it crosses the antimeridian
+    if min_lng < -180:
+        lng_q = Q(**{f"{prefix}longitude__gte": min_lng + 360}) | Q(
+            **{f"{prefix}longitude__lte": max_lng}
+        )
+    elif max_lng > 180:
+        lng_q = Q(**{f"{prefix}longitude__gte": min_lng}) | Q(
+            **{f"{prefix}longitude__lte": max_lng - 360}
+        )
     else:
-        t_str = round(t_num, 1)
-        t_str = str(t_str) + " hr"
-    return d_num, d_str, t_num, t_str
+        lng_q = Q(**{f"{prefix}longitude__range": (min_lng, max_lng)})
+
+    return lat_q & lng_q
+
 
+def get_viewport_filter(south, west, north, east, prefix=""):
+    """
+    Build a Q object selecting rows inside a map viewport.
 
-def get_station_data(station, userLat, userLong):
-    d_num, d_str, t_num, t_str = get_distance_btw(
-        {"latitude": userLat, "longitude": userLong},
-        {"latitude": station.latitude, "longitude": station.longitude},
+    Args:
+        south, west, north, east: Viewport bounds in degrees
+            (west > east means the viewport crosses the antimeridian)
+        prefix: Optional lookup prefix (e.g. "station__")
+
+    Returns:
+        Q: Filter on ``latitude``/``longitude``
+    """
+    lat_q = Q(**{f"{prefix}latitude__range": (south, north)})
+    if west <= east:
+        return lat_q & Q(**{f"{prefix}longitude__range": (west, east)})
+    return lat_q & (
+        Q(**{f"{prefix}longitude__gte": west}) | Q(**{f"{prefix}longitude__lte": east})
     )
+
+
+def _stations_within(queryset, latitude, longitude, radius_km):
+    """Return [(distance_m, pk)] for stations inside radius_km, nearest first."""
+    candidates = list(
+        queryset.filter(
+            get_bounding_box_filter(latitude, longitude, radius_km)
+        ).values_list("pk", "latitude", "longitude")
+    )
+    if not candidates:
+        return []
+
+    pks, lats, lngs = zip(*candidates)
+    pks = np.asarray(pks)
+    distances, _ = get_distances(latitude, longitude, lats, lngs)
+
+    inside = distances <= radius_km * 1000
+    pks, distances = pks[inside], distances[inside]
+    order = np.lexsort((pks, distances))
+    return [(float(distances[i]), int(pks[i])) for i in order]
+
+
+def find_nearest_stations(queryset, latitude, longitude, radius_km=None, limit=None):
+    """
+    Find the stations in ``queryset`` nearest to a point.
+
+    Only stations inside a bounding box around the point are loaded from the
+    database. With ``radius_km`` the box is fixed; without it the box starts
+    small and grows until ``limit`` stations are found (k-nearest search).
+
+    Args:
+        queryset: Station queryset to search in
+        latitude: User latitude in degrees
+        longitude: User longitude in degrees
+        radius_km: Optional maximum distance in kilometres
+        limit: Maximum number of stations to return
+
+    Returns:
+        list: [(distance_m, station_pk)] sorted by distance
+    """
+    if limit is None:
+        limit = DEFAULT_STATION_LIMIT
+
+    if radius_km is not None:
+        return _stations_within(queryset, latitude, longitude, radius_km)[:limit]
+
+    radius_km = INITIAL_SEARCH_RADIUS_KM
+    while True:
+        found = _stations_within(queryset, latitude, longitude, radius_km)
+        if len(found) >= limit or radius_km >= MAX_SEARCH_RADIUS_KM:
+            return found[:limit]
+        radius_km = min(radius_km * 4, MAX_SEARCH_RADIUS_KM)
+
+
+def get_distance_btw(currLoc, station):
+    d_num = haversine_distance(
+        currLoc["latitude"],
+        currLoc["longitude"],
+        station["latitude"],
+        station["longitude"],
+    )
+    t_num = d_num / AVERAGE_SPEED_M_PER_HR
+    return d_num, format_distance(d_num), t_num, format_time(t_num)
+
+
+def get_station_data(station, userLat, userLong, distance=None):
+    """
+    Serialize a station for the consumer app.
+
+    ``distance`` (metres) can be passed when it was already computed by the
+    batch engine so only the display strings are built here.
+    """
+    if distance is None:
+        distances, _ = get_distances(
+            userLat, userLong, [station.latitude], [station.longitude]
+        )
+        distance = float(distances[0])
+    time = distance / AVERAGE_SPEED_M_PER_HR
+
     batteries = []
     for battery in station.batteries.all():
         batteries.append(
@@ -67,10 +246,10 @@ def get_station_data(station, userLat, userLong):
         "latitude": station.latitude,
         "longitude": station.longitude,
         "batteries": batteries,
-        "distance": d_num,
-        "time": t_num,
-        "distance_msg": d_str,
-        "time_msg": t_str,
+        "distance": distance,
+        "time": time,
+        "distance_msg": format_distance(distance),
+        "time_msg": format_time(time),
     }
 
 
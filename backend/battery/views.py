@@ -1,11 +1,24 @@
-from batteryswap import config
+import os
+
+from batteryswap import config, response_cache
+from batteryswap.pagination import InvalidPage, paginate_queryset
+from batteryswap.response_cache import cached_response
 import razorpay
+from django.db import transaction
+from django.db.models import Count, Prefetch, Q, Sum
 from rest_framework import generics, views, status
 from rest_framework.response import Response
 
 from rest_framework.permissions import IsAuthenticated
 
-from battery.utils import get_battery_data, get_station_data
+from battery.utils import (
+    MAX_STATION_LIMIT,
+    find_nearest_stations,
+    get_battery_data,
+    get_station_data,
+)
+from battery.broadcast import outbox
+from battery.bulk import BulkInventoryError, add_station_batteries, read_inventory_items
 from battery.websocket_utils import broadcast_battery_added
 from consumer.models import Consumer
 from producer.models import Company
@@ -28,9 +41,22 @@ def is_consumer(user):
     return user.user_type == 'consumer'
 
 
+def is_admin(user):
+    return user.is_staff or user.user_type == 'admin'
+
+
+def station_batteries_prefetch():
+    """Prefetch a station's batteries with everything get_station_data reads"""
+    return Prefetch(
+        'batteries',
+        queryset=Battery.objects.select_related('vehicle', 'company'),
+    )
+
+
 class ManageBatteries(views.APIView):
     permission_classes = [IsAuthenticated]
     
+    @cached_response(Battery, Vehicle, Company)
     def get(self, request, *args, **kwargs):
         batteries = Battery.objects.select_related('vehicle', 'company').all()
         data = []
@@ -148,6 +174,7 @@ class ManageBattery(generics.RetrieveUpdateDestroyAPIView):
 class ListBatteries(views.APIView):
     permission_classes = [IsAuthenticated]
     
+    @cached_response(Battery, Vehicle, Company)
     def get(self, request, *args, **kwargs):
         batteries = Battery.objects.select_related('vehicle', 'company').all()
         data = []
@@ -175,11 +202,19 @@ class ManageVehicles(generics.ListCreateAPIView):
     serializer_class = VehicleSerializer
     queryset = Vehicle.objects.all()
 
+    @cached_response(Vehicle)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class ListVehicles(generics.ListAPIView):
     serializer_class = VehicleSerializer
     queryset = Vehicle.objects.all()
 
+    @cached_response(Vehicle)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class ManageVehicle(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = VehicleSerializer
@@ -272,10 +307,11 @@ class ManageStationBatteries(views.APIView):
                 )
             
             battery = Battery.objects.get(pk=battery_pk)
-            station.batteries.add(battery)
-            
-            # Broadcast battery added event via WebSocket
-            broadcast_battery_added(station, battery)
+            with transaction.atomic():
+                station.batteries.add(battery)
+                
+                # Broadcast battery added event via WebSocket
+                broadcast_battery_added(station, battery)
             
             return Response({
                 'success': True,
@@ -300,6 +336,84 @@ class ManageStationBatteries(views.APIView):
             )
 
 
+class BulkStationBatteries(views.APIView):
+    """
+    Add many batteries to the producer's stations in one request
+    Body: JSON {"batteries": [...]} or {"items": [{"station", "battery"}]},
+    or a text/csv (station,battery columns) or application/x-ndjson stream.
+    With a station pk in the URL, items may leave out the station and
+    must not name any other.
+    """
+    permission_classes = [IsAuthenticated]
+    
+    def post(self, request, *args, **kwargs):
+        if request.user.user_type != 'producer':
+            return Response(
+                {'success': False, 'message': 'Only producers can manage station batteries'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        try:
+            url_station = kwargs.get('pk')
+            items = read_inventory_items(request, default_station=url_station)
+            if not items:
+                raise BulkInventoryError('No batteries given')
+            # The URL's station is the one being authorized; items may
+            # not name another
+            if url_station is not None and any(
+                station_id != url_station for station_id, _ in items
+            ):
+                raise BulkInventoryError(f'All items must be for station {url_station}')
+            
+            # Every ID is checked with one query per table
+            station_ids = {station_id for station_id, _ in items}
+            battery_ids = {battery_id for _, battery_id in items}
+            stations = Station.objects.filter(pk__in=station_ids, owner__user=request.user)
+            stations = {station.pk: station for station in stations}
+            known_batteries = set(
+                Battery.objects.filter(pk__in=battery_ids).values_list('pk', flat=True)
+            )
+            missing_stations = sorted(station_ids - stations.keys())
+            missing_batteries = sorted(battery_ids - known_batteries)
+            if missing_stations or missing_batteries:
+                return Response(
+                    {
+                        'success': False,
+                        'message': 'Unknown stations or batteries',
+                        'missing_stations': missing_stations[:100],
+                        'missing_batteries': missing_batteries[:100],
+                    },
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            
+            batteries_by_station = {station: [] for station in stations.values()}
+            for station_id, battery_id in items:
+                batteries_by_station[stations[station_id]].append(battery_id)
+            with transaction.atomic():
+                added = add_station_batteries(batteries_by_station)
+            
+            total_added = sum(len(battery_ids) for battery_ids in added.values())
+            return Response({
+                'success': True,
+                'message': f'Added {total_added} batteries to {len(added)} stations',
+                'added': total_added,
+                'skipped': len(items) - total_added,
+                'stations': {
+                    station_id: len(battery_ids) for station_id, battery_ids in added.items()
+                },
+            })
+        except BulkInventoryError as e:
+            return Response(
+                {'success': False, 'message': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except Exception as e:
+            return Response(
+                {'success': False, 'message': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+
 class FindStations(views.APIView):
     permission_classes = [IsAuthenticated]
     
@@ -332,28 +446,38 @@ class FindStations(views.APIView):
                 longitude = 76.3310651
             latitude = float(latitude)
             longitude = float(longitude)
+            radius_km = request.query_params.get("radius_km")
+            radius_km = float(radius_km) if radius_km else None
+            limit = request.query_params.get("limit")
+            limit = min(int(limit), MAX_STATION_LIMIT) if limit else None
+            if (radius_km is not None and radius_km <= 0) or (limit is not None and limit <= 0):
+                raise ValueError("radius_km and limit must be positive")
         except (ValueError, TypeError):
             return Response(
                 data={"success": False, "message": "Invalid location parameters", "stations": []},
                 status=status.HTTP_400_BAD_REQUEST,
             )
         
-        # Get all stations
-        stations = Station.objects.all()
-        
-        # Filter stations by vehicle compatibility
-        batteries = Battery.objects.filter(vehicle=consumer.vehicle)
-        stations_data = []
-        
-        for station in stations:
-            # Check if station has batteries compatible with user's vehicle
-            if any(battery in batteries for battery in station.batteries.all()):
-                stations_data.append(
-                    get_station_data(station, latitude, longitude)
-                )
+        # Stations holding an available battery compatible with the user's
+        # vehicle, read from the maintained CompatibleStation index
+        stations = Station.objects.filter(
+            compatible_vehicles__vehicle_id=consumer.vehicle_id,
+            compatible_vehicles__available_batteries__gt=0,
+        )
         
-        # Sort by distance
-        stations_data.sort(key=lambda station: station["distance"])
+        # Nearest stations via bounding-box prefilter + batched haversine;
+        # display strings are only built for the stations returned
+        nearest = find_nearest_stations(
+            stations, latitude, longitude, radius_km=radius_km, limit=limit
+        )
+        stations_by_pk = Station.objects.prefetch_related(
+            station_batteries_prefetch()
+        ).in_bulk([pk for _, pk in nearest])
+        stations_data = [
+            get_station_data(stations_by_pk[pk], latitude, longitude, distance)
+            for distance, pk in nearest
+            if pk in stations_by_pk
+        ]
         
         return Response(
             data={"success": True, "stations": stations_data},
@@ -367,7 +491,9 @@ class GetStation(views.APIView):
     
     def get(self, request, *args, **kwargs):
         try:
-            station = Station.objects.get(pk=kwargs["pk"])
+            station = Station.objects.prefetch_related(
+                station_batteries_prefetch()
+            ).get(pk=kwargs["pk"])
             return Response(
                 data={
                     "success": True,
@@ -499,14 +625,13 @@ class MyStations(views.APIView):
             
             data = []
             for station in stations:
-                batteries = station.batteries.all()
                 data.append({
                     'pk': station.pk,
                     'name': station.name,
                     'latitude': station.latitude,
                     'longitude': station.longitude,
-                    'total_batteries': batteries.count(),
-                    'available_batteries': batteries.count(),
+                    'total_batteries': station.available_battery_count + station.booked_battery_count,
+                    'available_batteries': station.available_battery_count,
                 })
             
             return Response({
@@ -540,11 +665,15 @@ class MyStationBookings(views.APIView):
             stations = Station.objects.filter(owner=producer)
             station_ids = stations.values_list('pk', flat=True)
             
-            orders = Order.objects.filter(
-                station__pk__in=station_ids
-            ).select_related(
-                'battery', 'battery__vehicle', 'battery__company', 'station'
-            ).order_by('-booked_time')
+            orders, page = paginate_queryset(
+                request,
+                Order.objects.filter(
+                    station__pk__in=station_ids
+                ).select_related(
+                    'battery', 'battery__vehicle', 'battery__company', 'station'
+                ),
+                ('-booked_time', '-pk'),
+            )
             
             data = []
             for order in orders:
@@ -561,8 +690,13 @@ class MyStationBookings(views.APIView):
             return Response({
                 'success': True,
                 'bookings': data,
-                'total': len(data)
+                **page
             })
+        except InvalidPage as e:
+            return Response(
+                {'success': False, 'message': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             return Response(
                 {'success': False, 'message': str(e)},
@@ -590,19 +724,20 @@ class MyStationStats(views.APIView):
             station_ids = stations.values_list('pk', flat=True)
             orders = Order.objects.filter(station__pk__in=station_ids)
             
-            total_revenue = sum(
-                o.battery.price for o in orders if o.battery and o.is_paid
+            totals = orders.aggregate(
+                total_bookings=Count('pk'),
+                total_revenue=Sum('battery__price', filter=Q(is_paid=True)),
+                paid_bookings=Count('pk', filter=Q(is_paid=True)),
+                collected_bookings=Count('pk', filter=Q(is_collected=True)),
+                pending_bookings=Count('pk', filter=Q(is_collected=False, is_expired=False)),
             )
             
             return Response({
                 'success': True,
                 'stats': {
                     'total_stations': stations.count(),
-                    'total_bookings': orders.count(),
-                    'total_revenue': total_revenue,
-                    'paid_bookings': orders.filter(is_paid=True).count(),
-                    'collected_bookings': orders.filter(is_collected=True).count(),
-                    'pending_bookings': orders.filter(is_collected=False).count(),
+                    **totals,
+                    'total_revenue': totals['total_revenue'] or 0,
                 }
             })
         except Exception as e:
@@ -610,3 +745,39 @@ class MyStationStats(views.APIView):
                 {'success': False, 'message': str(e)},
                 status=status.HTTP_400_BAD_REQUEST
             )
+
+
+class BroadcastStats(views.APIView):
+    """WebSocket broadcast outbox metrics for this worker process"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, *args, **kwargs):
+        if not is_admin(request.user):
+            return Response(
+                {'success': False, 'message': 'Admin access required'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        return Response({
+            'success': True,
+            'pid': os.getpid(),
+            'outbox': outbox.get_stats(),
+        })
+
+
+class ResponseCacheStats(views.APIView):
+    """Catalog response cache hit/miss metrics for this worker process"""
+    permission_classes = [IsAuthenticated]
+    
+    def get(self, request, *args, **kwargs):
+        if not is_admin(request.user):
+            return Response(
+                {'success': False, 'message': 'Admin access required'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        return Response({
+            'success': True,
+            'pid': os.getpid(),
+            'endpoints': response_cache.metrics.get_stats(),
+        })
@@ -1,16 +1,31 @@
 """
 Utility functions for WebSocket broadcasting
 Helper functions to send real-time updates to connected clients
+
+Events raised inside a transaction are delivered on commit, with all
+inventory events for a station collapsed into one message
+(see battery/broadcast.py). Payloads are encoded to JSON once per event,
+not once per connected client.
 """
 
-from channels.layers import get_channel_layer
-from asgiref.sync import async_to_sync
 from datetime import datetime
 
+from battery.broadcast import (
+    encode_event,
+    get_map_groups,
+    queue_group_event,
+    queue_station_event,
+)
+
 
 def get_station_inventory_data(station):
     """
     Get current inventory data for a station.
+    Reads the denormalized Station counters, so no COUNT queries are run.
+    
+    The data also describes the last change as a delta: 'seq' is the
+    station's inventory sequence, 'prev_seq' the sequence it was applied on
+    and the '*_delta' keys the change in counts.
     
     Args:
         station: Station model instance
@@ -18,16 +33,59 @@ def get_station_inventory_data(station):
     Returns:
         dict: Inventory data
     """
+    available = station.available_battery_count
+    booked = station.booked_battery_count
+    # Set by update_station_counters when this instance changed the counts
+    before = getattr(station, 'inventory_before', None) or {
+        'available_battery_count': available,
+        'booked_battery_count': booked,
+        'inventory_seq': station.inventory_seq,
+    }
     return {
         'station_id': station.pk,
         'station_name': station.name,
-        'available_batteries': station.batteries.count(),
-        'booked_batteries': station.booked_batteries.count(),
-        'total_batteries': station.batteries.count() + station.booked_batteries.count(),
+        'available_batteries': available,
+        'booked_batteries': booked,
+        'total_batteries': available + booked,
+        'seq': station.inventory_seq,
+        'prev_seq': before['inventory_seq'],
+        'available_delta': available - before['available_battery_count'],
+        'booked_delta': booked - before['booked_battery_count'],
         'timestamp': datetime.now().isoformat()
     }
 
 
+def get_inventory_snapshot(stations, limit=None, after=None):
+    """
+    Get the current counts of some stations in one query.
+    
+    Args:
+        stations: Station queryset to snapshot
+        limit: Maximum number of stations (None for no limit)
+        after: Only stations with a higher pk (the previous page's last)
+        
+    Returns:
+        list: {'station_id', 'available_batteries', 'booked_batteries',
+        'seq'} per station, in pk order
+    """
+    if after is not None:
+        stations = stations.filter(pk__gt=after)
+    rows = stations.order_by('pk').values_list(
+        'pk', 'available_battery_count', 'booked_battery_count', 'inventory_seq'
+    )
+    if limit is not None:
+        rows = rows[:limit]
+    return [
+        {
+            'station_id': pk,
+            'available_batteries': available,
+            'booked_batteries': booked,
+            'seq': seq,
+        }
+        for pk, available, booked, seq in rows
+    ]
+
+
 def broadcast_inventory_update(station, action='update'):
     """
     Broadcast inventory update to all clients subscribed to this station.
@@ -36,29 +94,15 @@ def broadcast_inventory_update(station, action='update'):
         station: Station model instance
         action: Type of action ('update', 'add', 'book', 'collect')
     """
-    channel_layer = get_channel_layer()
-    
     # Get inventory data
     data = get_station_inventory_data(station)
     data['action'] = action
     
-    # Broadcast to specific station group
-    async_to_sync(channel_layer.group_send)(
-        f'station_{station.pk}',
-        {
-            'type': 'inventory_update',
-            **data
-        }
-    )
-    
-    # Also broadcast to all stations group
-    async_to_sync(channel_layer.group_send)(
-        'stations_all',
-        {
-            'type': 'inventory_update',
-            **data
-        }
-    )
+    # Broadcast to the station group and the all stations group
+    queue_station_event(station, {
+        'type': 'inventory_update',
+        **data
+    })
 
 
 def broadcast_battery_booked(station, battery, user=None):
@@ -70,8 +114,6 @@ def broadcast_battery_booked(station, battery, user=None):
         battery: Battery model instance
         user: User who booked (optional)
     """
-    channel_layer = get_channel_layer()
-    
     data = get_station_inventory_data(station)
     data.update({
         'battery_id': battery.pk,
@@ -79,25 +121,14 @@ def broadcast_battery_booked(station, battery, user=None):
     })
     
     # Broadcast to station groups
-    async_to_sync(channel_layer.group_send)(
-        f'station_{station.pk}',
-        {
-            'type': 'battery_booked',
-            **data
-        }
-    )
-    
-    async_to_sync(channel_layer.group_send)(
-        'stations_all',
-        {
-            'type': 'battery_booked',
-            **data
-        }
-    )
+    queue_station_event(station, {
+        'type': 'battery_booked',
+        **data
+    })
     
     # Send personal notification to user
     if user:
-        async_to_sync(channel_layer.group_send)(
+        queue_group_event(
             f'user_{user.pk}',
             {
                 'type': 'booking_confirmed',
@@ -118,27 +149,14 @@ def broadcast_battery_collected(station, battery):
         station: Station model instance
         battery: Battery model instance
     """
-    channel_layer = get_channel_layer()
-    
     data = get_station_inventory_data(station)
     data['battery_id'] = battery.pk
     
     # Broadcast to station groups
-    async_to_sync(channel_layer.group_send)(
-        f'station_{station.pk}',
-        {
-            'type': 'battery_collected',
-            **data
-        }
-    )
-    
-    async_to_sync(channel_layer.group_send)(
-        'stations_all',
-        {
-            'type': 'battery_collected',
-            **data
-        }
-    )
+    queue_station_event(station, {
+        'type': 'battery_collected',
+        **data
+    })
 
 
 def broadcast_battery_added(station, battery):
@@ -149,27 +167,14 @@ def broadcast_battery_added(station, battery):
         station: Station model instance
         battery: Battery model instance
     """
-    channel_layer = get_channel_layer()
-    
     data = get_station_inventory_data(station)
     data['battery_id'] = battery.pk
     
     # Broadcast to station groups
-    async_to_sync(channel_layer.group_send)(
-        f'station_{station.pk}',
-        {
-            'type': 'battery_added',
-            **data
-        }
-    )
-    
-    async_to_sync(channel_layer.group_send)(
-        'stations_all',
-        {
-            'type': 'battery_added',
-            **data
-        }
-    )
+    queue_station_event(station, {
+        'type': 'battery_added',
+        **data
+    })
 
 
 def broadcast_station_status(station, status, message=None):
@@ -181,8 +186,6 @@ def broadcast_station_status(station, status, message=None):
         status: Status string ('online', 'offline', 'maintenance')
         message: Optional message
     """
-    channel_layer = get_channel_layer()
-    
     data = {
         'station_id': station.pk,
         'station_name': station.name,
@@ -191,22 +194,14 @@ def broadcast_station_status(station, status, message=None):
         'timestamp': datetime.now().isoformat()
     }
     
-    # Broadcast to station groups
-    async_to_sync(channel_layer.group_send)(
-        f'station_{station.pk}',
-        {
-            'type': 'station_status',
-            **data
-        }
-    )
-    
-    async_to_sync(channel_layer.group_send)(
-        'stations_all',
-        {
-            'type': 'station_status',
-            **data
-        }
-    )
+    # Broadcast to station groups, encoding the payload once for all of them
+    event = encode_event({
+        'type': 'station_status',
+        **data
+    })
+    queue_group_event(f'station_{station.pk}', event)
+    for group in get_map_groups(station):
+        queue_group_event(group, event)
 
 
 def send_user_notification(user, title, message, level='info'):
@@ -219,9 +214,7 @@ def send_user_notification(user, title, message, level='info'):
         message: Notification message
         level: Notification level ('info', 'success', 'warning', 'error')
     """
-    channel_layer = get_channel_layer()
-    
-    async_to_sync(channel_layer.group_send)(
+    queue_group_event(
         f'user_{user.pk}',
         {
             'type': 'notification',
@@ -242,9 +235,7 @@ def notify_booking_ready(user, booking_id, station_name):
         booking_id: Booking ID
         station_name: Station name
     """
-    channel_layer = get_channel_layer()
-    
-    async_to_sync(channel_layer.group_send)(
+    queue_group_event(
         f'user_{user.pk}',
         {
             'type': 'booking_ready',
@@ -0,0 +1,18 @@
+"""
+Celery application for background and scheduled tasks
+Run with: celery -A batteryswap worker / celery -A batteryswap beat
+"""
+
+import os
+
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'batteryswap.settings.development')
+
+app = Celery('batteryswap')
+
+# Read CELERY_* settings from Django settings
+app.config_from_object('django.conf:settings', namespace='CELERY')
+
+# Find tasks.py in installed apps
+app.autodiscover_tasks()
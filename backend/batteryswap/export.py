@@ -0,0 +1,197 @@
+"""
+Streaming CSV/NDJSON exports
+Rows are read through a server-side cursor (QuerySet.iterator) and encoded
+while they are read, so an export of any size runs in constant memory.
+
+Usage in a DRF view (with content_negotiation_class = ExportContentNegotiation):
+    fmt, since, until = get_export_params(request)
+    return export_response(request, queryset, BOOKING_COLUMNS, fmt, 'bookings')
+"""
+
+import csv
+import datetime
+import itertools
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+from rest_framework.negotiation import DefaultContentNegotiation
+
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+CONTENT_TYPES = {
+    'csv': 'text/csv; charset=utf-8',
+    'ndjson': 'application/x-ndjson',
+}
+
+# Rows fetched from the database cursor at a time
+CURSOR_CHUNK_SIZE = 2000
+
+# Rows encoded into each piece of the response body
+ROWS_PER_PIECE = 500
+
+# Spreadsheet apps run cells starting with these as formulas
+FORMULA_PREFIXES = ('=', '+', '-', '@')
+
+
+class InvalidExport(ValueError):
+    """Unknown format or malformed date range"""
+
+
+class ExportContentNegotiation(DefaultContentNegotiation):
+    """
+    Leaves ?format= to the export view instead of picking a DRF renderer
+    by it; error responses are rendered with the view's first renderer.
+    """
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def _parse_date(request, name):
+    value = request.query_params.get(name)
+    if not value:
+        return None
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise InvalidExport(f'{name} must be a date (YYYY-MM-DD)')
+
+
+def get_export_params(request):
+    """
+    Read ?format= (csv or ndjson), ?from= and ?to= (inclusive local dates).
+
+    Returns:
+        tuple: (format, from date or None, to date or None)
+
+    Raises:
+        InvalidExport: For an unknown format or a malformed date
+    """
+    fmt = request.query_params.get('format', 'csv')
+    if fmt not in EXPORT_FORMATS:
+        raise InvalidExport(f'format must be one of: {", ".join(EXPORT_FORMATS)}')
+    since, until = _parse_date(request, 'from'), _parse_date(request, 'to')
+    if since and until and since > until:
+        raise InvalidExport('from must not be after to')
+    return fmt, since, until
+
+
+def get_datetime_range(field, since, until):
+    """
+    Filter kwargs selecting a datetime field within local dates.
+
+    Args:
+        field: Datetime field name, e.g. 'booked_time'
+        since: First day (or None)
+        until: Last day, inclusive (or None)
+
+    Returns:
+        dict: Lookups for QuerySet.filter()
+    """
+    tz = timezone.get_current_timezone()
+    lookups = {}
+    if since:
+        lookups[f'{field}__gte'] = timezone.make_aware(
+            datetime.datetime.combine(since, datetime.time.min), tz
+        )
+    if until:
+        lookups[f'{field}__lt'] = timezone.make_aware(
+            datetime.datetime.combine(until + datetime.timedelta(days=1), datetime.time.min), tz
+        )
+    return lookups
+
+
+def _format_value(value):
+    if isinstance(value, datetime.datetime):
+        return timezone.localtime(value).isoformat()
+    if isinstance(value, datetime.date):
+        return value.isoformat()
+    return value
+
+
+class _Echo:
+    """File-like object csv.writer writes to; returns each line"""
+
+    def write(self, value):
+        return value
+
+
+def _csv_cell(value):
+    value = _format_value(value)
+    if value is None:
+        return ''
+    if isinstance(value, str) and value.startswith(FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def encode_rows(rows, headers, fmt):
+    """
+    Encode row tuples as CSV (with a header line) or NDJSON.
+
+    Yields:
+        str: Pieces of the body, ROWS_PER_PIECE rows each
+    """
+    if fmt == 'csv':
+        writer = csv.writer(_Echo())
+        yield writer.writerow(headers)
+
+        def encode(row):
+            return writer.writerow([_csv_cell(value) for value in row])
+    else:
+        def encode(row):
+            values = {header: _format_value(value) for header, value in zip(headers, row)}
+            return json.dumps(values) + '\n'
+
+    while True:
+        piece = ''.join(encode(row) for row in itertools.islice(rows, ROWS_PER_PIECE))
+        if not piece:
+            return
+        yield piece
+
+
+async def _iterate_in_thread(iterator):
+    """
+    Async iterator over a sync one. Under ASGI, Django would otherwise
+    read a sync iterator to the end before sending anything. Each step
+    runs in the request's sync thread, so the database cursor stays on
+    one connection.
+    """
+    sentinel = object()
+    get_next = sync_to_async(next, thread_sensitive=True)
+    while True:
+        piece = await get_next(iterator, sentinel)
+        if piece is sentinel:
+            return
+        yield piece
+
+
+def export_response(request, queryset, columns, fmt, filename):
+    """
+    Stream a queryset as a CSV or NDJSON download.
+
+    Args:
+        request: DRF request
+        queryset: Ordered queryset to export
+        columns: (header, field lookup) pairs, e.g. ('user_email', 'user__email')
+        fmt: 'csv' or 'ndjson'
+        filename: Download name, without extension
+
+    Returns:
+        StreamingHttpResponse
+    """
+    headers = [header for header, _ in columns]
+    rows = queryset.values_list(*[field for _, field in columns]).iterator(
+        chunk_size=CURSOR_CHUNK_SIZE
+    )
+    body = encode_rows(rows, headers, fmt)
+    if isinstance(request._request, ASGIRequest):
+        body = _iterate_in_thread(body)
+
+    response = StreamingHttpResponse(body, content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{fmt}"'
+    return response
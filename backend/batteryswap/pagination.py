@@ -0,0 +1,225 @@
+"""
+Keyset (cursor) pagination for list endpoints
+Pages are selected with a WHERE on the ordering key of the last row seen,
+so deep pages cost the same as the first one, and the total count can be
+estimated from the query planner instead of running COUNT(*).
+
+Usage in a view:
+    items, page = paginate_queryset(request, queryset, ('-booked_time', '-pk'))
+    return Response({'success': True, 'orders': [...items...], **page})
+"""
+
+import base64
+import binascii
+import json
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db import connections
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+# Estimates below this are replaced by an exact (cheap) COUNT
+EXACT_COUNT_THRESHOLD = 1000
+
+COUNT_MODES = ('estimated', 'exact', 'none')
+
+
+class InvalidPage(ValueError):
+    """Malformed cursor, page size or count mode"""
+
+
+def _parse_ordering(ordering):
+    return [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+
+
+def _get_field(queryset, name):
+    """Model field, or output field of an annotation, ordered by name"""
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    model = queryset.model
+    return model._meta.pk if name == 'pk' else model._meta.get_field(name)
+
+
+def _get_value(obj, name):
+    try:
+        field = obj._meta.pk if name == 'pk' else obj._meta.get_field(name)
+    except FieldDoesNotExist:
+        # Annotation, e.g. a per-row aggregate
+        return getattr(obj, name)
+    return getattr(obj, field.attname)
+
+
+def encode_cursor(obj, ordering):
+    """
+    Opaque cursor pointing just past a row.
+
+    Args:
+        obj: Last model instance of the page
+        ordering: Ordering the page was read with
+
+    Returns:
+        str: URL-safe cursor
+    """
+    values = []
+    for name, _ in _parse_ordering(ordering):
+        value = _get_value(obj, name)
+        # isoformat keeps microseconds, which the keyset comparison needs
+        values.append(value.isoformat() if hasattr(value, 'isoformat') else value)
+    return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, queryset, ordering):
+    """
+    Read the key values out of a cursor.
+
+    Args:
+        cursor: Cursor from encode_cursor
+        queryset: Queryset being paged (for field and annotation types)
+        ordering: Ordering the page is read with
+
+    Raises:
+        InvalidPage: If the cursor is malformed or for another ordering
+    """
+    fields = _parse_ordering(ordering)
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(fields):
+            raise ValueError
+        return [
+            _get_field(queryset, name).to_python(value)
+            for (name, _), value in zip(fields, values)
+        ]
+    except (ValueError, TypeError, binascii.Error) as e:
+        raise InvalidPage('Invalid cursor') from e
+
+
+def keyset_filter(ordering, values):
+    """
+    Rows after the given key in the given ordering, e.g. for
+    ('-booked_time', '-pk'): booked_time < t OR (booked_time = t AND pk < k)
+
+    Names may be annotations; Django applies the condition in HAVING when
+    they are aggregates.
+    """
+    condition = Q()
+    equal = {}
+    for (name, descending), value in zip(_parse_ordering(ordering), values):
+        lookup = 'lt' if descending else 'gt'
+        condition |= Q(**equal, **{f'{name}__{lookup}': value})
+        equal[name] = value
+    return condition
+
+
+def count_queryset(queryset, mode='estimated'):
+    """
+    Count the rows of a queryset.
+
+    Args:
+        queryset: Unsliced queryset
+        mode: 'exact' (COUNT), 'estimated' (planner row estimate on
+            PostgreSQL, exact elsewhere or for small results) or 'none'
+
+    Returns:
+        tuple: (count or None, is_estimate)
+    """
+    if mode == 'none':
+        return None, False
+    if mode == 'estimated' and connections[queryset.db].vendor == 'postgresql':
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        estimate = int(plan[0]['Plan']['Plan Rows'])
+        if estimate >= EXACT_COUNT_THRESHOLD:
+            return estimate, True
+    return queryset.count(), False
+
+
+def get_page_size(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Read ?page_size=, capped at maximum.
+
+    Raises:
+        InvalidPage: If it isn't a positive integer
+    """
+    try:
+        page_size = int(request.query_params.get('page_size', default))
+    except (TypeError, ValueError):
+        raise InvalidPage('page_size must be an integer')
+    if page_size < 1:
+        raise InvalidPage('page_size must be positive')
+    return min(page_size, maximum)
+
+
+def get_count_mode(request, default='estimated'):
+    """
+    Read ?count= (estimated, exact or none).
+
+    Raises:
+        InvalidPage: For an unknown mode
+    """
+    mode = request.query_params.get('count', default)
+    if mode not in COUNT_MODES:
+        raise InvalidPage(f'count must be one of: {", ".join(COUNT_MODES)}')
+    return mode
+
+
+def get_ordering(request, allowed, default):
+    """
+    Read ?ordering= (a name from allowed, '-' for descending), made
+    unique by a pk tie-breaker in the same direction.
+
+    Raises:
+        InvalidPage: For a name that isn't allowed
+    """
+    ordering = request.query_params.get('ordering', default)
+    name = ordering.lstrip('-')
+    if name not in allowed:
+        raise InvalidPage(f'ordering must be one of: {", ".join(allowed)}')
+    if name == 'pk':
+        return (ordering,)
+    return (ordering, '-pk' if ordering.startswith('-') else 'pk')
+
+
+def paginate_queryset(request, queryset, ordering, default_page_size=DEFAULT_PAGE_SIZE):
+    """
+    Read one page of a queryset, after ?cursor= if given.
+
+    The ordering must be unique (end it with 'pk') and should match an
+    index so each page is an index range scan.
+
+    Args:
+        request: DRF request (cursor, page_size and count query params)
+        queryset: Queryset to page through
+        ordering: Field or annotation names, '-' for descending,
+            e.g. ('-booked_time', '-pk')
+        default_page_size: Page size when ?page_size= is not given
+
+    Returns:
+        tuple: (list of instances, dict with 'next_cursor', 'has_next',
+        'page_size', 'total' and 'total_is_estimate')
+
+    Raises:
+        InvalidPage: For a malformed cursor, page size or count mode
+    """
+    page_size = get_page_size(request, default_page_size)
+    total, is_estimate = count_queryset(queryset, get_count_mode(request))
+
+    page = queryset.order_by(*ordering)
+    cursor = request.query_params.get('cursor')
+    if cursor:
+        page = page.filter(keyset_filter(ordering, decode_cursor(cursor, queryset, ordering)))
+
+    # One extra row tells whether there is a next page
+    items = list(page[:page_size + 1])
+    has_next = len(items) > page_size
+    items = items[:page_size]
+
+    return items, {
+        'next_cursor': encode_cursor(items[-1], ordering) if has_next else None,
+        'has_next': has_next,
+        'page_size': page_size,
+        'total': total,
+        'total_is_estimate': is_estimate,
+    }
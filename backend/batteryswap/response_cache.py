@@ -0,0 +1,171 @@
+"""
+Versioned response cache for read-mostly catalog endpoints
+Every cached model has a generation counter in the cache. A response is
+stored under a key naming the generations of the models it was built
+from, so bumping a model's generation (from its post_save/post_delete
+signals) retires every response that depends on it without finding or
+deleting them; they expire after RESPONSE_CACHE_TTL.
+
+Responses carry an ETag (a hash of the body); a request whose
+If-None-Match matches gets a 304 without the body.
+
+Usage on a view method:
+    @cached_response(Battery, Vehicle, Company)
+    def get(self, request, *args, **kwargs):
+        ...
+
+Only for GET handlers whose response is the same for every user who may
+see it.
+"""
+
+import functools
+import hashlib
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.http import HttpResponse
+from django.utils.cache import get_conditional_response, patch_cache_control
+from rest_framework import status
+
+
+KEY_PREFIX = 'response_cache'
+
+
+def get_generation_key(model):
+    return f'{KEY_PREFIX}:generation:{model._meta.label_lower}'
+
+
+def get_generations(models):
+    """
+    Current generation of each model, in one cache round trip.
+
+    Returns:
+        list: Generations, in the order of models
+    """
+    keys = [get_generation_key(model) for model in models]
+    generations = cache.get_many(keys)
+    for key in keys:
+        if key not in generations:
+            # Start from the clock rather than 0, so a counter evicted from
+            # the cache never comes back to a number already used
+            cache.add(key, time.time_ns(), timeout=None)
+            generations[key] = cache.get(key)
+    return [generations[key] for key in keys]
+
+
+def bump_generation(model):
+    """Move a model's cached responses to a new generation"""
+    key = get_generation_key(model)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # No counter yet; the next read starts one
+        pass
+
+
+def invalidate_cached_responses(model):
+    """
+    Retire the cached responses built from a model, now and again once the
+    current transaction commits (so a concurrent read can't cache old data
+    under the new generation).
+    """
+    bump_generation(model)
+    transaction.on_commit(lambda: bump_generation(model))
+
+
+def get_response_key(name, request, models):
+    """Cache key of a response: endpoint, URL, media type and generations"""
+    generations = '.'.join(str(generation) for generation in get_generations(models))
+    variant = f'{request.get_full_path()}|{request.accepted_media_type}'
+    digest = hashlib.sha1(variant.encode()).hexdigest()
+    return f'{KEY_PREFIX}:{name}:{digest}:{generations}'
+
+
+def get_cache_ttl():
+    return getattr(settings, 'RESPONSE_CACHE_TTL', 3600)
+
+
+class ResponseCacheMetrics:
+    """Hit, miss and 304 counters per endpoint for this worker process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.stats = defaultdict(Counter)
+
+    def count(self, name, stat):
+        with self.lock:
+            self.stats[name][stat] += 1
+
+    def get_stats(self):
+        """Counters and hit ratio of every endpoint served so far"""
+        with self.lock:
+            stats = {}
+            for name, counts in sorted(self.stats.items()):
+                lookups = counts['hits'] + counts['misses']
+                stats[name] = {
+                    'hits': counts['hits'],
+                    'misses': counts['misses'],
+                    'not_modified': counts['not_modified'],
+                    'hit_ratio': round(counts['hits'] / lookups, 3) if lookups else None,
+                }
+        return stats
+
+    def reset(self):
+        with self.lock:
+            self.stats.clear()
+
+
+metrics = ResponseCacheMetrics()
+
+
+def cached_response(*models):
+    """
+    Cache the rendered 200 responses of a view method.
+
+    Args:
+        *models: Models the response is built from; saving or deleting
+            any of them retires it
+
+    Returns:
+        Decorator for a DRF view method (runs after authentication and
+        permission checks)
+    """
+    def decorator(handler):
+        @functools.wraps(handler)
+        def wrapper(view, request, *args, **kwargs):
+            name = type(view).__name__
+            key = get_response_key(name, request, models)
+            entry = cache.get(key)
+
+            if entry is None:
+                metrics.count(name, 'misses')
+                response = handler(view, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+                response = view.finalize_response(request, response, *args, **kwargs)
+                response.render()
+                entry = {
+                    'content': response.content,
+                    'content_type': response['Content-Type'],
+                    'etag': f'"{hashlib.sha1(response.content).hexdigest()}"',
+                }
+                cache.set(key, entry, get_cache_ttl())
+                response['X-Cache'] = 'MISS'
+            else:
+                metrics.count(name, 'hits')
+                response = HttpResponse(entry['content'], content_type=entry['content_type'])
+                response['X-Cache'] = 'HIT'
+
+            response['ETag'] = entry['etag']
+            # Clients may keep the body but must revalidate it each time
+            patch_cache_control(response, private=True, no_cache=True)
+            conditional = get_conditional_response(request, etag=entry['etag'], response=response)
+            if conditional is not response:
+                metrics.count(name, 'not_modified')
+            return conditional
+        return wrapper
+    return decorator
@@ -14,6 +14,8 @@ from batteryswap import config
 import os
 from datetime import timedelta
 
+from celery.schedules import crontab
+
 TEMPLATE_DIR = BASE_DIR / "templates"
 STATIC_URL = "/static/"
 
@@ -139,6 +141,22 @@ CACHES = {
     }
 }
 
+# Seconds a user's subscription entitlement stays cached (it is also
+# invalidated whenever their subscription changes)
+SUBSCRIPTION_ENTITLEMENT_CACHE_TTL = env.int("SUBSCRIPTION_ENTITLEMENT_CACHE_TTL", default=300)
+
+# Seconds the admin dashboard figures stay cached (how stale they may be;
+# order writes don't invalidate them)
+DASHBOARD_STATS_CACHE_TTL = env.int("DASHBOARD_STATS_CACHE_TTL", default=60)
+
+# Seconds a catalog response (vehicles, batteries, companies, plans) stays
+# cached; it is also retired whenever one of its models is saved or deleted
+RESPONSE_CACHE_TTL = env.int("RESPONSE_CACHE_TTL", default=3600)
+
+# Responses to requests sent with an Idempotency-Key header are replayed
+# for retries within this many hours
+IDEMPOTENCY_KEY_TTL_HOURS = env.int("IDEMPOTENCY_KEY_TTL_HOURS", default=24)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -189,6 +207,26 @@ CHANNEL_LAYERS = {
     },
 }
 
+# Map clients subscribe to geohash tiles of this precision (4 ~ 39 x 20 km)
+# and may watch at most this many tiles at once
+WEBSOCKET_TILE_PRECISION = env.int("WEBSOCKET_TILE_PRECISION", default=4)
+WEBSOCKET_MAX_VIEWPORT_TILES = env.int("WEBSOCKET_MAX_VIEWPORT_TILES", default=64)
+# Also send every station event to 'stations_all' for clients that don't
+# send a viewport yet
+WEBSOCKET_LEGACY_STATIONS_ALL = env.bool("WEBSOCKET_LEGACY_STATIONS_ALL", default=True)
+
+# Most stations sent in one snapshot on connect/resync
+WEBSOCKET_MAX_SNAPSHOT_STATIONS = env.int("WEBSOCKET_MAX_SNAPSHOT_STATIONS", default=500)
+
+# Max messages per second per station on the map groups ('stations_all'
+# and viewport tiles); bursts are collapsed to the latest state, 0 disables
+WEBSOCKET_MAP_MAX_RATE = env.int("WEBSOCKET_MAP_MAX_RATE", default=0)
+
+# Broadcasts are queued in-process and sent by a background thread so
+# requests don't wait on Redis; events beyond the queue size are dropped
+WEBSOCKET_OUTBOX_ENABLED = env.bool("WEBSOCKET_OUTBOX_ENABLED", default=True)
+WEBSOCKET_OUTBOX_SIZE = env.int("WEBSOCKET_OUTBOX_SIZE", default=10000)
+
 # Email Configuration
 EMAIL_BACKEND = env("EMAIL_BACKEND", default="django.core.mail.backends.console.EmailBackend")
 EMAIL_HOST = env("EMAIL_HOST", default="smtp.gmail.com")
@@ -208,3 +246,21 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60  # 30 minutes hard limit
 CELERY_TASK_SOFT_TIME_LIMIT = 25 * 60  # 25 minutes soft limit
+CELERY_BEAT_SCHEDULER = "django_celery_beat.schedulers:DatabaseScheduler"
+CELERY_BEAT_SCHEDULE = {
+    "expire-orders": {
+        "task": "user.tasks.expire_orders",
+        "schedule": 60.0,  # every minute
+    },
+    "reset-monthly-swaps": {
+        "task": "subscription.tasks.reset_monthly_swaps",
+        # Hourly on the 1st and 2nd: swap periods are UTC months while beat
+        # runs in CELERY_TIMEZONE, and runs after the reset are no-ops
+        "schedule": crontab(minute=0, day_of_month="1-2"),
+    },
+}
+
+# Expiry sweeper: orders released per transaction, and batches per run
+# (500 x 20 per minute keeps well ahead of peak booking rates)
+ORDER_EXPIRY_BATCH_SIZE = env.int("ORDER_EXPIRY_BATCH_SIZE", default=500)
+ORDER_EXPIRY_MAX_BATCHES = env.int("ORDER_EXPIRY_MAX_BATCHES", default=20)
@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class ProducerConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'producer'
+
+    def ready(self):
+        """
+        Import signals when the app is ready.
+        This ensures signals are registered when Django starts.
+        """
+        import producer.signals  # noqa
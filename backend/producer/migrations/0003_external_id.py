@@ -0,0 +1,18 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('producer', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='company',
+            name='external_id',
+            field=models.CharField(blank=True, max_length=64, null=True, unique=True, verbose_name='External ID'),
+        ),
+    ]
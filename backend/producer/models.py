@@ -4,6 +4,10 @@ from django.db import models
 
 class Company(models.Model):
     name = models.CharField("Company Name", max_length=150, null=True)
+    # Identifier in a partner's own system, matched by manage.py import_network
+    external_id = models.CharField(
+        "External ID", max_length=64, unique=True, null=True, blank=True
+    )
 
     class Meta:
         verbose_name = "Company"
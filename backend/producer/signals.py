@@ -0,0 +1,16 @@
+"""
+Django signals keeping cached company responses fresh
+"""
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from batteryswap.response_cache import invalidate_cached_responses
+from producer.models import Company
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def company_changed(sender, instance, **kwargs):
+    """Retire the cached company (and battery) list responses"""
+    invalidate_cached_responses(sender)
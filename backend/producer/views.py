@@ -4,6 +4,7 @@ from rest_framework.response import Response
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
 
+from batteryswap.response_cache import cached_response
 from producer.models import Company, Producer
 from producer.serializers import CompanySerializer
 
@@ -12,6 +13,10 @@ class ManageCompanies(generics.ListCreateAPIView):
     serializer_class = CompanySerializer
     queryset = Company.objects.all()
 
+    @cached_response(Company)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class ManageCompany(generics.RetrieveUpdateDestroyAPIView):
     serializer_class = CompanySerializer
@@ -0,0 +1,27 @@
+"""
+Management command to start a new monthly swap period
+Usage: python manage.py reset_monthly_swaps [--batch-size 1000]
+
+Celery beat runs the same reset at the start of each month
+(subscription.tasks.reset_monthly_swaps); run this by hand to catch up.
+"""
+
+from django.core.management.base import BaseCommand
+
+from subscription.utils import reset_monthly_swaps
+
+
+class Command(BaseCommand):
+    help = 'Reset swaps_used for subscriptions still counting an earlier month'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Subscriptions updated per query',
+        )
+
+    def handle(self, *args, **options):
+        reset = reset_monthly_swaps(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Reset swap counters for {reset} subscriptions'))
@@ -0,0 +1,43 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:39
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+def backfill_swaps_used(apps, schema_editor):
+    UserSubscription = apps.get_model('subscription', 'UserSubscription')
+    User = apps.get_model('user', 'User')
+
+    # Same count get_monthly_swap_count used to run per request
+    month_start = timezone.now().replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    swaps = (
+        User.orders.through.objects.filter(
+            user_id=models.OuterRef('user_id'),
+            order__booked_time__gte=month_start,
+            order__is_paid=True,
+        )
+        .values('user_id')
+        .annotate(count=models.Count('pk'))
+        .values('count')
+    )
+    UserSubscription.objects.filter(is_active=True).update(
+        swaps_used=Coalesce(models.Subquery(swaps), 0),
+        swaps_period_start=month_start,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscription', '0002_alter_usersubscription_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='usersubscription',
+            name='swaps_period_start',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Swaps counted since'),
+        ),
+        migrations.RunPython(backfill_swaps_used, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscription', '0003_usersubscription_swaps_period_start'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='usersubscription',
+            index=models.Index(fields=['-created_at'], name='subscription_created_idx'),
+        ),
+    ]
@@ -49,7 +49,10 @@ class UserSubscription(models.Model):
     start_date = models.DateTimeField(default=timezone.now)
     end_date = models.DateTimeField()
     is_active = models.BooleanField(default=True)
+    # Swaps booked since swaps_period_start (the current calendar month once
+    # reset_monthly_swaps has run); reserved with a conditional UPDATE
     swaps_used = models.IntegerField(default=0)
+    swaps_period_start = models.DateTimeField("Swaps counted since", null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -57,6 +60,10 @@ class UserSubscription(models.Model):
         verbose_name = "User Subscription"
         verbose_name_plural = "User Subscriptions"
         ordering = ['-start_date']
+        indexes = [
+            # Admin subscription list, newest first
+            models.Index(fields=['-created_at'], name='subscription_created_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.email} - {self.plan.name}"
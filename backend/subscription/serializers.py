@@ -1,7 +1,9 @@
 from rest_framework import serializers
+from django.db import transaction
 from django.utils import timezone
 from dateutil.relativedelta import relativedelta
 from subscription.models import SubscriptionPlan, UserSubscription
+from subscription.utils import get_month_start
 
 
 class SubscriptionPlanSerializer(serializers.ModelSerializer):
@@ -81,24 +83,37 @@ class SubscribeSerializer(serializers.Serializer):
         plan_id = validated_data['plan_id']
         duration_months = validated_data.get('duration_months', 1)
 
-        # Deactivate any existing active subscriptions
-        UserSubscription.objects.filter(
-            user=user,
-            is_active=True
-        ).update(is_active=False)
-
-        # Create new subscription
         plan = SubscriptionPlan.objects.get(id=plan_id)
         start_date = timezone.now()
         end_date = start_date + relativedelta(months=duration_months)
+        month_start = get_month_start(start_date)
+
+        with transaction.atomic():
+            # Lock the user's subscriptions so a booking can't reserve a
+            # swap on the old one after its count has been carried over
+            this_month = list(
+                UserSubscription.objects.select_for_update().filter(
+                    user=user, swaps_period_start__gte=month_start
+                ).values_list('swaps_used', flat=True)
+            )
+
+            # Deactivate any existing active subscriptions
+            UserSubscription.objects.filter(
+                user=user,
+                is_active=True
+            ).update(is_active=False)
 
-        subscription = UserSubscription.objects.create(
-            user=user,
-            plan=plan,
-            start_date=start_date,
-            end_date=end_date,
-            is_active=True,
-            swaps_used=0,  # Always start at 0
-        )
+            # Create new subscription; the monthly limit is per user, so
+            # swaps already used this month carry over (each subscription
+            # starts from the previous count, so the largest is the total)
+            subscription = UserSubscription.objects.create(
+                user=user,
+                plan=plan,
+                start_date=start_date,
+                end_date=end_date,
+                is_active=True,
+                swaps_used=max(this_month, default=0),
+                swaps_period_start=month_start,
+            )
 
         return subscription
@@ -0,0 +1,41 @@
+"""
+Django signals keeping cached subscription entitlements fresh
+"""
+
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from batteryswap.response_cache import invalidate_cached_responses
+from subscription.models import SubscriptionPlan, UserSubscription
+from subscription.utils import get_entitlement_key, invalidate_entitlement
+
+
+@receiver(post_save, sender=UserSubscription)
+@receiver(post_delete, sender=UserSubscription)
+def user_subscription_changed(sender, instance, **kwargs):
+    """
+    Signal handler for subscribe, renewal, cancellation and expiry.
+    Drops the user's cached entitlement.
+    """
+    invalidate_entitlement(instance.user_id)
+
+
+@receiver(post_save, sender=SubscriptionPlan)
+def subscription_plan_changed(sender, instance, created, **kwargs):
+    """
+    Signal handler for plan edits (e.g. a new swap limit).
+    Drops the cached entitlements of the plan's subscribers.
+    """
+    if not created:
+        user_ids = UserSubscription.objects.filter(
+            plan=instance, is_active=True
+        ).values_list('user_id', flat=True)
+        cache.delete_many([get_entitlement_key(user_id) for user_id in user_ids])
+
+
+@receiver(post_save, sender=SubscriptionPlan)
+@receiver(post_delete, sender=SubscriptionPlan)
+def subscription_plan_catalog_changed(sender, instance, **kwargs):
+    """Retire the cached plan list responses"""
+    invalidate_cached_responses(sender)
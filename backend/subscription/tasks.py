@@ -0,0 +1,19 @@
+"""
+Celery tasks for subscriptions
+"""
+
+from celery import shared_task
+
+from subscription.utils import reset_monthly_swaps as reset_swap_counters
+
+
+@shared_task
+def reset_monthly_swaps():
+    """
+    Start a new monthly swap period for every subscription.
+    Scheduled by CELERY_BEAT_SCHEDULE.
+
+    Returns:
+        int: Number of subscriptions reset
+    """
+    return reset_swap_counters()
@@ -1,3 +1,177 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from battery.models import Battery, Station
+from subscription.models import SubscriptionPlan, UserSubscription
+from subscription.utils import (
+    can_create_order,
+    get_month_start,
+    get_subscription_status,
+    record_swap,
+    reserve_swap,
+    reset_monthly_swaps,
+)
+from user.models import CustomUser, Order
+
+
+IN_MEMORY_CHANNEL_LAYERS = {
+    "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+}
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CACHES=LOCMEM_CACHES)
+class EntitlementCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.plan = SubscriptionPlan.objects.create(
+            name="Basic", price=9.99, swap_limit_per_month=2
+        )
+        self.user = CustomUser.objects.create_user(
+            email="rider@example.com",
+            name="Rider",
+            username="rider@example.com",
+            user_type="consumer",
+        )
+
+    def subscribe(self):
+        return UserSubscription.objects.create(
+            user=self.user, plan=self.plan, end_date=timezone.now() + timedelta(days=30)
+        )
+
+    def swap(self):
+        reserve_swap(self.user)
+        station = Station.objects.create(name="Hub", latitude=10.0, longitude=76.0)
+        battery = Battery.objects.create(price=100)
+        Order.objects.create(
+            user=self.user,
+            battery=battery,
+            station=station,
+            expiry_time=timezone.now() + timedelta(days=1),
+            is_paid=True,
+        )
+        record_swap(self.user)
+
+    def test_cached_check_runs_no_queries(self):
+        self.subscribe()
+        self.assertEqual(can_create_order(self.user), (True, ""))
+
+        with self.assertNumQueries(0):
+            self.assertEqual(can_create_order(self.user), (True, ""))
+            self.assertEqual(get_subscription_status(self.user)["swaps_remaining"], 2)
+
+    def test_subscribing_invalidates_cached_entitlement(self):
+        self.assertFalse(can_create_order(self.user)[0])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.subscribe()
+
+        self.assertTrue(can_create_order(self.user)[0])
+
+    def test_committed_swaps_count_against_limit(self):
+        self.subscribe()
+        can_create_order(self.user)
+
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.swap()
+
+        with self.assertNumQueries(0):
+            can_create, message = can_create_order(self.user)
+        self.assertFalse(can_create)
+        self.assertIn("(2/2)", message)
+
+    def test_reservation_stops_at_limit(self):
+        subscription = self.subscribe()
+
+        self.assertEqual(reserve_swap(self.user), 1)
+        self.assertEqual(reserve_swap(self.user), 2)
+        self.assertIsNone(reserve_swap(self.user))
+
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.swaps_used, 2)
+        self.assertEqual(subscription.swaps_period_start, get_month_start())
+
+    def test_reservation_updates_without_a_join(self):
+        subscription = self.subscribe()
+        can_create_order(self.user)
+        UserSubscription.objects.filter(pk=subscription.pk).update(swaps_period_start=None)
+
+        # Rollover, then the in-month compare-and-increment
+        for expected in (1, 2):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(reserve_swap(self.user), expected)
+            updates = [q["sql"] for q in queries if q["sql"].startswith("UPDATE")]
+            self.assertTrue(updates)
+            for sql in updates:
+                self.assertNotIn("IN (SELECT", sql)
+
+    def test_resubscribing_keeps_month_swap_count(self):
+        self.subscribe()
+        self.assertEqual(reserve_swap(self.user), 1)
+        self.assertEqual(reserve_swap(self.user), 2)
+        self.assertIsNone(reserve_swap(self.user))
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = client.post(reverse("subscribe"), {"plan_id": self.plan.pk}, format="json")
+        self.assertEqual(response.status_code, 201)
+
+        self.assertIsNone(reserve_swap(self.user))
+        self.assertEqual(UserSubscription.objects.get(is_active=True).swaps_used, 2)
+        self.assertFalse(can_create_order(self.user)[0])
+
+    def test_reset_starts_new_month(self):
+        subscription = self.subscribe()
+        UserSubscription.objects.filter(pk=subscription.pk).update(
+            swaps_used=2, swaps_period_start=get_month_start() - timedelta(days=31)
+        )
+
+        old = UserSubscription.objects.create(
+            user=self.user, plan=self.plan, end_date=timezone.now(), is_active=False,
+            swaps_used=2, swaps_period_start=get_month_start() - timedelta(days=62),
+        )
+
+        self.assertEqual(reset_monthly_swaps(), 1)
+        self.assertEqual(reset_monthly_swaps(), 0)
+        subscription.refresh_from_db()
+        self.assertEqual(subscription.swaps_used, 0)
+        self.assertEqual(reserve_swap(self.user), 1)
+        # History of inactive subscriptions isn't rewritten
+        old.refresh_from_db()
+        self.assertEqual(old.swaps_used, 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PlanListCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.plan = SubscriptionPlan.objects.create(
+            name="Basic", price=9.99, swap_limit_per_month=2
+        )
+        self.client = APIClient()
+
+    def test_deactivated_plan_leaves_cached_list(self):
+        first = self.client.get(reverse("list_plans"))
+        self.assertEqual(len(first.json()), 1)
+        self.assertEqual(
+            self.client.get(reverse("list_plans"), HTTP_IF_NONE_MATCH=first["ETag"]).status_code, 304
+        )
+
+        self.plan.is_active = False
+        self.plan.save()
+
+        response = self.client.get(reverse("list_plans"), HTTP_IF_NONE_MATCH=first["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), [])
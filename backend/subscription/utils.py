@@ -1,8 +1,19 @@
 """
 Subscription utility functions for validation and enforcement
+
+A user's entitlement (plan limit, expiry) and month-to-date swap count are
+cached, so checking whether a booking is allowed costs one cache read.
+The entitlement is invalidated when the user's subscriptions change; the
+swap counter is incremented when a booking commits.
 """
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Exists, F, OuterRef, Q, Subquery
 from django.utils import timezone
-from subscription.models import UserSubscription
+from subscription.models import SubscriptionPlan, UserSubscription
 
 
 def get_active_subscription(user):
@@ -37,17 +48,187 @@ def get_monthly_swap_count(user):
     Returns:
         int: Number of swaps this month
     """
-    # Get start of current month
+    # Counter on the active subscription; a period that started before
+    # this month is waiting for reset_monthly_swaps and counts as 0
+    swap_count = UserSubscription.objects.filter(
+        user=user,
+        is_active=True,
+        end_date__gt=timezone.now(),
+        swaps_period_start__gte=get_month_start()
+    ).values_list('swaps_used', flat=True).first()
+    
+    return swap_count or 0
+
+
+def reserve_swap(user):
+    """
+    Count one swap against the user's active subscription, if its monthly
+    limit allows. Each step is a single conditional UPDATE, so concurrent
+    bookings can't go over the limit. Call inside the booking's
+    transaction so a failed booking gives the swap back.
+    
+    Args:
+        user: User instance
+        
+    Returns:
+        int: Swaps used this month including this one, or None if the
+        limit is reached (or there is no active subscription)
+    """
+    subscription_id = get_entitlement(user).get('subscription_id')
     now = timezone.now()
-    month_start = now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    month_start = get_month_start(now)
+    subscription = UserSubscription.objects.filter(
+        pk=subscription_id, is_active=True, end_date__gt=now
+    )
+
+    # The plan's limit is read with a correlated subquery rather than a
+    # join: a join makes Django wrap the UPDATE in "id IN (SELECT ...)",
+    # which PostgreSQL doesn't re-check against a concurrently updated
+    # row, so two bookings at limit - 1 could both pass
+    plan = SubscriptionPlan.objects.filter(pk=OuterRef('plan_id'))
+    reserved = subscription.filter(
+        swaps_period_start__gte=month_start,
+        swaps_used__lt=Subquery(plan.values('swap_limit_per_month'))
+    ).update(swaps_used=F('swaps_used') + 1, updated_at=now)
+    if not reserved:
+        # reset_monthly_swaps hasn't reached this subscription yet, so the
+        # month starts with this swap
+        reserved = subscription.filter(
+            Q(swaps_period_start__lt=month_start) | Q(swaps_period_start__isnull=True),
+            Exists(plan.filter(swap_limit_per_month__gt=0))
+        ).update(swaps_used=1, swaps_period_start=month_start, updated_at=now)
+
+    if not reserved:
+        # The cached count was behind; reload it on the next read
+        cache.delete(get_swap_count_key(user.pk, month_start))
+        return None
+    # The row is locked by our UPDATE, so this is our own count
+    return subscription.values_list('swaps_used', flat=True).first()
+
+
+def reset_monthly_swaps(batch_size=1000):
+    """
+    Start a new monthly period (swaps_used = 0) for every active
+    subscription still counting an earlier month. Run by a scheduled job
+    at the start of each month; safe to run repeatedly. Inactive
+    subscriptions are left alone (re-subscribing only carries over swaps
+    counted this month).
     
-    # Count orders created this month
-    swap_count = user.orders.filter(
-        booked_time__gte=month_start,
-        is_paid=True
-    ).count()
+    Returns:
+        int: Number of subscriptions reset
+    """
+    month_start = get_month_start()
+    stale = UserSubscription.objects.filter(
+        Q(swaps_period_start__lt=month_start) | Q(swaps_period_start__isnull=True),
+        is_active=True
+    )
+    reset = 0
+    while True:
+        batch = list(stale.values_list('pk', flat=True)[:batch_size])
+        if not batch:
+            return reset
+        # Re-check the period so a swap reserved meanwhile isn't wiped
+        reset += stale.filter(pk__in=batch).update(
+            swaps_used=0, swaps_period_start=month_start, updated_at=timezone.now()
+        )
+
+
+def get_month_start(now=None):
+    """Start of the current calendar month"""
+    now = now or timezone.now()
+    return now.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def get_entitlement_key(user_id):
+    return f'subscription:entitlement:{user_id}'
+
+
+def get_swap_count_key(user_id, month_start):
+    return f'subscription:swaps:{user_id}:{month_start:%Y-%m}'
+
+
+def get_entitlement_ttl():
+    return getattr(settings, 'SUBSCRIPTION_ENTITLEMENT_CACHE_TTL', 300)
+
+
+def load_entitlement(user):
+    """
+    Read a user's entitlement from the database.
     
-    return swap_count
+    Returns:
+        dict: Active plan details, or {'has_subscription': False}
+    """
+    subscription = get_active_subscription(user)
+    if not subscription:
+        return {'has_subscription': False}
+    return {
+        'has_subscription': True,
+        'subscription_id': subscription.pk,
+        'plan_name': subscription.plan.name,
+        'swap_limit': subscription.plan.swap_limit_per_month,
+        'priority_support': subscription.plan.priority_support,
+        'end_date': subscription.end_date,
+    }
+
+
+def get_entitlement(user):
+    """
+    Get a user's entitlement and month-to-date swap count, with one cache
+    read when both are cached.
+    
+    Args:
+        user: User instance
+        
+    Returns:
+        dict: load_entitlement() data plus 'swaps_used'
+    """
+    now = timezone.now()
+    month_start = get_month_start(now)
+    entitlement_key = get_entitlement_key(user.pk)
+    swap_count_key = get_swap_count_key(user.pk, month_start)
+    cached = cache.get_many([entitlement_key, swap_count_key])
+
+    entitlement = cached.get(entitlement_key)
+    if entitlement is None:
+        entitlement = load_entitlement(user)
+        cache.set(entitlement_key, entitlement, get_entitlement_ttl())
+
+    swaps_used = cached.get(swap_count_key)
+    if swaps_used is None:
+        swaps_used = get_monthly_swap_count(user)
+        # add() so a concurrent increment isn't overwritten; the key
+        # expires a day after the month ends
+        next_month = (month_start + timedelta(days=32)).replace(day=1)
+        cache.add(swap_count_key, swaps_used, int((next_month - now).total_seconds()) + 86400)
+
+    return {**entitlement, 'swaps_used': swaps_used}
+
+
+def invalidate_entitlement(user_id):
+    """
+    Drop a user's cached entitlement, now and again once the current
+    transaction commits (so a concurrent read can't re-cache old data).
+    """
+    key = get_entitlement_key(user_id)
+    cache.delete(key)
+    transaction.on_commit(lambda: cache.delete(key))
+
+
+def record_swap(user):
+    """
+    Count a booked swap in the cached month-to-date counter once the
+    booking's transaction commits.
+    """
+    key = get_swap_count_key(user.pk, get_month_start())
+
+    def increment():
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Not cached; the next read counts from the database
+            pass
+
+    transaction.on_commit(increment)
 
 
 def can_create_order(user):
@@ -60,19 +241,19 @@ def can_create_order(user):
     Returns:
         tuple: (bool, str) - (can_create, error_message)
     """
-    # Get active subscription
-    subscription = get_active_subscription(user)
+    # Get cached entitlement
+    entitlement = get_entitlement(user)
     
-    if not subscription:
+    if not entitlement['has_subscription']:
         return False, "No active subscription found. Please subscribe to a plan to continue."
     
     # Check if subscription is expired
-    if subscription.is_expired():
+    if timezone.now() > entitlement['end_date']:
         return False, "Your subscription has expired. Please renew to continue."
     
     # Get current month's swap count
-    current_swaps = get_monthly_swap_count(user)
-    swap_limit = subscription.plan.swap_limit_per_month
+    current_swaps = entitlement['swaps_used']
+    swap_limit = entitlement['swap_limit']
     
     # Check if limit exceeded
     if current_swaps >= swap_limit:
@@ -81,19 +262,21 @@ def can_create_order(user):
     return True, ""
 
 
-def get_subscription_status(user):
+def get_subscription_status(user, swaps_used=None):
     """
     Get detailed subscription status for user
     
     Args:
         user: User instance
+        swaps_used: Known swap count (e.g. from reserve_swap) to report
+            instead of the cached one
         
     Returns:
         dict: Subscription status information
     """
-    subscription = get_active_subscription(user)
+    entitlement = get_entitlement(user)
     
-    if not subscription:
+    if not entitlement['has_subscription']:
         return {
             'has_subscription': False,
             'plan_name': None,
@@ -104,16 +287,16 @@ def get_subscription_status(user):
             'priority_support': False
         }
     
-    current_swaps = get_monthly_swap_count(user)
-    swap_limit = subscription.plan.swap_limit_per_month
+    current_swaps = entitlement['swaps_used'] if swaps_used is None else swaps_used
+    swap_limit = entitlement['swap_limit']
     
     return {
         'has_subscription': True,
-        'plan_name': subscription.plan.name,
+        'plan_name': entitlement['plan_name'],
         'swap_limit': swap_limit,
         'swaps_used': current_swaps,
         'swaps_remaining': max(0, swap_limit - current_swaps),
-        'is_expired': subscription.is_expired(),
-        'priority_support': subscription.plan.priority_support,
-        'end_date': subscription.end_date
+        'is_expired': timezone.now() > entitlement['end_date'],
+        'priority_support': entitlement['priority_support'],
+        'end_date': entitlement['end_date']
     }
@@ -2,6 +2,7 @@ from rest_framework import generics, views, status
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.renderers import JSONRenderer
+from batteryswap.response_cache import cached_response
 from subscription.models import SubscriptionPlan, UserSubscription
 from subscription.serializers import (
     SubscriptionPlanSerializer,
@@ -20,6 +21,10 @@ class ListSubscriptionPlans(generics.ListAPIView):
     permission_classes = []  # Public endpoint
     renderer_classes = [JSONRenderer]  # Force JSON response
 
+    @cached_response(SubscriptionPlan)
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
 
 class SubscribeView(views.APIView):
     """
@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
-from .models import CustomUser, Order
+from .models import CustomUser, DailyRevenue, IdempotencyKey, Order
 
 
 @admin.register(CustomUser)
@@ -27,3 +27,17 @@ class CustomUserAdmin(BaseUserAdmin):
 
 
 admin.site.register(Order)
+
+
+@admin.register(IdempotencyKey)
+class IdempotencyKeyAdmin(admin.ModelAdmin):
+    list_display = ["key", "user", "status_code", "created_at"]
+    search_fields = ["key", "user__email"]
+    raw_id_fields = ["user"]
+
+
+@admin.register(DailyRevenue)
+class DailyRevenueAdmin(admin.ModelAdmin):
+    list_display = ["day", "station", "producer", "revenue", "bookings"]
+    list_filter = ["day"]
+    raw_id_fields = ["station", "producer"]
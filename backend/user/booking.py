@@ -0,0 +1,128 @@
+"""
+Booking service
+Books a battery at a station in one short transaction: subscription check,
+row-level claim on the station's battery and order creation either all
+happen or none do, and a battery can only ever be booked once.
+"""
+
+import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from battery.inventory import update_compatible_stations, update_station_counters
+from battery.models import Battery, Station
+from battery.websocket_utils import broadcast_battery_booked, broadcast_inventory_update
+from subscription.utils import can_create_order, record_swap, reserve_swap
+from user.models import Order
+from user.revenue import add_daily_revenue
+
+
+ORDER_VALIDITY = datetime.timedelta(days=1)
+
+
+class BookingError(Exception):
+    """Base class for bookings that can't go ahead"""
+
+    error_code = 'BOOKING_FAILED'
+
+    def __init__(self, message):
+        super().__init__(message)
+        self.message = message
+
+
+class SubscriptionLimitExceeded(BookingError):
+    """The user's subscription doesn't allow another swap"""
+
+    error_code = 'SUBSCRIPTION_LIMIT_EXCEEDED'
+
+
+class BookingConflict(BookingError):
+    """The battery is not (or no longer) available at the station"""
+
+    error_code = 'BATTERY_UNAVAILABLE'
+
+
+def claim_available_battery(station, battery):
+    """
+    Take a battery off a station's available list, if nobody else has.
+
+    The Station.batteries row is locked with SELECT ... FOR UPDATE SKIP
+    LOCKED, so a concurrent booking of the same battery fails fast instead
+    of waiting, and deleted with a conditional DELETE, so databases without
+    row locks still let only one booking through.
+
+    Raises:
+        BookingConflict: If the battery isn't available at the station
+    """
+    through = Station.batteries.through
+    rows = through.objects.filter(station_id=station.pk, battery_id=battery.pk)
+    claimed = list(
+        rows.select_for_update(skip_locked=True).values_list('pk', flat=True)[:1]
+    )
+    if not claimed or not through.objects.filter(pk=claimed[0]).delete()[0]:
+        raise BookingConflict('This battery is no longer available at this station.')
+
+    # A direct DELETE skips m2m_changed, so keep the counters, index and
+    # broadcast in step as the Station.batteries handler would
+    pairs = [(station.pk, battery.pk)]
+    update_station_counters(through, pairs, -1, station=station)
+    update_compatible_stations(pairs, -1)
+    broadcast_inventory_update(station, action='update')
+
+
+def book_battery(user, station_id, battery_id):
+    """
+    Book a battery at a station for a user.
+
+    Args:
+        user: User making the booking
+        station_id: Station primary key
+        battery_id: Battery primary key
+
+    Returns:
+        Order: The new order, with the user's swap count for the month
+        (including this one) in order.swaps_used
+
+    Raises:
+        SubscriptionLimitExceeded: If the user can't make another swap
+        BookingConflict: If the battery isn't available at the station
+        Station.DoesNotExist, Battery.DoesNotExist: For unknown IDs
+    """
+    # Cached check; turns most refusals away without touching the database
+    can_create, error_message = can_create_order(user)
+    if not can_create:
+        raise SubscriptionLimitExceeded(error_message)
+
+    station = Station.objects.get(pk=station_id)
+    battery = Battery.objects.select_related('company', 'vehicle').get(pk=battery_id)
+
+    with transaction.atomic():
+        # Authoritative check: reserve the swap with a conditional UPDATE,
+        # given back if anything below fails
+        swaps_used = reserve_swap(user)
+        if swaps_used is None:
+            raise SubscriptionLimitExceeded(
+                "Monthly swap limit reached. Please upgrade your plan or wait until next month."
+            )
+
+        claim_available_battery(station, battery)
+        station.booked_batteries.add(battery)
+
+        order = Order.objects.create(
+            user=user,
+            battery=battery,
+            station=station,
+            expiry_time=timezone.now() + ORDER_VALIDITY,
+            is_paid=True,
+        )
+        order.swaps_used = swaps_used
+        # Legacy link, kept in step until User.orders is dropped
+        user.orders.add(order)
+        record_swap(user)
+        add_daily_revenue(order)
+
+        # Sent as one message per station when the transaction commits
+        broadcast_battery_booked(station, battery, user)
+
+    return order
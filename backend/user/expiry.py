@@ -0,0 +1,88 @@
+"""
+Order expiry
+Releases the batteries of orders that passed their expiry time without
+being collected, back to their station's available inventory.
+"""
+
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from battery.models import Station
+from user.models import Order
+
+
+def release_expired_batch(batch_size=500, now=None):
+    """
+    Expire one batch of uncollected orders and release their batteries.
+
+    The orders are locked with SELECT ... FOR UPDATE SKIP LOCKED, so
+    concurrent sweepers and collections never wait on each other, and each
+    batch is its own short transaction. Inventory moves through the
+    Station M2M managers, so counters, the compatibility index and one
+    coalesced broadcast per station follow as for any other change.
+
+    Args:
+        batch_size: Most orders expired in this batch
+        now: Expiry cut-off (default: now)
+
+    Returns:
+        int: Number of orders expired (0 once none are left)
+    """
+    now = now or timezone.now()
+    with transaction.atomic():
+        expired = list(
+            Order.objects.select_for_update(skip_locked=True)
+            .filter(is_collected=False, is_expired=False, expiry_time__lt=now)
+            .order_by('expiry_time')
+            .values_list('pk', 'station_id', 'battery_id')[:batch_size]
+        )
+        if not expired:
+            return 0
+
+        Order.objects.filter(pk__in=[pk for pk, _, _ in expired]).update(is_expired=True)
+
+        # Only batteries still booked there; others were already moved
+        pairs = {(station_id, battery_id) for _, station_id, battery_id in expired}
+        still_booked = Station.booked_batteries.through.objects.filter(
+            station_id__in={station_id for station_id, _ in pairs},
+            battery_id__in={battery_id for _, battery_id in pairs},
+        ).values_list('station_id', 'battery_id')
+        batteries_by_station = defaultdict(list)
+        for station_id, battery_id in still_booked:
+            if (station_id, battery_id) in pairs:
+                batteries_by_station[station_id].append(battery_id)
+
+        for station in Station.objects.filter(pk__in=batteries_by_station):
+            battery_ids = batteries_by_station[station.pk]
+            station.booked_batteries.remove(*battery_ids)
+            station.batteries.add(*battery_ids)
+
+    return len(expired)
+
+
+def release_expired_orders(batch_size=None, max_batches=None):
+    """
+    Expire uncollected orders in batches until none are left or
+    max_batches have run.
+
+    Args:
+        batch_size: Orders per batch (default ORDER_EXPIRY_BATCH_SIZE)
+        max_batches: Batch limit for one run (default ORDER_EXPIRY_MAX_BATCHES)
+
+    Returns:
+        int: Number of orders expired
+    """
+    batch_size = batch_size or getattr(settings, 'ORDER_EXPIRY_BATCH_SIZE', 500)
+    max_batches = max_batches or getattr(settings, 'ORDER_EXPIRY_MAX_BATCHES', 20)
+    now = timezone.now()
+
+    expired = 0
+    for _ in range(max_batches):
+        released = release_expired_batch(batch_size, now)
+        expired += released
+        if released < batch_size:
+            break
+    return expired
@@ -0,0 +1,149 @@
+"""
+Idempotency-Key support for retried POST requests
+The first request with a key runs and its response is stored in the same
+transaction; retries with the same key get that response back without
+running again.
+"""
+
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.response import Response
+
+from user.models import IdempotencyKey
+
+
+IDEMPOTENCY_HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+# Outcomes worth replaying; anything else (unexpected failures) is rolled
+# back with the key so a retry runs again
+STORED_STATUS_CODES = {
+    status.HTTP_200_OK,
+    status.HTTP_201_CREATED,
+    status.HTTP_403_FORBIDDEN,
+    status.HTTP_409_CONFLICT,
+}
+
+
+def get_key_ttl():
+    return timedelta(hours=getattr(settings, 'IDEMPOTENCY_KEY_TTL_HOURS', 24))
+
+
+def get_request_fingerprint(data):
+    """Hash of a request body, to spot a key reused for a different request"""
+    body = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.sha256(body.encode()).hexdigest()
+
+
+def claim_idempotency_key(user, key, fingerprint):
+    """
+    Insert the key, or find the request that already used it.
+
+    Must run inside a transaction. A concurrent request with the same key
+    waits on the unique constraint until the first one commits.
+
+    Returns:
+        tuple: (IdempotencyKey, created)
+    """
+    IdempotencyKey.objects.filter(
+        user=user, key=key, created_at__lt=timezone.now() - get_key_ttl()
+    ).delete()
+    try:
+        with transaction.atomic():
+            record = IdempotencyKey.objects.create(
+                user=user, key=key, request_fingerprint=fingerprint
+            )
+        return record, True
+    except IntegrityError:
+        return IdempotencyKey.objects.get(user=user, key=key), False
+
+
+def replay_response(record, fingerprint):
+    """Response for a retried request"""
+    if record.request_fingerprint != fingerprint:
+        return Response(
+            data={
+                "success": False,
+                "message": "Idempotency-Key was already used for a different request.",
+                "error_code": "IDEMPOTENCY_KEY_REUSED"
+            },
+            status=status.HTTP_422_UNPROCESSABLE_ENTITY
+        )
+    response = HttpResponse(
+        bytes(record.response_body),
+        status=record.status_code,
+        content_type=record.response_content_type,
+    )
+    response['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def idempotent(handler, request, *args, **kwargs):
+    """
+    Run a view handler at most once per Idempotency-Key.
+
+    Args:
+        handler: Bound view method (e.g. self.book) returning a Response
+        request: DRF request; handled normally if it carries no key
+
+    Returns:
+        Response: The handler's response, or the stored one for a retry
+    """
+    key = request.headers.get(IDEMPOTENCY_HEADER)
+    if not key:
+        return handler(request, *args, **kwargs)
+    if len(key) > MAX_KEY_LENGTH:
+        return Response(
+            data={
+                "success": False,
+                "message": f"Idempotency-Key must be at most {MAX_KEY_LENGTH} characters."
+            },
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
+    fingerprint = get_request_fingerprint(request.data)
+    with transaction.atomic():
+        record, created = claim_idempotency_key(request.user, key, fingerprint)
+        if not created:
+            return replay_response(record, fingerprint)
+
+        response = handler(request, *args, **kwargs)
+        if response.status_code not in STORED_STATUS_CODES:
+            transaction.set_rollback(True)
+            return response
+
+        # Store the rendered bytes rather than response.data, so a replay
+        # doesn't go through a second (lossier) encoding
+        response = handler.__self__.finalize_response(request, response, *args, **kwargs)
+        response.render()
+        record.status_code = response.status_code
+        record.response_body = response.content
+        record.response_content_type = response['Content-Type']
+        record.save(update_fields=['status_code', 'response_body', 'response_content_type'])
+    return response
+
+
+def purge_expired_keys(batch_size=1000):
+    """
+    Delete keys older than IDEMPOTENCY_KEY_TTL_HOURS in batches.
+
+    Returns:
+        int: Number of keys deleted
+    """
+    cutoff = timezone.now() - get_key_ttl()
+    deleted = 0
+    while True:
+        batch = list(
+            IdempotencyKey.objects.filter(created_at__lt=cutoff)
+            .values_list('pk', flat=True)[:batch_size]
+        )
+        if not batch:
+            return deleted
+        deleted += IdempotencyKey.objects.filter(pk__in=batch).delete()[0]
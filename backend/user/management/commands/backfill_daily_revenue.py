@@ -0,0 +1,61 @@
+"""
+Management command to rebuild the daily revenue rollup from paid orders
+Usage: python manage.py backfill_daily_revenue [--days 30] [--start YYYY-MM-DD] [--end YYYY-MM-DD]
+"""
+
+import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from user.revenue import rebuild_daily_revenue
+
+
+def parse_day(value):
+    try:
+        return datetime.date.fromisoformat(value)
+    except ValueError:
+        raise CommandError(f'Invalid date "{value}", expected YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = 'Rebuild DailyRevenue rows for a range of days from the orders table'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=30,
+            help='Rebuild this many days up to today (ignored with --start)',
+        )
+        parser.add_argument('--start', help='First day, YYYY-MM-DD')
+        parser.add_argument('--end', help='Last day, YYYY-MM-DD (default: today)')
+        parser.add_argument(
+            '--chunk-days',
+            type=int,
+            default=31,
+            help='Days rebuilt per transaction',
+        )
+
+    def handle(self, *args, **options):
+        end = parse_day(options['end']) if options['end'] else timezone.localdate()
+        if options['start']:
+            start = parse_day(options['start'])
+        else:
+            start = end - datetime.timedelta(days=options['days'] - 1)
+        if start > end:
+            raise CommandError('--start must not be after --end')
+
+        chunk = datetime.timedelta(days=max(options['chunk_days'], 1))
+        written = 0
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(chunk_start + chunk - datetime.timedelta(days=1), end)
+            rows = rebuild_daily_revenue(chunk_start, chunk_end)
+            written += rows
+            self.stdout.write(f'  {chunk_start} to {chunk_end}: {rows} rows')
+            chunk_start = chunk_end + datetime.timedelta(days=1)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'✓ Rebuilt daily revenue from {start} to {end} ({written} rows)'
+        ))
@@ -0,0 +1,32 @@
+"""
+Management command to release batteries of expired, uncollected orders
+Runs every minute under Celery beat (user.tasks.expire_orders); use this
+to run a sweep by hand.
+Usage: python manage.py expire_orders [--batch-size 500] [--max-batches 20]
+"""
+
+from django.core.management.base import BaseCommand
+
+from user.expiry import release_expired_orders
+
+
+class Command(BaseCommand):
+    help = 'Expire uncollected orders past their expiry time and release their batteries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Orders expired per transaction (default ORDER_EXPIRY_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--max-batches',
+            type=int,
+            help='Batches to run (default ORDER_EXPIRY_MAX_BATCHES)',
+        )
+
+    def handle(self, *args, **options):
+        expired = release_expired_orders(
+            batch_size=options['batch_size'], max_batches=options['max_batches']
+        )
+        self.stdout.write(self.style.SUCCESS(f'✓ Expired {expired} orders'))
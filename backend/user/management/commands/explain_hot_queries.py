@@ -0,0 +1,144 @@
+"""
+Management command to EXPLAIN the hot Order queries and flag full table scans
+Usage: python manage.py explain_hot_queries [--analyze] [--no-seqscan] [--strict]
+
+On a small database the planner prefers sequential scans whatever indexes
+exist; run against production-sized data, or pass --no-seqscan
+(PostgreSQL) to check that an index *can* serve each query.
+"""
+
+import re
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils import timezone
+
+from battery.models import Station
+from producer.models import Producer
+from user.models import DailyRevenue, Order
+
+
+# Plan lines that read a whole table: PostgreSQL "Seq Scan on <table>",
+# SQLite "SCAN <table>" (without an index)
+SEQ_SCAN_PATTERNS = [
+    re.compile(r'Seq Scan on (\w+)'),
+    re.compile(r'\bSCAN (\w+)\s*$', re.MULTILINE),
+]
+
+
+def get_hot_queries():
+    """
+    The Order queries behind the dashboards and booking lists, built the
+    way the views build them.
+
+    Returns:
+        list: (name, queryset) pairs
+    """
+    now = timezone.now()
+    producer = Producer.objects.order_by('pk').first()
+    user_id = Order.objects.values_list('user_id', flat=True).first() or 0
+    station_ids = list(
+        Station.objects.filter(owner=producer).values_list('pk', flat=True)
+    ) or [0]
+
+    return [
+        (
+            'MyStationBookings',
+            Order.objects.filter(station__pk__in=station_ids).order_by('-booked_time', '-pk')[:21],
+        ),
+        (
+            'Orders (order history)',
+            Order.objects.filter(user_id=user_id).order_by('-booked_time', '-pk')[:21],
+        ),
+        (
+            'MyStationStats paid bookings',
+            Order.objects.filter(station__pk__in=station_ids, is_paid=True),
+        ),
+        (
+            'AdminListBookingsPaginated',
+            Order.objects.order_by('-booked_time', '-pk')[:21],
+        ),
+        (
+            'AdminRevenueChart',
+            DailyRevenue.objects.filter(day__gte=(now - timedelta(days=29)).date()),
+        ),
+        (
+            'AdminRevenueChart by producer',
+            DailyRevenue.objects.filter(
+                producer=producer, day__gte=(now - timedelta(days=29)).date()
+            ),
+        ),
+        (
+            'backfill_daily_revenue',
+            Order.objects.filter(
+                is_paid=True,
+                booked_time__gte=now - timedelta(days=29),
+                booked_time__lte=now,
+            ),
+        ),
+        (
+            'Expired uncollected orders',
+            Order.objects.filter(is_collected=False, is_expired=False, expiry_time__lt=now),
+        ),
+    ]
+
+
+def find_seq_scans(plan):
+    """Tables read with a full scan in an EXPLAIN plan"""
+    tables = []
+    for pattern in SEQ_SCAN_PATTERNS:
+        tables += pattern.findall(plan)
+    return tables
+
+
+class Command(BaseCommand):
+    help = 'Run EXPLAIN on the hot Order queries and flag sequential scans'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--analyze',
+            action='store_true',
+            help='Use EXPLAIN ANALYZE (runs the queries; PostgreSQL)',
+        )
+        parser.add_argument(
+            '--no-seqscan',
+            action='store_true',
+            help='Discourage sequential scans (PostgreSQL enable_seqscan = off)',
+        )
+        parser.add_argument(
+            '--strict',
+            action='store_true',
+            help='Exit with an error if any query uses a sequential scan',
+        )
+
+    def handle(self, *args, **options):
+        explain_options = {'analyze': True} if options['analyze'] else {}
+        flagged = []
+
+        with transaction.atomic():
+            if options['no_seqscan'] and connection.vendor == 'postgresql':
+                with connection.cursor() as cursor:
+                    cursor.execute('SET LOCAL enable_seqscan = off')
+
+            for name, queryset in get_hot_queries():
+                plan = queryset.explain(**explain_options)
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                self.stdout.write(plan)
+
+                tables = find_seq_scans(plan)
+                if tables:
+                    flagged.append(name)
+                    self.stdout.write(self.style.WARNING(
+                        f'⚠ Sequential scan on {", ".join(sorted(set(tables)))}'
+                    ))
+                else:
+                    self.stdout.write(self.style.SUCCESS('✓ Uses indexes'))
+                self.stdout.write('')
+
+        if flagged and options['strict']:
+            raise CommandError(f'Sequential scans in: {", ".join(flagged)}')
+        if flagged:
+            self.stdout.write(self.style.WARNING(f'{len(flagged)} queries use sequential scans'))
+        else:
+            self.stdout.write(self.style.SUCCESS('✓ All hot queries use indexes'))
@@ -0,0 +1,176 @@
+"""
+Management command to load test concurrent battery bookings
+Usage: python manage.py loadtest_booking [--batteries 20] [--users 200] [--attempts 3]
+
+Creates a throwaway station, batteries and subscribed users, has every user
+try to book random batteries at the same moment and checks that no battery
+was booked twice. Needs a database with row locks (PostgreSQL); SQLite
+serializes writers and will mostly report "database is locked" errors.
+"""
+
+import random
+import threading
+import time
+from collections import Counter
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.utils import timezone
+
+from battery.inventory import reconcile_station_counters
+from battery.models import Battery, Station, Vehicle
+from producer.models import Company
+from subscription.models import SubscriptionPlan, UserSubscription
+from user.booking import BookingConflict, book_battery
+from user.models import CustomUser, Order
+
+
+PREFIX = 'loadtest-booking'
+
+
+class Command(BaseCommand):
+    help = 'Book the same batteries from many threads and check for double-bookings'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batteries',
+            type=int,
+            default=20,
+            help='Batteries stocked at the test station',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=200,
+            help='Concurrent users (one thread each)',
+        )
+        parser.add_argument(
+            '--attempts',
+            type=int,
+            default=3,
+            help='Bookings each user tries',
+        )
+        parser.add_argument(
+            '--keep',
+            action='store_true',
+            help='Keep the test data afterwards',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write(self.style.SUCCESS('Creating test data...'))
+        fixtures = self._create_fixtures(options['batteries'], options['users'])
+        try:
+            results, elapsed = self._run(fixtures, options['attempts'])
+            self._report(fixtures, results, elapsed)
+        finally:
+            if not options['keep']:
+                self._delete_fixtures(fixtures)
+
+    def _create_fixtures(self, battery_count, user_count):
+        vehicle = Vehicle.objects.create(name=PREFIX)
+        company = Company.objects.create(name=PREFIX)
+        plan = SubscriptionPlan.objects.create(
+            name=f'{PREFIX}-{time.time_ns()}',
+            price=0,
+            swap_limit_per_month=1000,
+        )
+        station = Station.objects.create(name=PREFIX, latitude=0, longitude=0)
+        batteries = Battery.objects.bulk_create(
+            Battery(vehicle=vehicle, company=company, price=0)
+            for _ in range(battery_count)
+        )
+        station.batteries.add(*batteries)
+
+        users = CustomUser.objects.bulk_create(
+            CustomUser(
+                email=f'{PREFIX}-{i}@example.com',
+                username=f'{PREFIX}-{i}@example.com',
+                name=f'Load Test {i}',
+                user_type='consumer',
+            )
+            for i in range(user_count)
+        )
+        UserSubscription.objects.bulk_create(
+            UserSubscription(user=user, plan=plan, end_date=timezone.now() + timedelta(days=30))
+            for user in users
+        )
+        return {
+            'vehicle': vehicle,
+            'company': company,
+            'plan': plan,
+            'station': station,
+            'batteries': [battery.pk for battery in batteries],
+            'users': users,
+        }
+
+    def _run(self, fixtures, attempts):
+        results = Counter()
+        lock = threading.Lock()
+        start = threading.Barrier(len(fixtures['users']))
+
+        def worker(user):
+            rng = random.Random(user.pk)
+            start.wait()
+            try:
+                for _ in range(attempts):
+                    try:
+                        book_battery(user, fixtures['station'].pk, rng.choice(fixtures['batteries']))
+                        outcome = 'booked'
+                    except BookingConflict:
+                        outcome = 'conflict'
+                    except Exception as e:
+                        outcome = f'error: {e.__class__.__name__}: {e}'
+                    with lock:
+                        results[outcome] += 1
+            finally:
+                connection.close()
+
+        threads = [
+            threading.Thread(target=worker, args=[user]) for user in fixtures['users']
+        ]
+        began = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, time.monotonic() - began
+
+    def _report(self, fixtures, results, elapsed):
+        total = sum(results.values())
+        self.stdout.write(
+            f'{total} booking attempts in {elapsed:.2f}s ({total / elapsed:.0f}/s)'
+        )
+        for outcome, count in results.most_common():
+            self.stdout.write(f'  {outcome}: {count}')
+
+        station = Station.objects.get(pk=fixtures['station'].pk)
+        double_booked = (
+            Order.objects.filter(station=station)
+            .values('battery')
+            .annotate(orders=Count('pk'))
+            .filter(orders__gt=1)
+            .count()
+        )
+        orders = Order.objects.filter(station=station).count()
+        booked = station.booked_batteries.count()
+        drifted = reconcile_station_counters([station.pk], dry_run=True)
+
+        self.stdout.write(f'Orders: {orders}, booked batteries: {booked}')
+        if double_booked or orders != results['booked'] or booked != orders or drifted:
+            raise CommandError(
+                f'Inconsistent bookings: {double_booked} double-booked batteries, '
+                f'{orders} orders for {results["booked"]} successful bookings, '
+                f'{booked} booked batteries, {len(drifted)} drifted counters'
+            )
+        self.stdout.write(self.style.SUCCESS('✓ No double-bookings'))
+
+    def _delete_fixtures(self, fixtures):
+        Order.objects.filter(station=fixtures['station']).delete()
+        fixtures['station'].delete()
+        Battery.objects.filter(pk__in=fixtures['batteries']).delete()
+        CustomUser.objects.filter(pk__in=[user.pk for user in fixtures['users']]).delete()
+        fixtures['plan'].delete()
+        fixtures['vehicle'].delete()
+        fixtures['company'].delete()
@@ -0,0 +1,24 @@
+"""
+Management command to delete expired idempotency keys
+Usage: python manage.py purge_idempotency_keys [--batch-size 1000]
+"""
+
+from django.core.management.base import BaseCommand
+
+from user.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = 'Delete idempotency keys older than IDEMPOTENCY_KEY_TTL_HOURS'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Keys deleted per query',
+        )
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'✓ Deleted {deleted} expired idempotency keys'))
@@ -0,0 +1,44 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:41
+
+from django.db import migrations, models, transaction
+
+BATCH_SIZE = 5000
+
+
+def backfill_order_user(apps, schema_editor):
+    """
+    Copy the owner of each order from the User.orders M2M to Order.user,
+    one primary key range per short transaction, so rows are only locked
+    while their own batch is updated. Rows that already have a user are
+    skipped, so the migration can be re-run after an interruption.
+    """
+    Order = apps.get_model('user', 'Order')
+    User = apps.get_model('user', 'User')
+    owners = User.orders.through.objects.filter(
+        order_id=models.OuterRef('pk')
+    ).order_by('pk').values('user_id')[:1]
+
+    bounds = Order.objects.filter(user__isnull=True).aggregate(
+        first=models.Min('pk'), last=models.Max('pk')
+    )
+    if bounds['first'] is None:
+        return
+
+    for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+        with transaction.atomic():
+            Order.objects.filter(
+                pk__gte=start, pk__lt=start + BATCH_SIZE, user__isnull=True
+            ).update(user_id=models.Subquery(owners))
+
+
+class Migration(migrations.Migration):
+
+    atomic = False
+
+    dependencies = [
+        ('user', '0004_order_user'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_order_user, migrations.RunPython.noop),
+    ]
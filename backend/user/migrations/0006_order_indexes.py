@@ -0,0 +1,34 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:42
+
+from django.db import migrations, models
+
+from batteryswap.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    # Indexes on the orders table are built without blocking writes
+    atomic = False
+
+    dependencies = [
+        ('user', '0005_backfill_order_user'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['station', '-booked_time'], name='order_station_booked_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['-booked_time'], name='order_booked_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_paid', True)), fields=['booked_time'], name='order_paid_booked_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_collected', False)), fields=['expiry_time'], name='order_pending_expiry_idx'),
+        ),
+    ]
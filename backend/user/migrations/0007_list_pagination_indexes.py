@@ -0,0 +1,26 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:43
+
+from django.db import migrations, models
+
+from batteryswap.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    # Indexes on the orders table are built without blocking writes
+    atomic = False
+
+    dependencies = [
+        ('user', '0006_order_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(fields=['user', '-booked_time'], name='order_user_booked_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='user',
+            index=models.Index(fields=['-date_joined'], name='user_date_joined_idx'),
+        ),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('battery', '0007_station_inventory_seq'),
+        ('producer', '0002_initial'),
+        ('user', '0007_list_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenue',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='Day')),
+                ('revenue', models.FloatField(default=0, verbose_name='Revenue')),
+                ('bookings', models.PositiveIntegerField(default=0, verbose_name='Paid bookings')),
+                ('producer', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='producer.producer')),
+                ('station', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='battery.station')),
+            ],
+            options={
+                'verbose_name': 'Daily Revenue',
+                'verbose_name_plural': 'Daily Revenue',
+                'indexes': [models.Index(fields=['producer', 'day'], name='daily_revenue_producer_idx')],
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='dailyrevenue',
+            constraint=models.UniqueConstraint(fields=('day', 'station'), name='unique_daily_revenue_station'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.16 on 2026-10-18 01:49
+
+from django.db import migrations, models
+
+from batteryswap.operations import AddIndexConcurrently, RemoveIndexConcurrently
+
+
+class Migration(migrations.Migration):
+
+    # Indexes on the orders table are built without blocking writes
+    atomic = False
+
+    dependencies = [
+        ('user', '0008_dailyrevenue'),
+    ]
+
+    # The new partial index is built under a new name before the old one
+    # is dropped, so the expiry sweep always has an index to use
+    operations = [
+        migrations.AddField(
+            model_name='order',
+            name='is_expired',
+            field=models.BooleanField(default=False, verbose_name='Expired before collection'),
+        ),
+        AddIndexConcurrently(
+            model_name='order',
+            index=models.Index(condition=models.Q(('is_collected', False), ('is_expired', False)), fields=['expiry_time'], name='order_open_expiry_idx'),
+        ),
+        RemoveIndexConcurrently(
+            model_name='order',
+            name='order_pending_expiry_idx',
+        ),
+    ]
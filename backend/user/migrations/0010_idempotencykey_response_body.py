@@ -0,0 +1,42 @@
+# Generated by Django 4.2.16 on 2026-10-18 02:09
+
+import json
+
+from django.db import migrations, models
+
+
+def encode_stored_responses(apps, schema_editor):
+    """
+    Keep keys stored before this migration replayable: encode their JSON
+    response as the body (as precise as the stored data allows).
+    """
+    IdempotencyKey = apps.get_model('user', 'IdempotencyKey')
+    for record in IdempotencyKey.objects.filter(response__isnull=False).iterator():
+        record.response_body = json.dumps(record.response).encode()
+        record.response_content_type = 'application/json'
+        record.save(update_fields=['response_body', 'response_content_type'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0009_order_is_expired'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='response_body',
+            field=models.BinaryField(null=True, verbose_name='Response body'),
+        ),
+        migrations.AddField(
+            model_name='idempotencykey',
+            name='response_content_type',
+            field=models.CharField(blank=True, max_length=100, verbose_name='Response content type'),
+        ),
+        migrations.RunPython(encode_stored_responses, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='idempotencykey',
+            name='response',
+        ),
+    ]
@@ -24,6 +24,7 @@ class User(AbstractUser):
     is_active = models.BooleanField(default=True)
     is_email_verified = models.BooleanField(default=False)
     is_staff = models.BooleanField(default=False)
+    # Superseded by Order.user; still written by bookings until it is dropped
     orders = models.ManyToManyField(
         "Order", related_name="Orders", blank=True
     )
@@ -51,6 +52,10 @@ class User(AbstractUser):
     class Meta:
         verbose_name = "User"
         verbose_name_plural = "Users"
+        indexes = [
+            # Admin user list, newest first
+            models.Index(fields=["-date_joined"], name="user_date_joined_idx"),
+        ]
 
     def __str__(self):
         return self.email
@@ -67,16 +72,101 @@ CustomUser = User
 
 
 class Order(models.Model):
+    # Indexed by order_user_booked_idx (user first), so no separate index
+    user = models.ForeignKey(
+        "user.User", on_delete=models.SET_NULL, null=True, blank=True, db_index=False
+    )
     battery = models.ForeignKey("battery.Battery", on_delete=models.CASCADE)
     station = models.ForeignKey("battery.Station", on_delete=models.CASCADE)
     is_paid = models.BooleanField("Is paid by user", default=False)
     is_collected = models.BooleanField("Is collected by user", default=False)
+    # Set by the expiry sweeper when it releases the battery
+    is_expired = models.BooleanField("Expired before collection", default=False)
     booked_time = models.DateTimeField("Order booked at", auto_now_add=True)
     expiry_time = models.DateTimeField("Order expires on")
 
     class Meta:
         verbose_name = "Order"
         verbose_name_plural = "Orders"
+        indexes = [
+            # Producer station bookings, newest first
+            models.Index(fields=["station", "-booked_time"], name="order_station_booked_idx"),
+            # Admin booking lists, newest first
+            models.Index(fields=["-booked_time"], name="order_booked_idx"),
+            # A user's order history, newest first
+            models.Index(fields=["user", "-booked_time"], name="order_user_booked_idx"),
+            # Revenue over a date range only reads paid orders
+            models.Index(
+                fields=["booked_time"],
+                condition=models.Q(is_paid=True),
+                name="order_paid_booked_idx",
+            ),
+            # Orders still holding a battery, by expiry (expiry sweeper)
+            models.Index(
+                fields=["expiry_time"],
+                condition=models.Q(is_collected=False, is_expired=False),
+                name="order_open_expiry_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"{self.battery} from {self.station.name}"
+
+
+class DailyRevenue(models.Model):
+    """
+    Paid bookings and revenue per station per (local) day, kept up to date
+    as bookings commit. Rebuild a range with
+    ``manage.py backfill_daily_revenue``.
+    """
+
+    day = models.DateField("Day")
+    station = models.ForeignKey("battery.Station", on_delete=models.CASCADE)
+    # Owner of the station, copied so charts can filter without a join
+    producer = models.ForeignKey(
+        "producer.Producer", on_delete=models.SET_NULL, null=True, blank=True
+    )
+    revenue = models.FloatField("Revenue", default=0)
+    bookings = models.PositiveIntegerField("Paid bookings", default=0)
+
+    class Meta:
+        verbose_name = "Daily Revenue"
+        verbose_name_plural = "Daily Revenue"
+        constraints = [
+            models.UniqueConstraint(fields=["day", "station"], name="unique_daily_revenue_station"),
+        ]
+        indexes = [
+            models.Index(fields=["producer", "day"], name="daily_revenue_producer_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.day} at station {self.station_id}: {self.revenue}"
+
+
+class IdempotencyKey(models.Model):
+    """
+    Response of a request made with an Idempotency-Key header, replayed
+    when the client retries it. Expired keys are removed with
+    ``manage.py purge_idempotency_keys``.
+    """
+
+    user = models.ForeignKey(
+        "user.User", on_delete=models.CASCADE, related_name="idempotency_keys"
+    )
+    key = models.CharField("Idempotency key", max_length=255)
+    request_fingerprint = models.CharField("Request fingerprint", max_length=64)
+    status_code = models.PositiveSmallIntegerField("Response status", null=True)
+    # The rendered body, so a replay is byte-for-byte the original
+    response_body = models.BinaryField("Response body", null=True)
+    response_content_type = models.CharField("Response content type", max_length=100, blank=True)
+    created_at = models.DateTimeField("Created at", auto_now_add=True, db_index=True)
+
+    class Meta:
+        verbose_name = "Idempotency Key"
+        verbose_name_plural = "Idempotency Keys"
+        constraints = [
+            models.UniqueConstraint(fields=["user", "key"], name="unique_user_idempotency_key"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id}: {self.key}"
@@ -0,0 +1,156 @@
+"""
+Daily revenue rollup
+Each paid booking adds to its station's DailyRevenue row in the booking's
+transaction, so revenue charts read one row per station per day instead
+of every paid order.
+"""
+
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+
+from user.models import DailyRevenue, Order
+
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Longest range the revenue chart accepts, in days
+MAX_CHART_DAYS = 3660
+
+
+def add_daily_revenue(order):
+    """
+    Count a paid order in its station's row for the (local) day it was
+    booked. Call it in the order's transaction so the rollup commits, or
+    rolls back, with the booking.
+
+    Args:
+        order: New Order, with its station and battery loaded
+    """
+    if not order.is_paid:
+        return
+    day = timezone.localdate(order.booked_time)
+    price = order.battery.price
+    rows = DailyRevenue.objects.filter(day=day, station_id=order.station_id)
+    increments = {'revenue': F('revenue') + price, 'bookings': F('bookings') + 1}
+
+    if rows.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            DailyRevenue.objects.create(
+                day=day,
+                station_id=order.station_id,
+                producer_id=order.station.owner_id,
+                revenue=price,
+                bookings=1,
+            )
+    except IntegrityError:
+        # A concurrent booking created the row first
+        rows.update(**increments)
+
+
+def rebuild_daily_revenue(start, end):
+    """
+    Recompute the rollup for a range of days from the orders table.
+
+    Bookings committing while a day is rebuilt can be missed; rebuild
+    the current day again once it is quiet.
+
+    Args:
+        start: First day (date, local time)
+        end: Last day, inclusive
+
+    Returns:
+        int: Number of rollup rows written
+    """
+    tz = timezone.get_current_timezone()
+    since = timezone.make_aware(datetime.datetime.combine(start, datetime.time.min), tz)
+    until = timezone.make_aware(
+        datetime.datetime.combine(end + datetime.timedelta(days=1), datetime.time.min), tz
+    )
+
+    with transaction.atomic():
+        totals = (
+            Order.objects.filter(is_paid=True, booked_time__gte=since, booked_time__lt=until)
+            .annotate(day=TruncDate('booked_time', tzinfo=tz))
+            .values('day', 'station_id', 'station__owner_id')
+            .annotate(revenue=Sum('battery__price'), bookings=Count('pk'))
+        )
+        rows = [
+            DailyRevenue(
+                day=total['day'],
+                station_id=total['station_id'],
+                producer_id=total['station__owner_id'],
+                revenue=total['revenue'] or 0,
+                bookings=total['bookings'],
+            )
+            for total in totals
+        ]
+        DailyRevenue.objects.filter(day__gte=start, day__lte=end).delete()
+        DailyRevenue.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
+
+
+def get_bucket_start(day, granularity):
+    """First day of the day, week (Monday) or month containing day"""
+    if granularity == 'week':
+        return day - datetime.timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def iter_buckets(start, end, granularity):
+    bucket = get_bucket_start(start, granularity)
+    while bucket <= end:
+        yield bucket
+        if granularity == 'month':
+            bucket = (bucket + datetime.timedelta(days=32)).replace(day=1)
+        else:
+            bucket += datetime.timedelta(days=7 if granularity == 'week' else 1)
+
+
+def get_revenue_chart(start, end, granularity='day', producer_id=None):
+    """
+    Paid revenue and bookings per bucket, read from the rollup.
+
+    Args:
+        start: First day (date)
+        end: Last day, inclusive
+        granularity: 'day', 'week' or 'month'
+        producer_id: Only count this producer's stations
+
+    Returns:
+        list: {'date', 'revenue', 'bookings'} per bucket, oldest first,
+        with empty buckets included
+    """
+    rows = DailyRevenue.objects.filter(day__gte=start, day__lte=end)
+    if producer_id is not None:
+        rows = rows.filter(producer_id=producer_id)
+
+    if granularity == 'week':
+        rows = rows.annotate(bucket=TruncWeek('day'))
+    elif granularity == 'month':
+        rows = rows.annotate(bucket=TruncMonth('day'))
+    else:
+        rows = rows.annotate(bucket=F('day'))
+    totals = {
+        total['bucket']: total
+        for total in rows.values('bucket').annotate(
+            total_revenue=Sum('revenue'), total_bookings=Sum('bookings')
+        )
+    }
+
+    chart = []
+    for bucket in iter_buckets(start, end, granularity):
+        total = totals.get(bucket, {})
+        chart.append({
+            'date': bucket.isoformat(),
+            'revenue': total.get('total_revenue') or 0,
+            'bookings': total.get('total_bookings') or 0,
+        })
+    return chart
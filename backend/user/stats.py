@@ -0,0 +1,89 @@
+"""
+Admin dashboard statistics
+Every figure comes from a few aggregate queries; the platform totals are
+cached for DASHBOARD_STATS_CACHE_TTL seconds. Orders are written on every
+booking, so the cache is not dropped per write (it would hardly ever hit).
+"""
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, F, FloatField, Q, Sum
+from django.db.models.functions import Coalesce
+
+from battery.models import Battery, Station
+from producer.models import Producer
+from user.models import CustomUser, Order
+
+
+DASHBOARD_STATS_KEY = 'stats:admin_dashboard'
+
+
+def get_dashboard_stats_ttl():
+    return getattr(settings, 'DASHBOARD_STATS_CACHE_TTL', 60)
+
+
+def load_dashboard_stats():
+    """
+    Compute the dashboard figures in the database.
+
+    Returns:
+        dict: Counts and paid revenue for the admin landing page
+    """
+    users = CustomUser.objects.aggregate(
+        total_users=Count('pk'),
+        total_consumers=Count('pk', filter=Q(user_type='consumer')),
+        # Producer.user is one-to-one, so the join adds no rows
+        total_producers=Count('producer'),
+    )
+    orders = Order.objects.aggregate(
+        total_orders=Count('pk'),
+        paid_orders=Count('pk', filter=Q(is_paid=True)),
+        total_revenue=Sum('battery__price', filter=Q(is_paid=True)),
+    )
+    return {
+        **users,
+        'total_stations': Station.objects.count(),
+        'total_batteries': Battery.objects.count(),
+        **orders,
+        'total_revenue': orders['total_revenue'] or 0,
+    }
+
+
+# Names AdminListProducers can sort by
+PRODUCER_ORDERINGS = (
+    'pk', 'name', 'date_joined', 'total_stations', 'total_bookings', 'total_revenue',
+)
+
+
+def get_producer_stats():
+    """
+    Producers annotated with their station count, booking count and paid
+    revenue, grouped in one query.
+
+    Producer -> stations -> orders is a single chain of joins, so each
+    order appears in exactly one row and the sums aren't multiplied.
+
+    Returns:
+        QuerySet: Producers with total_stations, total_bookings and
+        total_revenue (plus name and date_joined for sorting)
+    """
+    return Producer.objects.select_related('user', 'company').annotate(
+        name=F('user__name'),
+        date_joined=F('user__date_joined'),
+        total_stations=Count('stations', distinct=True),
+        total_bookings=Count('stations__order'),
+        total_revenue=Coalesce(
+            Sum('stations__order__battery__price', filter=Q(stations__order__is_paid=True)),
+            0.0,
+            output_field=FloatField(),
+        ),
+    )
+
+
+def get_dashboard_stats():
+    """Dashboard figures, from the cache when fresh"""
+    stats = cache.get(DASHBOARD_STATS_KEY)
+    if stats is None:
+        stats = load_dashboard_stats()
+        cache.set(DASHBOARD_STATS_KEY, stats, get_dashboard_stats_ttl())
+    return stats
@@ -0,0 +1,19 @@
+"""
+Celery tasks for orders
+"""
+
+from celery import shared_task
+
+from user.expiry import release_expired_orders
+
+
+@shared_task
+def expire_orders():
+    """
+    Release the batteries of uncollected orders past their expiry time.
+    Scheduled by CELERY_BEAT_SCHEDULE.
+
+    Returns:
+        int: Number of orders expired
+    """
+    return release_expired_orders()
@@ -1 +1,465 @@
-from django.test import TestCase
+import csv
+import json
+from datetime import timedelta
+from io import StringIO
+
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from battery.models import Battery, Station, Vehicle
+from producer.models import Company, Producer
+from subscription.models import SubscriptionPlan, UserSubscription
+from user.expiry import release_expired_orders
+from user.idempotency import purge_expired_keys
+from user.management.commands.explain_hot_queries import find_seq_scans
+from user.models import CustomUser, DailyRevenue, IdempotencyKey, Order
+from user.stats import DASHBOARD_STATS_KEY, get_dashboard_stats
+from user.views import AdminListBookingsPaginated
+
+
+IN_MEMORY_CHANNEL_LAYERS = {
+    "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+}
+
+LOCMEM_CACHES = {
+    "default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"},
+}
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CACHES=LOCMEM_CACHES)
+class BookingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.plan = SubscriptionPlan.objects.create(
+            name="Basic", price=9.99, swap_limit_per_month=10
+        )
+        self.station = Station.objects.create(name="Hub", latitude=10.0, longitude=76.0)
+        self.battery = Battery.objects.create(
+            vehicle=Vehicle.objects.create(name="Ather 450X"),
+            company=Company.objects.create(name="Volt"),
+            price=100,
+        )
+        self.station.batteries.add(self.battery)
+
+    def create_user(self, email, subscribed=True):
+        user = CustomUser.objects.create_user(
+            email=email, name="Rider", username=email, user_type="consumer"
+        )
+        if subscribed:
+            UserSubscription.objects.create(
+                user=user, plan=self.plan, end_date=timezone.now() + timedelta(days=30)
+            )
+        return user
+
+    def book(self, user, key=None, battery=None):
+        client = APIClient()
+        client.force_authenticate(user)
+        headers = {"HTTP_IDEMPOTENCY_KEY": key} if key else {}
+        return client.post(
+            reverse("user_orders"),
+            {"station": self.station.pk, "battery": battery or self.battery.pk},
+            format="json",
+            **headers,
+        )
+
+    def test_battery_can_only_be_booked_once(self):
+        first = self.book(self.create_user("first@example.com"))
+        second = self.book(self.create_user("second@example.com"))
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(second.status_code, 409)
+        self.assertEqual(second.data["error_code"], "BATTERY_UNAVAILABLE")
+        self.assertEqual(Order.objects.count(), 1)
+
+        self.station.refresh_from_db()
+        self.assertEqual(self.station.available_battery_count, 0)
+        self.assertEqual(self.station.booked_battery_count, 1)
+        self.assertEqual(list(self.station.booked_batteries.all()), [self.battery])
+        self.assertFalse(
+            self.station.compatible_vehicles.filter(available_batteries__gt=0).exists()
+        )
+
+    def test_orders_are_looked_up_by_owner(self):
+        owner = self.create_user("owner@example.com")
+        order_pk = self.book(owner).data["order_pk"]
+        self.assertEqual(Order.objects.get(pk=order_pk).user, owner)
+
+        client = APIClient()
+        client.force_authenticate(owner)
+        self.assertTrue(client.get(reverse("user_order", args=[order_pk])).data["success"])
+        orders = client.get(reverse("user_orders")).data["orders"]
+        self.assertEqual([order["pk"] for order in orders], [order_pk])
+
+        client.force_authenticate(self.create_user("other@example.com"))
+        self.assertFalse(client.get(reverse("user_order", args=[order_pk])).data["success"])
+        self.assertEqual(client.get(reverse("user_orders")).data["orders"], [])
+
+    def test_booking_without_subscription_changes_nothing(self):
+        response = self.book(self.create_user("rider@example.com", subscribed=False))
+
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(response.data["error_code"], "SUBSCRIPTION_LIMIT_EXCEEDED")
+        self.assertEqual(Order.objects.count(), 0)
+        self.assertTrue(self.station.batteries.filter(pk=self.battery.pk).exists())
+
+    def test_retry_with_idempotency_key_replays_response(self):
+        user = self.create_user("rider@example.com")
+
+        first = self.book(user, key="retry-1")
+        retry = self.book(user, key="retry-1")
+
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(retry.status_code, 200)
+        # Byte-for-byte, including microsecond timestamps
+        self.assertEqual(retry.content, first.content)
+        self.assertEqual(retry["Content-Type"], first["Content-Type"])
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(self.station.booked_batteries.count(), 1)
+
+        reused = self.book(user, key="retry-1", battery=self.battery.pk + 1)
+        self.assertEqual(reused.status_code, 422)
+
+    def test_booking_adds_to_daily_revenue(self):
+        self.book(self.create_user("rider@example.com"))
+
+        rollup = DailyRevenue.objects.get()
+        self.assertEqual(rollup.day, timezone.localdate())
+        self.assertEqual(rollup.station, self.station)
+        self.assertEqual((rollup.revenue, rollup.bookings), (100, 1))
+
+    def test_expired_orders_release_their_battery(self):
+        user = self.create_user("rider@example.com")
+        order_pk = self.book(user).data["order_pk"]
+        Order.objects.update(expiry_time=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(release_expired_orders(batch_size=10), 1)
+        self.assertEqual(release_expired_orders(batch_size=10), 0)
+
+        self.assertTrue(Order.objects.get(pk=order_pk).is_expired)
+        self.station.refresh_from_db()
+        self.assertEqual(self.station.available_battery_count, 1)
+        self.assertEqual(self.station.booked_battery_count, 0)
+        self.assertEqual(list(self.station.batteries.all()), [self.battery])
+
+        client = APIClient()
+        client.force_authenticate(user)
+        response = client.get(reverse("order_collect", args=[order_pk]))
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(self.book(self.create_user("next@example.com")).status_code, 200)
+
+    def test_expired_keys_are_purged(self):
+        user = self.create_user("rider@example.com")
+        self.book(user, key="old")
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+
+        self.assertEqual(purge_expired_keys(), 1)
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+
+class ExplainHotQueriesTests(TestCase):
+    def test_seq_scans_are_detected(self):
+        self.assertEqual(find_seq_scans("Seq Scan on user_order  (cost=0.00..35.50)"), ["user_order"])
+        self.assertEqual(find_seq_scans("3 0 0 SCAN user_order"), ["user_order"])
+        self.assertEqual(find_seq_scans("5 0 0 SCAN user_order USING INDEX order_booked_idx"), [])
+
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        call_command("explain_hot_queries", "--strict", stdout=out)
+        self.assertIn("All hot queries use indexes", out.getvalue())
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CACHES=LOCMEM_CACHES)
+class OrderHistoryPaginationTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(
+            email="rider@example.com", name="Rider", username="rider@example.com", user_type="consumer"
+        )
+        station = Station.objects.create(name="Hub", latitude=10.0, longitude=76.0)
+        battery = Battery.objects.create(
+            vehicle=Vehicle.objects.create(name="Ather 450X"),
+            company=Company.objects.create(name="Volt"),
+            price=100,
+        )
+        booked_time = timezone.now()
+        self.orders = [
+            Order.objects.create(
+                user=self.user, battery=battery, station=station, expiry_time=booked_time
+            )
+            for _ in range(5)
+        ]
+        # Two orders share a timestamp, so the pk has to break the tie
+        Order.objects.filter(pk__in=[o.pk for o in self.orders[:2]]).update(booked_time=booked_time)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_cursor_pages_cover_every_order_once(self):
+        seen = []
+        params = {"page_size": 2}
+        while True:
+            response = self.client.get(reverse("user_orders"), params)
+            self.assertEqual(response.status_code, 200)
+            self.assertLessEqual(len(response.data["orders"]), 2)
+            self.assertEqual(response.data["total"], 5)
+            seen += [order["pk"] for order in response.data["orders"]]
+            if not response.data["has_next"]:
+                break
+            params["cursor"] = response.data["next_cursor"]
+
+        expected = Order.objects.order_by("-booked_time", "-pk").values_list("pk", flat=True)
+        self.assertEqual(seen, list(expected))
+
+    def test_invalid_cursor_is_rejected(self):
+        response = self.client.get(reverse("user_orders"), {"cursor": "not-a-cursor"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_admin_numbered_pages_are_capped(self):
+        self.user.user_type = "admin"
+        self.user.save()
+        url = reverse("admin_bookings_paginated")
+
+        response = self.client.get(url, {"page": 2, "page_size": 2})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data["bookings"]), 2)
+
+        deep = AdminListBookingsPaginated.MAX_PAGE_OFFSET // 2 + 2
+        response = self.client.get(url, {"page": deep, "page_size": 2})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CACHES=LOCMEM_CACHES)
+class DashboardStatsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.station = Station.objects.create(name="Hub", latitude=10.0, longitude=76.0)
+        self.battery = Battery.objects.create(
+            vehicle=Vehicle.objects.create(name="Ather 450X"),
+            company=Company.objects.create(name="Volt"),
+            price=100,
+        )
+
+    def create_order(self, is_paid):
+        return Order.objects.create(
+            battery=self.battery, station=self.station, expiry_time=timezone.now(), is_paid=is_paid
+        )
+
+    def test_stats_are_aggregated_in_the_database(self):
+        self.create_order(is_paid=True)
+        self.create_order(is_paid=True)
+        self.create_order(is_paid=False)
+        CustomUser.objects.create_user(
+            email="rider@example.com", name="Rider", username="rider@example.com", user_type="consumer"
+        )
+
+        with self.assertNumQueries(4):
+            stats = get_dashboard_stats()
+        self.assertEqual(stats["total_orders"], 3)
+        self.assertEqual(stats["paid_orders"], 2)
+        self.assertEqual(stats["total_revenue"], 200)
+        self.assertEqual(stats["total_consumers"], 1)
+        self.assertEqual(stats["total_stations"], 1)
+
+        with self.assertNumQueries(0):
+            get_dashboard_stats()
+
+    def test_order_writes_keep_cached_stats_until_expiry(self):
+        self.assertEqual(get_dashboard_stats()["total_orders"], 0)
+        order = self.create_order(is_paid=False)
+        order.is_paid = True
+        order.save()
+
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard_stats()["total_orders"], 0)
+
+        # Once the entry expires the figures are recomputed
+        cache.delete(DASHBOARD_STATS_KEY)
+        stats = get_dashboard_stats()
+        self.assertEqual((stats["total_orders"], stats["total_revenue"]), (1, 100))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CACHES=LOCMEM_CACHES)
+class AdminListProducersTests(TestCase):
+    def setUp(self):
+        company = Company.objects.create(name="Volt")
+        battery = Battery.objects.create(
+            vehicle=Vehicle.objects.create(name="Ather 450X"), company=company, price=100
+        )
+        # (stations, paid orders per station, unpaid orders per station)
+        for i, (stations, paid, unpaid) in enumerate([(1, 3, 0), (2, 1, 1), (0, 0, 0)]):
+            user = CustomUser.objects.create_user(
+                email=f"producer{i}@example.com", name=f"Producer {i}",
+                username=f"producer{i}@example.com", user_type="producer",
+            )
+            producer = Producer.objects.create(user=user, company=company)
+            for _ in range(stations):
+                station = Station.objects.create(
+                    name="Hub", latitude=10.0, longitude=76.0, owner=producer
+                )
+                for is_paid in [True] * paid + [False] * unpaid:
+                    Order.objects.create(
+                        battery=battery, station=station, expiry_time=timezone.now(), is_paid=is_paid
+                    )
+        admin = CustomUser.objects.create_user(
+            email="admin@example.com", name="Admin", username="admin@example.com", user_type="admin"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def test_producers_are_ranked_by_metric_across_pages(self):
+        rows = []
+        params = {"ordering": "-total_revenue", "page_size": 1}
+        while True:
+            response = self.client.get(reverse("admin_producers"), params)
+            self.assertEqual(response.status_code, 200)
+            rows += response.data["producers"]
+            if not response.data["has_next"]:
+                break
+            params["cursor"] = response.data["next_cursor"]
+
+        self.assertEqual(
+            [(r["name"], r["total_stations"], r["total_bookings"], r["total_revenue"]) for r in rows],
+            [("Producer 0", 1, 3, 300), ("Producer 1", 2, 4, 200), ("Producer 2", 0, 0, 0)],
+        )
+
+    def test_unknown_ordering_is_rejected(self):
+        response = self.client.get(reverse("admin_producers"), {"ordering": "password"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CACHES=LOCMEM_CACHES)
+class RevenueChartTests(TestCase):
+    def setUp(self):
+        company = Company.objects.create(name="Volt")
+        self.battery = Battery.objects.create(
+            vehicle=Vehicle.objects.create(name="Ather 450X"), company=company, price=100
+        )
+        self.producers = []
+        for i in range(2):
+            user = CustomUser.objects.create_user(
+                email=f"producer{i}@example.com", name=f"Producer {i}",
+                username=f"producer{i}@example.com", user_type="producer",
+            )
+            self.producers.append(Producer.objects.create(user=user, company=company))
+        self.stations = [
+            Station.objects.create(name="Hub", latitude=10.0, longitude=76.0, owner=producer)
+            for producer in self.producers
+        ]
+        admin = CustomUser.objects.create_user(
+            email="admin@example.com", name="Admin", username="admin@example.com", user_type="admin"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def create_order(self, station, days_ago, is_paid=True):
+        order = Order.objects.create(
+            battery=self.battery, station=station, expiry_time=timezone.now(), is_paid=is_paid
+        )
+        Order.objects.filter(pk=order.pk).update(
+            booked_time=timezone.now() - timedelta(days=days_ago)
+        )
+
+    def test_backfill_rebuilds_rollup_from_orders(self):
+        self.create_order(self.stations[0], days_ago=0)
+        self.create_order(self.stations[0], days_ago=0)
+        self.create_order(self.stations[0], days_ago=0, is_paid=False)
+        self.create_order(self.stations[1], days_ago=3)
+        DailyRevenue.objects.create(day=timezone.localdate(), station=self.stations[0], revenue=5)
+
+        call_command("backfill_daily_revenue", "--days", "7", stdout=StringIO())
+
+        self.assertEqual(
+            sorted(DailyRevenue.objects.values_list("station", "producer", "revenue", "bookings")),
+            [
+                (self.stations[0].pk, self.producers[0].pk, 200, 2),
+                (self.stations[1].pk, self.producers[1].pk, 100, 1),
+            ],
+        )
+
+    def test_chart_reads_rollup_by_granularity_and_producer(self):
+        today = timezone.localdate()
+        for days_ago, station in [(0, 0), (1, 0), (40, 1), (400, 0)]:
+            DailyRevenue.objects.create(
+                day=today - timedelta(days=days_ago),
+                station=self.stations[station],
+                producer=self.producers[station],
+                revenue=100,
+                bookings=1,
+            )
+
+        default = self.client.get(reverse("admin_revenue_chart")).data
+        self.assertEqual(len(default["chart"]), 30)
+        self.assertEqual(default["summary"]["total_revenue"], 200)
+
+        monthly = self.client.get(
+            reverse("admin_revenue_chart"), {"days": 365, "granularity": "month"}
+        ).data
+        self.assertIn(len(monthly["chart"]), (12, 13))
+        self.assertEqual(monthly["summary"]["total_bookings"], 3)
+
+        weekly = self.client.get(
+            reverse("admin_revenue_chart"),
+            {"days": 365, "granularity": "week", "producer": self.producers[1].pk},
+        ).data
+        self.assertEqual(
+            [(d["date"], d["bookings"]) for d in weekly["chart"] if d["bookings"]],
+            [((today - timedelta(days=40 + (today - timedelta(days=40)).weekday())).isoformat(), 1)],
+        )
+
+        response = self.client.get(reverse("admin_revenue_chart"), {"granularity": "hour"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, CACHES=LOCMEM_CACHES)
+class AdminExportTests(TestCase):
+    def setUp(self):
+        station = Station.objects.create(name="=Hub", latitude=10.0, longitude=76.0)
+        battery = Battery.objects.create(
+            vehicle=Vehicle.objects.create(name="Ather 450X"),
+            company=Company.objects.create(name="Volt"),
+            price=100,
+        )
+        for days_ago in (0, 1, 40):
+            order = Order.objects.create(
+                battery=battery, station=station, expiry_time=timezone.now(), is_paid=True
+            )
+            Order.objects.filter(pk=order.pk).update(
+                booked_time=timezone.now() - timedelta(days=days_ago)
+            )
+        admin = CustomUser.objects.create_user(
+            email="admin@example.com", name="Admin", username="admin@example.com", user_type="admin"
+        )
+        self.client = APIClient()
+        self.client.force_authenticate(admin)
+
+    def export(self, **params):
+        return self.client.get(reverse("admin_bookings_export"), params)
+
+    def test_bookings_stream_as_csv(self):
+        since = (timezone.localdate() - timedelta(days=7)).isoformat()
+        response = self.export(**{"from": since})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        rows = list(csv.DictReader(b"".join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[0]["price"], "100.0")
+        # Cells are escaped so spreadsheets don't run them as formulas
+        self.assertEqual(rows[0]["station_name"], "'=Hub")
+
+    def test_bookings_stream_as_ndjson(self):
+        response = self.export(format="ndjson")
+
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        orders = [json.loads(line) for line in lines]
+        self.assertEqual(len(orders), 3)
+        self.assertEqual(orders[0]["station_name"], "=Hub")
+        self.assertLess(orders[0]["booked_time"], orders[-1]["booked_time"])
+
+    def test_invalid_params_are_rejected(self):
+        self.assertEqual(self.export(format="xlsx").status_code, 400)
+        self.assertEqual(self.export(**{"from": "yesterday"}).status_code, 400)
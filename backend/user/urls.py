@@ -21,6 +21,9 @@ from user.views import (
     AdminListSubscriptions,
     AdminListBookingsPaginated,
     AdminRevenueChart,
+    AdminExportBookings,
+    AdminExportSubscriptions,
+    AdminExportRevenue,
 )
 
 
@@ -42,6 +45,9 @@ urlpatterns = [
     path('admin/stations/', AdminListStations.as_view(), name='admin_stations'),
     path('admin/bookings/', AdminListBookings.as_view(), name='admin_bookings'),
     path('admin/subscriptions/', AdminListSubscriptions.as_view(), name='admin_subscriptions'),
+    path('admin/bookings/export/', AdminExportBookings.as_view(), name='admin_bookings_export'),
+    path('admin/subscriptions/export/', AdminExportSubscriptions.as_view(), name='admin_subscriptions_export'),
+    path('admin/revenue/export/', AdminExportRevenue.as_view(), name='admin_revenue_export'),
     path('admin/bookings/paginated/', AdminListBookingsPaginated.as_view(), name='admin_bookings_paginated'),
     path('admin/revenue/chart/', AdminRevenueChart.as_view(), name='admin_revenue_chart'),
 ]
@@ -5,16 +5,37 @@ from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 
 from django.contrib.auth import authenticate, login
-from user.models import Order, CustomUser
+from django.db import transaction
+from django.utils import timezone
+from user.models import DailyRevenue, Order, CustomUser
 from consumer.models import Consumer
 from producer.models import Company, Producer
-from battery.models import Battery, Station, Vehicle
+from battery.models import Station, Vehicle
 from battery.websocket_utils import (
-    broadcast_battery_booked,
     broadcast_battery_collected,
     notify_booking_ready,
 )
-from subscription.utils import can_create_order, get_subscription_status
+from subscription.models import UserSubscription
+from subscription.utils import get_subscription_status
+from user.booking import BookingConflict, SubscriptionLimitExceeded, book_battery
+from user.idempotency import idempotent
+from user.revenue import GRANULARITIES, MAX_CHART_DAYS, get_revenue_chart
+from user.stats import PRODUCER_ORDERINGS, get_dashboard_stats, get_producer_stats
+from batteryswap.export import (
+    ExportContentNegotiation,
+    InvalidExport,
+    export_response,
+    get_datetime_range,
+    get_export_params,
+)
+from batteryswap.pagination import (
+    InvalidPage,
+    count_queryset,
+    get_count_mode,
+    get_ordering,
+    get_page_size,
+    paginate_queryset,
+)
 
 
 from user.serializers import SignupSerializer, UserSerializer
@@ -170,45 +191,24 @@ class Orders(views.APIView):
     permission_classes = [IsAuthenticated]
     
     def post(self, request, *args, **kwargs):
+        # Retries with the same Idempotency-Key get the original response
+        return idempotent(self.book, request, *args, **kwargs)
+
+    def book(self, request, *args, **kwargs):
         try:
-            # Check subscription and swap limit BEFORE creating order
-            can_create, error_message = can_create_order(request.user)
-            
-            if not can_create:
-                return Response(
-                    data={
-                        "success": False,
-                        "message": error_message,
-                        "error_code": "SUBSCRIPTION_LIMIT_EXCEEDED"
-                    },
-                    status=status.HTTP_403_FORBIDDEN
-                )
-            
             print(request.data)
-            battery = Battery.objects.get(pk=request.data.get("battery"))
-            station = Station.objects.get(pk=request.data.get("station"))
-            user = CustomUser.objects.get(pk=request.user.pk)
-
-            station.batteries.remove(battery)
-            station.booked_batteries.add(battery)
-            station.save()
-
-            order = Order.objects.create(
-                battery=battery,
-                station=station,
-                expiry_time=datetime.datetime.now() + datetime.timedelta(days=1),
-                is_paid=True,
+            # Subscription check, battery claim and order creation run in
+            # one transaction (see user/booking.py)
+            order = book_battery(
+                request.user,
+                request.data.get("station"),
+                request.data.get("battery"),
             )
-            order.save()
-
-            user.orders.add(order)
-            user.save()
-
-            # Broadcast battery booked event via WebSocket
-            broadcast_battery_booked(station, battery, user)
             
             # Get updated subscription status
-            subscription_status = get_subscription_status(user)
+            subscription_status = get_subscription_status(
+                request.user, swaps_used=order.swaps_used
+            )
 
             return Response(
                 data={
@@ -218,6 +218,24 @@ class Orders(views.APIView):
                 },
                 status=status.HTTP_200_OK
             )
+        except SubscriptionLimitExceeded as e:
+            return Response(
+                data={
+                    "success": False,
+                    "message": e.message,
+                    "error_code": e.error_code
+                },
+                status=status.HTTP_403_FORBIDDEN
+            )
+        except BookingConflict as e:
+            return Response(
+                data={
+                    "success": False,
+                    "message": e.message,
+                    "error_code": e.error_code
+                },
+                status=status.HTTP_409_CONFLICT
+            )
         except Exception as e:
             print(e)
             return Response(
@@ -228,10 +246,23 @@ class Orders(views.APIView):
     def get(self, request, *args, **kwargs):
         try:
             orders_data = []
-            for order in request.user.orders.all():
+            orders, page = paginate_queryset(
+                request,
+                Order.objects.filter(user=request.user).select_related(
+                    'station', 'battery__vehicle', 'battery__company'
+                ),
+                ('-booked_time', '-pk'),
+            )
+            for order in orders:
                 orders_data.append(get_order_data(order))
             return Response(
-                status=status.HTTP_200_OK, data={"success": True, "orders": orders_data}
+                status=status.HTTP_200_OK,
+                data={"success": True, "orders": orders_data, **page},
+            )
+        except InvalidPage as e:
+            return Response(
+                data={"success": False, "message": str(e)},
+                status=status.HTTP_400_BAD_REQUEST,
             )
         except Exception as e:
             print(e)
@@ -247,19 +278,27 @@ class CollectOrder(views.APIView):
     
     def get(self, request, *args, **kwargs):
         try:
-            order = Order.objects.get(pk=kwargs["pk"])
-            station = order.station
-            battery = order.battery
-            
-            order.is_collected = True
-            order.save()
-            
-            # Move battery from booked to available (or remove from station)
-            station.booked_batteries.remove(battery)
-            station.save()
-            
-            # Broadcast battery collected event via WebSocket
-            broadcast_battery_collected(station, battery)
+            with transaction.atomic():
+                # Lock the order so the expiry sweeper can't release its
+                # battery while it is being collected
+                order = Order.objects.select_for_update().get(pk=kwargs["pk"])
+                if order.is_expired:
+                    return Response(
+                        data={"success": False, "message": "This booking has expired."},
+                        status=status.HTTP_409_CONFLICT,
+                    )
+                station = order.station
+                battery = order.battery
+                
+                order.is_collected = True
+                order.save()
+                
+                # Move battery from booked to available (or remove from station)
+                station.booked_batteries.remove(battery)
+                station.save()
+                
+                # Broadcast battery collected event via WebSocket
+                broadcast_battery_collected(station, battery)
             
             return Response(data={"success": True}, status=status.HTTP_200_OK)
         except Exception as e:
@@ -275,22 +314,18 @@ class GetOrder(views.APIView):
     
     def get(self, request, *args, **kwargs):
         try:
-            order_data = {}
-            found = False
-            for order in request.user.orders.all():
-                if order.pk == kwargs["pk"]:
-                    found = True
-                    order_data = get_order_data(order)
-            if found:
-                return Response(
-                    status=status.HTTP_200_OK,
-                    data={"success": True, "order": order_data},
-                )
-            else:
-                return Response(
-                    status=status.HTTP_203_NON_AUTHORITATIVE_INFORMATION,
-                    data={"success": False},
-                )
+            order = Order.objects.select_related(
+                'station', 'battery__vehicle', 'battery__company'
+            ).get(pk=kwargs["pk"], user=request.user)
+            return Response(
+                status=status.HTTP_200_OK,
+                data={"success": True, "order": get_order_data(order)},
+            )
+        except Order.DoesNotExist:
+            return Response(
+                status=status.HTTP_203_NON_AUTHORITATIVE_INFORMATION,
+                data={"success": False},
+            )
         except Exception as e:
             print(e)
             return Response(
@@ -320,34 +355,9 @@ class AdminDashboardStats(APIView):
             )
         
         try:
-            from battery.models import Station, Battery
-            from producer.models import Producer
-            
-            total_users = CustomUser.objects.count()
-            total_producers = Producer.objects.count()
-            total_consumers = CustomUser.objects.filter(user_type='consumer').count()
-            total_stations = Station.objects.count()
-            total_batteries = Battery.objects.count()
-            total_orders = Order.objects.count()
-            paid_orders = Order.objects.filter(is_paid=True).count()
-            total_revenue = sum(
-                o.battery.price 
-                for o in Order.objects.filter(is_paid=True).select_related('battery')
-                if o.battery
-            )
-            
             return Response({
                 'success': True,
-                'stats': {
-                    'total_users': total_users,
-                    'total_producers': total_producers,
-                    'total_consumers': total_consumers,
-                    'total_stations': total_stations,
-                    'total_batteries': total_batteries,
-                    'total_orders': total_orders,
-                    'paid_orders': paid_orders,
-                    'total_revenue': total_revenue,
-                }
+                'stats': get_dashboard_stats(),
             })
         except Exception as e:
             import traceback
@@ -369,7 +379,9 @@ class AdminListUsers(APIView):
             )
         
         try:
-            users = CustomUser.objects.all().order_by('-date_joined')
+            users, page = paginate_queryset(
+                request, CustomUser.objects.all(), ('-date_joined', '-pk'), default_page_size=50
+            )
             data = []
             for u in users:
                 data.append({
@@ -384,8 +396,13 @@ class AdminListUsers(APIView):
             return Response({
                 'success': True,
                 'users': data,
-                'total': len(data)
+                **page
             })
+        except InvalidPage as e:
+            return Response(
+                {'success': False, 'message': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             return Response(
                 {'success': False, 'message': str(e)},
@@ -431,28 +448,22 @@ class AdminListProducers(APIView):
             )
         
         try:
-            from producer.models import Producer
-            from battery.models import Station
-            
-            producers = Producer.objects.select_related('user', 'company').all()
+            producers, page = paginate_queryset(
+                request,
+                get_producer_stats(),
+                get_ordering(request, PRODUCER_ORDERINGS, 'pk'),
+                default_page_size=50,
+            )
             data = []
             for p in producers:
-                stations = Station.objects.filter(owner=p)
-                orders = Order.objects.filter(station__in=stations)
-                revenue = sum(
-                    o.battery.price 
-                    for o in orders.select_related('battery')
-                    if o.battery and o.is_paid
-                )
-                
                 data.append({
                     'pk': p.pk,
                     'name': p.user.name,
                     'email': p.user.email,
                     'company': p.company.name if p.company else '—',
-                    'total_stations': stations.count(),
-                    'total_bookings': orders.count(),
-                    'total_revenue': revenue,
+                    'total_stations': p.total_stations,
+                    'total_bookings': p.total_bookings,
+                    'total_revenue': p.total_revenue,
                     'is_active': p.user.is_active,
                     'date_joined': p.user.date_joined,
                 })
@@ -460,8 +471,13 @@ class AdminListProducers(APIView):
             return Response({
                 'success': True,
                 'producers': data,
-                'total': len(data)
+                **page
             })
+        except InvalidPage as e:
+            return Response(
+                {'success': False, 'message': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             import traceback
             print(traceback.format_exc())
@@ -486,7 +502,7 @@ class AdminListStations(APIView):
             
             stations = Station.objects.select_related(
                 'owner__user', 'owner__company'
-            ).prefetch_related('batteries').all()
+            ).all()
             
             data = []
             for s in stations:
@@ -495,7 +511,7 @@ class AdminListStations(APIView):
                     'name': s.name,
                     'latitude': s.latitude,
                     'longitude': s.longitude,
-                    'total_batteries': s.batteries.count(),
+                    'total_batteries': s.available_battery_count,
                     'owner_name': s.owner.user.name if s.owner else '—',
                     'owner_company': s.owner.company.name if s.owner and s.owner.company else '—',
                 })
@@ -526,6 +542,7 @@ class AdminListBookings(APIView):
         
         try:
             orders = Order.objects.select_related(
+                'user',
                 'battery__vehicle',
                 'battery__company',
                 'station',
@@ -536,6 +553,7 @@ class AdminListBookings(APIView):
             for o in orders:
                 data.append({
                     'pk': o.pk,
+                    'user_email': o.user.email if o.user else '—',
                     'station_name': o.station.name if o.station else '—',
                     'producer_name': o.station.owner.user.name if o.station and o.station.owner else '—',
                     'vehicle': o.battery.vehicle.name if o.battery and o.battery.vehicle else '—',
@@ -574,9 +592,12 @@ class AdminListSubscriptions(APIView):
         try:
             from subscription.models import SubscriptionPlan, UserSubscription
             
-            subs = UserSubscription.objects.select_related(
-                'user', 'plan'
-            ).order_by('-created_at')
+            subs, page = paginate_queryset(
+                request,
+                UserSubscription.objects.select_related('user', 'plan'),
+                ('-created_at', '-pk'),
+                default_page_size=50,
+            )
             
             data = []
             for s in subs:
@@ -594,8 +615,13 @@ class AdminListSubscriptions(APIView):
             return Response({
                 'success': True,
                 'subscriptions': data,
-                'total': len(data)
+                **page
             })
+        except InvalidPage as e:
+            return Response(
+                {'success': False, 'message': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             import traceback
             print(traceback.format_exc())
@@ -605,10 +631,121 @@ class AdminListSubscriptions(APIView):
             )
 
 
+class AdminExportView(APIView):
+    """
+    Base for admin exports streamed as CSV or NDJSON
+    Query params: format (csv or ndjson), from and to (YYYY-MM-DD, inclusive)
+    
+    Subclasses set filename and columns and define
+    queryset_for(request, since, until).
+    """
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = ExportContentNegotiation
+    filename = 'export'
+    columns = []
+    
+    def get(self, request):
+        if not is_admin(request.user):
+            return Response(
+                {'success': False, 'message': 'Admin access required'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        
+        try:
+            fmt, since, until = get_export_params(request)
+            queryset = self.queryset_for(request, since, until)
+        except (InvalidExport, ValueError) as e:
+            return Response(
+                {'success': False, 'message': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return export_response(request, queryset, self.columns, fmt, self.filename)
+
+
+class AdminExportBookings(AdminExportView):
+    """All bookings booked in the date range, oldest first"""
+    filename = 'bookings'
+    columns = [
+        ('pk', 'pk'),
+        ('user_email', 'user__email'),
+        ('station_name', 'station__name'),
+        ('producer_name', 'station__owner__user__name'),
+        ('vehicle', 'battery__vehicle__name'),
+        ('price', 'battery__price'),
+        ('is_paid', 'is_paid'),
+        ('is_collected', 'is_collected'),
+        ('is_expired', 'is_expired'),
+        ('booked_time', 'booked_time'),
+        ('expiry_time', 'expiry_time'),
+    ]
+    
+    def queryset_for(self, request, since, until):
+        return Order.objects.filter(
+            **get_datetime_range('booked_time', since, until)
+        ).order_by('booked_time', 'pk')
+
+
+class AdminExportSubscriptions(AdminExportView):
+    """All subscriptions created in the date range, oldest first"""
+    filename = 'subscriptions'
+    columns = [
+        ('pk', 'pk'),
+        ('user_name', 'user__name'),
+        ('user_email', 'user__email'),
+        ('plan_name', 'plan__name'),
+        ('plan_price', 'plan__price'),
+        ('is_active', 'is_active'),
+        ('swaps_used', 'swaps_used'),
+        ('created_at', 'created_at'),
+        ('expires_at', 'end_date'),
+    ]
+    
+    def queryset_for(self, request, since, until):
+        return UserSubscription.objects.filter(
+            **get_datetime_range('created_at', since, until)
+        ).order_by('created_at', 'pk')
+
+
+class AdminExportRevenue(AdminExportView):
+    """
+    Daily revenue per station from the rollup, oldest first
+    Extra query param: producer (producer pk)
+    """
+    filename = 'revenue'
+    columns = [
+        ('date', 'day'),
+        ('station_pk', 'station_id'),
+        ('station_name', 'station__name'),
+        ('producer_pk', 'producer_id'),
+        ('producer_name', 'producer__user__name'),
+        ('revenue', 'revenue'),
+        ('bookings', 'bookings'),
+    ]
+    
+    def queryset_for(self, request, since, until):
+        rows = DailyRevenue.objects.all()
+        if since:
+            rows = rows.filter(day__gte=since)
+        if until:
+            rows = rows.filter(day__lte=until)
+        producer = request.query_params.get('producer')
+        if producer:
+            rows = rows.filter(producer_id=int(producer))
+        return rows.order_by('day', 'station_id')
+
+
 class AdminListBookingsPaginated(APIView):
-    """Paginated bookings for admin"""
+    """
+    Paginated bookings for admin.
+    Pages with ?cursor= (keyset, newest first); ?page= is still accepted
+    for old clients, up to MAX_PAGE_OFFSET rows deep.
+    """
     permission_classes = [IsAuthenticated]
     
+    # Deepest row a numbered page may start at; the OFFSET scan reads
+    # every row before it
+    MAX_PAGE_OFFSET = 10000
+    
     def get(self, request):
         if not is_admin(request.user):
             return Response(
@@ -617,22 +754,24 @@ class AdminListBookingsPaginated(APIView):
             )
         
         try:
-            page = int(request.query_params.get('page', 1))
-            page_size = int(request.query_params.get('page_size', 20))
-            offset = (page - 1) * page_size
-            
-            total = Order.objects.count()
-            orders = Order.objects.select_related(
+            bookings = Order.objects.select_related(
+                'user',
                 'battery__vehicle',
                 'battery__company',
                 'station',
                 'station__owner__user',
-            ).order_by('-booked_time')[offset:offset + page_size]
+            )
+            
+            if 'page' in request.query_params:
+                orders, page = self.get_numbered_page(request, bookings)
+            else:
+                orders, page = paginate_queryset(request, bookings, ('-booked_time', '-pk'))
             
             data = []
             for o in orders:
                 data.append({
                     'pk': o.pk,
+                    'user_email': o.user.email if o.user else '—',
                     'station_name': o.station.name if o.station else '—',
                     'producer_name': o.station.owner.user.name if o.station and o.station.owner else '—',
                     'vehicle': o.battery.vehicle.name if o.battery and o.battery.vehicle else '—',
@@ -645,13 +784,13 @@ class AdminListBookingsPaginated(APIView):
             return Response({
                 'success': True,
                 'bookings': data,
-                'total': total,
-                'page': page,
-                'page_size': page_size,
-                'total_pages': (total + page_size - 1) // page_size,
-                'has_next': (offset + page_size) < total,
-                'has_prev': page > 1,
+                **page
             })
+        except InvalidPage as e:
+            return Response(
+                {'success': False, 'message': str(e)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         except Exception as e:
             import traceback
             print(traceback.format_exc())
@@ -660,9 +799,39 @@ class AdminListBookingsPaginated(APIView):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
 
+    def get_numbered_page(self, request, bookings):
+        """Legacy OFFSET page; the total is estimated like cursor pages"""
+        try:
+            page = int(request.query_params.get('page', 1))
+        except ValueError:
+            raise InvalidPage('page must be an integer')
+        if page < 1:
+            raise InvalidPage('page must be positive')
+        page_size = get_page_size(request)
+        offset = (page - 1) * page_size
+        if offset > self.MAX_PAGE_OFFSET:
+            raise InvalidPage('page is too deep; use cursor pagination')
+        
+        total, is_estimate = count_queryset(bookings, get_count_mode(request))
+        orders = list(bookings.order_by('-booked_time', '-pk')[offset:offset + page_size + 1])
+        
+        return orders[:page_size], {
+            'total': total,
+            'total_is_estimate': is_estimate,
+            'page': page,
+            'page_size': page_size,
+            'total_pages': (total + page_size - 1) // page_size if total is not None else None,
+            'has_next': len(orders) > page_size,
+            'has_prev': page > 1,
+        }
+
 
 class AdminRevenueChart(APIView):
-    """Daily revenue for last 30 days"""
+    """
+    Revenue chart from the daily rollup
+    Query params: days (default 30), granularity (day, week or month),
+    producer (producer pk)
+    """
     permission_classes = [IsAuthenticated]
     
     def get(self, request):
@@ -673,37 +842,29 @@ class AdminRevenueChart(APIView):
             )
         
         try:
-            from datetime import datetime, timedelta
-            from django.utils import timezone
-            
-            # Last 30 days
-            end = timezone.now()
-            start = end - timedelta(days=29)
-            
-            # Build daily buckets
-            daily = {}
-            for i in range(30):
-                day = (start + timedelta(days=i)).strftime('%Y-%m-%d')
-                daily[day] = {
-                    'date': day,
-                    'revenue': 0,
-                    'bookings': 0,
-                }
-            
-            # Fill with real data
-            paid_orders = Order.objects.filter(
-                is_paid=True,
-                booked_time__gte=start,
-                booked_time__lte=end,
-            ).select_related('battery')
-            
-            for o in paid_orders:
-                day = o.booked_time.strftime('%Y-%m-%d')
-                if day in daily:
-                    daily[day]['revenue'] += (o.battery.price if o.battery else 0)
-                    daily[day]['bookings'] += 1
-            
-            chart_data = list(daily.values())
+            days = int(request.query_params.get('days', 30))
+            producer = request.query_params.get('producer')
+            producer_id = int(producer) if producer else None
+        except ValueError:
+            return Response(
+                {'success': False, 'message': 'days and producer must be integers'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        granularity = request.query_params.get('granularity', 'day')
+        if not 1 <= days <= MAX_CHART_DAYS or granularity not in GRANULARITIES:
+            return Response(
+                {
+                    'success': False,
+                    'message': f'days must be 1-{MAX_CHART_DAYS} and granularity one of: '
+                               f'{", ".join(GRANULARITIES)}'
+                },
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        
+        try:
+            end = timezone.localdate()
+            start = end - datetime.timedelta(days=days - 1)
+            chart_data = get_revenue_chart(start, end, granularity, producer_id)
             
             # Summary stats
             total_revenue = sum(d['revenue'] for d in chart_data)
@@ -713,11 +874,13 @@ class AdminRevenueChart(APIView):
             return Response({
                 'success': True,
                 'chart': chart_data,
+                'granularity': granularity,
+                'days': days,
                 'summary': {
                     'total_revenue': total_revenue,
                     'total_bookings': total_bookings,
                     'peak_day': peak_day,
-                    'avg_daily_revenue': round(total_revenue / 30, 2),
+                    'avg_daily_revenue': round(total_revenue / days, 2),
                 }
             })
         except Exception as e:
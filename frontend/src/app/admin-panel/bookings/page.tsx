@@ -13,16 +13,23 @@ import {
   RightOutlined,
 } from '@ant-design/icons';
 
+const PAGE_SIZE = 20;
+
 export default function AdminBookingsPage() {
-  const [page, setPage] = useState(1);
+  // Cursor of each page visited so far; the last one is the current page
+  const [cursors, setCursors] = useState<(string | null)[]>([null]);
   const [search, setSearch] = useState('');
   const [filter, setFilter] = useState('All');
 
-  const { data, isLoading, isFetching } = useAdminBookingsPaginated(page, 20);
+  const page = cursors.length;
+  const { data, isLoading, isFetching } = useAdminBookingsPaginated(
+    cursors[cursors.length - 1],
+    PAGE_SIZE
+  );
 
   const bookings = data?.bookings || [];
-  const totalPages = data?.total_pages || 1;
   const total = data?.total || 0;
+  const totalPages = Math.max(1, Math.ceil(total / PAGE_SIZE));
 
   const filtered = bookings.filter((b: any) => {
     const matchSearch =
@@ -80,7 +87,7 @@ export default function AdminBookingsPage() {
                 value={search}
                 onChange={e => {
                   setSearch(e.target.value);
-                  setPage(1);
+                  setCursors([null]);
                 }}
                 className="w-full pl-9 pr-4 py-3 rounded-xl border border-gray-200 bg-white text-sm placeholder:text-gray-400 focus:outline-none focus:border-gray-400"
               />
@@ -93,7 +100,7 @@ export default function AdminBookingsPage() {
                     key={f}
                     onClick={() => {
                       setFilter(f);
-                      setPage(1);
+                      setCursors([null]);
                     }}
                     className={`px-3 py-1.5 rounded-xl text-xs font-medium transition-all ${
                       filter === f
@@ -204,7 +211,7 @@ export default function AdminBookingsPage() {
 
                 <div className="flex items-center gap-2">
                   <button
-                    onClick={() => setPage(p => Math.max(1, p - 1))}
+                    onClick={() => setCursors(c => c.slice(0, -1))}
                     disabled={page === 1 || isFetching}
                     className="flex items-center gap-1.5 px-3 py-2 rounded-xl text-xs font-medium border border-gray-200 text-gray-600 hover:bg-gray-50 disabled:opacity-40 disabled:cursor-not-allowed transition-all"
                   >
@@ -212,40 +219,12 @@ export default function AdminBookingsPage() {
                     Prev
                   </button>
 
-                  {/* Page numbers */}
-                  <div className="flex items-center gap-1">
-                    {Array.from({ length: Math.min(5, totalPages) }, (_, i) => {
-                      let pageNum: number;
-                      if (totalPages <= 5) {
-                        pageNum = i + 1;
-                      } else if (page <= 3) {
-                        pageNum = i + 1;
-                      } else if (page >= totalPages - 2) {
-                        pageNum = totalPages - 4 + i;
-                      } else {
-                        pageNum = page - 2 + i;
-                      }
-
-                      return (
-                        <button
-                          key={pageNum}
-                          onClick={() => setPage(pageNum)}
-                          disabled={isFetching}
-                          className={`w-8 h-8 rounded-lg text-xs font-medium transition-all disabled:cursor-not-allowed ${
-                            page === pageNum
-                              ? 'bg-gray-900 text-white'
-                              : 'text-gray-500 hover:bg-gray-100'
-                          }`}
-                        >
-                          {pageNum}
-                        </button>
-                      );
-                    })}
-                  </div>
-
                   <button
-                    onClick={() => setPage(p => Math.min(totalPages, p + 1))}
-                    disabled={page === totalPages || isFetching}
+                    onClick={() => {
+                      const next = data?.next_cursor;
+                      if (next) setCursors(c => [...c, next]);
+                    }}
+                    disabled={!data?.has_next || isFetching}
                     className="flex items-center gap-1.5 px-3 py-2 rounded-xl text-xs font-medium border border-gray-200 text-gray-600 hover:bg-gray-50 disabled:opacity-40 disabled:cursor-not-allowed transition-all"
                   >
                     Next
@@ -97,13 +97,13 @@ export const useAdminSubscriptions = () =>
   });
 
 export const useAdminBookingsPaginated = (
-  page: number,
+  cursor: string | null,
   pageSize: number = 20
 ) =>
   useQuery({
-    queryKey: ['admin', 'bookings', 'paginated', page, pageSize],
+    queryKey: ['admin', 'bookings', 'paginated', cursor, pageSize],
     queryFn: async () => {
-      const res = await AdminService.getBookingsPaginated(page, pageSize);
+      const res = await AdminService.getBookingsPaginated(cursor, pageSize);
       if (res.data?.success) {
         return res.data;
       }
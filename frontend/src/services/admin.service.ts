@@ -1,4 +1,5 @@
 import { base } from './api/base';
+import { getAllPages, CursorPage } from './api/pagination';
 
 export const AdminService = {
   getStats: () =>
@@ -17,18 +18,19 @@ export const AdminService = {
     }>('user/admin/stats/', { method: 'GET' }),
 
   getUsers: () =>
-    base<{
-      success: boolean;
-      users: Array<{
-        pk: number;
-        name: string;
-        email: string;
-        user_type: string;
-        date_joined: string;
-        is_active: boolean;
-      }>;
-      total: number;
-    }>('user/admin/users/', { method: 'GET' }),
+    getAllPages<
+      {
+        success: boolean;
+        users: Array<{
+          pk: number;
+          name: string;
+          email: string;
+          user_type: string;
+          date_joined: string;
+          is_active: boolean;
+        }>;
+      } & CursorPage
+    >('user/admin/users/', 'users'),
 
   toggleUser: (pk: number) =>
     base<{
@@ -40,21 +42,22 @@ export const AdminService = {
     }),
 
   getProducers: () =>
-    base<{
-      success: boolean;
-      producers: Array<{
-        pk: number;
-        name: string;
-        email: string;
-        company: string;
-        total_stations: number;
-        total_bookings: number;
-        total_revenue: number;
-        is_active: boolean;
-        date_joined: string;
-      }>;
-      total: number;
-    }>('user/admin/producers/', { method: 'GET' }),
+    getAllPages<
+      {
+        success: boolean;
+        producers: Array<{
+          pk: number;
+          name: string;
+          email: string;
+          company: string;
+          total_stations: number;
+          total_bookings: number;
+          total_revenue: number;
+          is_active: boolean;
+          date_joined: string;
+        }>;
+      } & CursorPage
+    >('user/admin/producers/', 'producers'),
 
   getStations: () =>
     base<{
@@ -88,22 +91,23 @@ export const AdminService = {
     }>('user/admin/bookings/', { method: 'GET' }),
 
   getSubscriptions: () =>
-    base<{
-      success: boolean;
-      subscriptions: Array<{
-        pk: number;
-        user_name: string;
-        user_email: string;
-        plan_name: string;
-        plan_price: number;
-        is_active: boolean;
-        created_at: string;
-        expires_at: string | null;
-      }>;
-      total: number;
-    }>('user/admin/subscriptions/', { method: 'GET' }),
+    getAllPages<
+      {
+        success: boolean;
+        subscriptions: Array<{
+          pk: number;
+          user_name: string;
+          user_email: string;
+          plan_name: string;
+          plan_price: number;
+          is_active: boolean;
+          created_at: string;
+          expires_at: string | null;
+        }>;
+      } & CursorPage
+    >('user/admin/subscriptions/', 'subscriptions'),
 
-  getBookingsPaginated: (page: number = 1, pageSize: number = 20) =>
+  getBookingsPaginated: (cursor: string | null = null, pageSize: number = 20) =>
     base<{
       success: boolean;
       bookings: Array<{
@@ -116,15 +120,16 @@ export const AdminService = {
         is_collected: boolean;
         booked_time: string;
       }>;
-      total: number;
-      page: number;
+      total: number | null;
+      total_is_estimate: boolean;
       page_size: number;
-      total_pages: number;
+      next_cursor: string | null;
       has_next: boolean;
-      has_prev: boolean;
-    }>(`user/admin/bookings/paginated/?page=${page}&page_size=${pageSize}`, {
-      method: 'GET',
-    }),
+    }>(
+      `user/admin/bookings/paginated/?page_size=${pageSize}` +
+        (cursor ? `&cursor=${encodeURIComponent(cursor)}` : ''),
+      { method: 'GET' }
+    ),
 
   getRevenueChart: () =>
     base<{
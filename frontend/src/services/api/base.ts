@@ -6,7 +6,7 @@ interface RequestOptions {
   data?: any;
 }
 
-interface ApiResponse<T = any> {
+export interface ApiResponse<T = any> {
   data: T;
   status: number;
 }
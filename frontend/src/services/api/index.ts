@@ -4,3 +4,4 @@
 export { Cache } from "./cache";
 export { getFreshHeaders } from "./utils";
 export { get, post, patch, put, del } from "./base";
+export { getAllPages } from "./pagination";
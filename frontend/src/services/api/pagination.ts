@@ -0,0 +1,53 @@
+import { base, ApiResponse } from "./base";
+
+/**
+ * Largest page the backend serves (batteryswap/pagination.py MAX_PAGE_SIZE)
+ */
+const MAX_PAGE_SIZE = 100;
+
+/**
+ * Metadata of a cursor-paginated list response (batteryswap/pagination.py)
+ */
+export interface CursorPage {
+  success: boolean;
+  next_cursor?: string | null;
+  has_next?: boolean;
+  total?: number | null;
+}
+
+/**
+ * Fetch every page of a cursor-paginated list endpoint
+ * Follows next_cursor until has_next is false and returns the first page's
+ * response with the list under `key` holding the rows of all pages.
+ * `total` comes from the first page.
+ *
+ * An unsuccessful page is returned as-is, so callers handle errors the
+ * same way as for a single request.
+ */
+export const getAllPages = async <T extends CursorPage>(
+  url: string,
+  key: keyof T & string,
+  params: Record<string, string> = {}
+): Promise<ApiResponse<T>> => {
+  let first: ApiResponse<T> | null = null;
+  const items: unknown[] = [];
+  let cursor: string | null = null;
+
+  do {
+    const query = new URLSearchParams({ ...params, page_size: String(MAX_PAGE_SIZE) });
+    if (cursor) query.set("cursor", cursor);
+
+    const res: ApiResponse<T> = await base<T>(`${url}?${query}`, { method: "GET" });
+    if (!res.data?.success) return res;
+
+    first = first ?? res;
+    items.push(...((res.data[key] as unknown[]) || []));
+    cursor = res.data.has_next ? res.data.next_cursor ?? null : null;
+  } while (cursor);
+
+  const page = first as ApiResponse<T>;
+  return {
+    ...page,
+    data: { ...page.data, [key]: items, has_next: false, next_cursor: null },
+  };
+};
@@ -1,4 +1,5 @@
 import { base } from './api/base';
+import { getAllPages, CursorPage } from './api/pagination';
 
 export const ProducerService = {
   // Get producer's own stations
@@ -18,19 +19,20 @@ export const ProducerService = {
 
   // Get bookings at producer's stations
   getMyBookings: () =>
-    base<{
-      success: boolean;
-      bookings: Array<{
-        pk: number;
-        station_name: string;
-        battery_price: number;
-        vehicle: string;
-        is_paid: boolean;
-        is_collected: boolean;
-        booked_time: string;
-      }>;
-      total: number;
-    }>('power/stations/mine/bookings/', { method: 'GET' }),
+    getAllPages<
+      {
+        success: boolean;
+        bookings: Array<{
+          pk: number;
+          station_name: string;
+          battery_price: number;
+          vehicle: string;
+          is_paid: boolean;
+          is_collected: boolean;
+          booked_time: string;
+        }>;
+      } & CursorPage
+    >('power/stations/mine/bookings/', 'bookings'),
 
   // Get producer analytics
   getStats: () =>
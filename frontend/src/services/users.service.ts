@@ -1,4 +1,4 @@
-import { get, post, put } from "./api";
+import { get, getAllPages, post, put } from "./api";
 
 /**
  * User Service
@@ -51,7 +51,7 @@ export const bookBattery = (data: BookBatteryData) =>
  * List all orders for the current user
  */
 export const listOrders = () => 
-  get(`user/orders/`);
+  getAllPages<any>(`user/orders/`, "orders");
 
 /**
  * Get order details by ID